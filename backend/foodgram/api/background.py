@@ -0,0 +1,27 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+IMAGES = 'images'
+EXPORTS = 'exports'
+FEED = 'feed'
+SIMILAR = 'similar'
+
+_writers = {}
+_lock = threading.Lock()
+
+
+def get_writer(queue):
+    """Поток фоновой записи в базу для задач очереди queue.
+
+    У каждой очереди свой поток: раскладка по лентам не ждёт картинок
+    и выгрузок, а они - её. Внутри очереди задачи идут по одной.
+    """
+    writer = _writers.get(queue)
+    if writer is None:
+        with _lock:
+            writer = _writers.get(queue)
+            if writer is None:
+                writer = _writers[queue] = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix=f'writer-{queue}'
+                )
+    return writer
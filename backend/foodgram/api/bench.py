@@ -0,0 +1,248 @@
+import random
+import statistics
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import (CaptureQueriesContext,
+                               setup_test_environment,
+                               teardown_test_environment)
+
+from api.counters import reconcile
+from recipes.models import (Favorite,
+                            Ingredient,
+                            IngredientRecipe,
+                            Recipe,
+                            ShoppingCart,
+                            Tag)
+from users.models import Subscribe, User
+
+BENCH_IMAGE = 'recipes/bench.png'
+BENCH_IMAGE_BASE64 = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAA'
+    'DUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg=='
+)
+BATCH_SIZE = 1000
+
+
+@contextmanager
+def test_database(keepdb=False):
+    """Временная тестовая база, чтобы не трогать рабочие данные."""
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(
+        verbosity=0,
+        autoclobber=True,
+        keepdb=keepdb
+    )
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(
+            old_name,
+            verbosity=0,
+            keepdb=keepdb
+        )
+        teardown_test_environment()
+
+
+def seed_dataset(users=50, recipes=500, ingredients=2000, tags=6,
+                 ingredients_per_recipe=(3, 12), favorites=40,
+                 cart=20, following=10, seed=0):
+    """Наполнение базы реалистичным набором данных для бенчмарков.
+
+    Возвращает пользователя, от имени которого выполняются запросы:
+    у него есть избранное, корзина и подписки.
+    """
+    rnd = random.Random(seed)
+    User.objects.bulk_create(
+        [User(
+            email=f'bench{index}@foodgram.bench',
+            username=f'bench{index}',
+            first_name='Bench',
+            last_name=str(index),
+            password='!'
+        ) for index in range(users)],
+        batch_size=BATCH_SIZE
+    )
+    user_ids = list(
+        User.objects.filter(
+            email__endswith='@foodgram.bench'
+        ).values_list('id', flat=True)
+    )
+    Tag.objects.bulk_create(
+        [Tag(
+            name=f'Тег {index}',
+            color=f'#{index:06x}',
+            slug=f'bench-{index}'
+        ) for index in range(tags)],
+        batch_size=BATCH_SIZE
+    )
+    tag_ids = list(
+        Tag.objects.filter(
+            slug__startswith='bench-'
+        ).values_list('id', flat=True)
+    )
+    Ingredient.objects.bulk_create(
+        [Ingredient(
+            name=f'ингредиент {index}',
+            measurement_unit=rnd.choice(('г', 'мл', 'шт.'))
+        ) for index in range(ingredients)],
+        batch_size=BATCH_SIZE
+    )
+    ingredient_ids = list(
+        Ingredient.objects.filter(
+            name__startswith='ингредиент '
+        ).values_list('id', flat=True)
+    )
+    authors = user_ids[1:] or user_ids
+    Recipe.objects.bulk_create(
+        [Recipe(
+            author_id=rnd.choice(authors),
+            name=f'Рецепт {index}',
+            image=BENCH_IMAGE,
+            text='Смешать все ингредиенты и запекать до готовности.',
+            cooking_time=rnd.randint(5, 180)
+        ) for index in range(recipes)],
+        batch_size=BATCH_SIZE
+    )
+    recipe_ids = list(
+        Recipe.objects.filter(
+            image=BENCH_IMAGE
+        ).values_list('id', flat=True)
+    )
+    TagRecipe = Recipe.tags.through
+    TagRecipe.objects.bulk_create(
+        [TagRecipe(recipe_id=recipe_id, tag_id=tag_id)
+         for recipe_id in recipe_ids
+         for tag_id in rnd.sample(tag_ids, rnd.randint(1, min(3, tags)))],
+        batch_size=BATCH_SIZE
+    )
+    IngredientRecipe.objects.bulk_create(
+        [IngredientRecipe(
+            recipe_id=recipe_id,
+            ingredient_id=ingredient_id,
+            amount=rnd.randint(1, 500)
+        ) for recipe_id in recipe_ids
+            for ingredient_id in rnd.sample(
+                ingredient_ids, rnd.randint(*ingredients_per_recipe)
+        )],
+        batch_size=BATCH_SIZE
+    )
+    viewer_id = user_ids[0]
+    Favorite.objects.bulk_create(
+        [Favorite(user_id=viewer_id, recipe_id=recipe_id)
+         for recipe_id in rnd.sample(recipe_ids, min(favorites, recipes))],
+        batch_size=BATCH_SIZE
+    )
+    ShoppingCart.objects.bulk_create(
+        [ShoppingCart(user_id=viewer_id, recipe_id=recipe_id)
+         for recipe_id in rnd.sample(recipe_ids, min(cart, recipes))],
+        batch_size=BATCH_SIZE
+    )
+    Subscribe.objects.bulk_create(
+        [Subscribe(user_id=viewer_id, author_id=author_id)
+         for author_id in rnd.sample(authors, min(following, len(authors)))],
+        batch_size=BATCH_SIZE
+    )
+    # bulk_create не отправляет сигналы, счётчики считаются заново.
+    reconcile()
+    return User.objects.get(pk=viewer_id)
+
+
+def grow_recipes(author, ingredients, rnd, start, size):
+    """Рецепты с номерами от start до size с 3-12 ингредиентами.
+
+    Частота ингредиента убывает как 1 / номер в списке ingredients,
+    как у продуктов в настоящих рецептах.
+    """
+    weights = [1 / (number + 1) for number in range(len(ingredients))]
+    for offset in range(start, size, BATCH_SIZE):
+        count = min(BATCH_SIZE, size - offset)
+        Recipe.objects.bulk_create([
+            Recipe(
+                author=author,
+                name=f'Рецепт {index}',
+                image=BENCH_IMAGE,
+                text='Описание',
+                cooking_time=rnd.randint(5, 180)
+            ) for index in range(offset, offset + count)
+        ])
+        recipe_ids = Recipe.objects.filter(
+            author=author
+        ).order_by('-id').values_list('id', flat=True)[:count]
+        IngredientRecipe.objects.bulk_create(
+            [IngredientRecipe(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+                amount=rnd.randint(1, 500)
+            ) for recipe_id in recipe_ids
+                for ingredient_id in set(rnd.choices(
+                    ingredients, weights=weights, k=rnd.randint(3, 12)
+                ))],
+            batch_size=BATCH_SIZE
+        )
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE recipes_ingredientrecipe')
+
+
+def percentile(values, percent):
+    """Перцентиль по методу ближайшего ранга."""
+    ordered = sorted(values)
+    index = max(0, -(-len(ordered) * percent // 100) - 1)
+    return ordered[int(index)]
+
+
+def measure(func, repeat=10, warmup=1, teardown=None, setup=None):
+    """Число SQL-запросов, задержка и пиковая память вызова func.
+
+    Запросы считаются по первому замеренному вызову, задержка - по
+    repeat вызовам, память - отдельным вызовом под tracemalloc, чтобы
+    трассировка не искажала время. teardown вызывается после каждого
+    вызова func вне замера и возвращает данные в исходное состояние.
+    Если задан setup, его результат передаётся в func, а сам он
+    выполняется вне замера.
+    """
+    def prepare():
+        return () if setup is None else (setup(),)
+
+    def finish():
+        if teardown is not None:
+            teardown()
+
+    for _ in range(warmup):
+        func(*prepare())
+        finish()
+    args = prepare()
+    with CaptureQueriesContext(connection) as context:
+        result = func(*args)
+    queries = len(context.captured_queries)
+    finish()
+    timings = []
+    for _ in range(repeat):
+        args = prepare()
+        start = time.perf_counter()
+        func(*args)
+        timings.append((time.perf_counter() - start) * 1000)
+        finish()
+    args = prepare()
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    finish()
+    return {
+        'result': result,
+        'queries': queries,
+        'p50_ms': statistics.median(timings),
+        'p95_ms': percentile(timings, 95),
+        'peak_kb': peak / 1024,
+    }
+
+
+def format_row(columns, widths):
+    return '  '.join(
+        str(column).ljust(width) for column, width in zip(columns, widths)
+    )
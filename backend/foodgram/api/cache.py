@@ -0,0 +1,349 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from functools import wraps
+from hashlib import sha1
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.response import Response
+
+from recipes.models import ShoppingCart
+
+GENERATION_KEY = 'recipes:generation'
+HITS_KEY = 'recipes:hits'
+MISSES_KEY = 'recipes:misses'
+CATALOG_VERSION_KEY = 'recipes:catalog'
+RECIPE_VERSION_KEY = 'recipe:{}:version'
+AUTHOR_VERSION_KEY = 'author:{}:version'
+VIEWER_VERSION_KEY = 'viewer:{}:version'
+TAGS_VERSION_KEY = 'tags:version'
+INGREDIENTS_VERSION_KEY = 'ingredients:version'
+CART_VERSION_KEY = 'cart:{}:version'
+RANKING_VERSION_KEY = 'recipes:ranking'
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+_documents = None
+
+
+def get_cache():
+    return caches[settings.RECIPES_CACHE_ALIAS]
+
+
+def shared_cache_error():
+    """Описание ошибки, если версии не видны другим процессам, иначе None.
+
+    Версии в памяти процесса не доходят до остальных воркеров и
+    команд (refresh_scores, load_ingredient), и ETag отдаёт устаревшие
+    304. Такой кэш допустим только с DEBUG и одним процессом.
+    """
+    backend = settings.CACHES[settings.RECIPES_CACHE_ALIAS]['BACKEND']
+    if backend not in PROCESS_LOCAL_BACKENDS:
+        return None
+    if settings.DEBUG and settings.WEB_CONCURRENCY == 1:
+        return None
+    return (
+        f'Cache alias {settings.RECIPES_CACHE_ALIAS!r} uses {backend}, '
+        f'which is local to one process, but cache versions must be '
+        f'shared by all workers and management commands. Set '
+        f'CACHE_BACKEND and CACHE_LOCATION to a shared cache such as '
+        f'Memcached (see infra/docker-compose.yml).'
+    )
+
+
+def check_shared_cache():
+    """Отказ запускать веб-процесс с кэшем в памяти процесса."""
+    error = shared_cache_error()
+    if error is not None:
+        raise ImproperlyConfigured(error)
+
+
+def incr(key, delta=1):
+    cache = get_cache()
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        return cache.incr(key, delta)
+
+
+def new_version():
+    """Версия - время изменения в наносекундах.
+
+    Версии уникальны, поэтому после вытеснения ключа из кэша старые
+    записи не найдутся, и годятся для заголовка Last-Modified.
+    """
+    return time.time_ns()
+
+
+def get_versions(keys):
+    cache = get_cache()
+    versions = cache.get_many(keys)
+    missing = {key: new_version() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        versions.update(missing)
+    return versions
+
+
+def bump_versions(keys):
+    version = new_version()
+    get_cache().set_many({key: version for key in keys}, timeout=None)
+
+
+def get_generation():
+    return get_versions([GENERATION_KEY])[GENERATION_KEY]
+
+
+def bump_generation():
+    """Сброс всех закэшированных ответов со списками рецептов."""
+    bump_versions([GENERATION_KEY])
+
+
+def get_stats():
+    cache = get_cache()
+    return {
+        'hits': cache.get(HITS_KEY, 0),
+        'misses': cache.get(MISSES_KEY, 0),
+        'generation': get_generation(),
+    }
+
+
+def normalized_url(request):
+    """Адрес запроса с отсортированными параметрами."""
+    params = sorted(
+        (key, sorted(values)) for key, values in request.query_params.lists()
+    )
+    return f'{request.scheme}://{request.get_host()}{request.path}?{params}'
+
+
+def response_cache_key(request, versions):
+    url = normalized_url(request)
+    return f'recipes:{versions}:{sha1(url.encode()).hexdigest()}'
+
+
+def cache_anonymous_response(extra_keys=None):
+    """Кэш ответов анонимным пользователям.
+
+    Ключ - нормализованные параметры запроса и текущее поколение,
+    которое увеличивается сигналами при изменении рецептов, а также
+    версии из extra_keys(request), как у conditional.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            if not request.user.is_anonymous:
+                return method(self, request, *args, **kwargs)
+            keys = [GENERATION_KEY]
+            if extra_keys is not None:
+                keys.extend(extra_keys(request))
+            versions = get_versions(keys)
+            key = response_cache_key(
+                request, ':'.join(str(versions[name]) for name in keys)
+            )
+            cache = get_cache()
+            data = cache.get(key)
+            if data is not None:
+                incr(HITS_KEY)
+                response = Response(data)
+                response['X-Cache'] = 'HIT'
+                return response
+            incr(MISSES_KEY)
+            response = method(self, request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                cache.set(key, response.data, settings.RECIPES_CACHE_TIMEOUT)
+            response['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
+
+
+def get_fragments(recipes, build):
+    """Закэшированные части рецептов, одинаковые для всех пользователей.
+
+    Ключ части - id рецепта и версии рецепта, автора и справочников.
+    Отсутствующие части строятся одним вызовом build(recipes),
+    который возвращает словарь {id: часть}.
+    """
+    version_keys = {CATALOG_VERSION_KEY}
+    for recipe in recipes:
+        version_keys.add(RECIPE_VERSION_KEY.format(recipe.pk))
+        version_keys.add(AUTHOR_VERSION_KEY.format(recipe.author_id))
+    versions = get_versions(list(version_keys))
+    keys = {
+        recipe.pk: 'recipe:{}:{}:{}:{}'.format(
+            recipe.pk,
+            versions[CATALOG_VERSION_KEY],
+            versions[RECIPE_VERSION_KEY.format(recipe.pk)],
+            versions[AUTHOR_VERSION_KEY.format(recipe.author_id)]
+        ) for recipe in recipes
+    }
+    cache = get_cache()
+    cached = cache.get_many(list(keys.values()))
+    fragments = {
+        pk: cached[key] for pk, key in keys.items() if key in cached
+    }
+    missing = [recipe for recipe in recipes if recipe.pk not in fragments]
+    if missing:
+        built = build(missing)
+        cache.set_many(
+            {keys[pk]: fragment for pk, fragment in built.items()},
+            settings.RECIPE_FRAGMENT_TIMEOUT
+        )
+        fragments.update(built)
+    return fragments
+
+
+def recipes_changed(recipe_ids=(), author_id=None, catalog=()):
+    """Сброс кэшей рецептов после фиксации транзакции.
+
+    catalog - ключи версий изменившихся справочников (теги,
+    ингредиенты), при этом сбрасываются части всех рецептов.
+    """
+    keys = [GENERATION_KEY]
+    keys.extend(RECIPE_VERSION_KEY.format(pk) for pk in recipe_ids)
+    if author_id is not None:
+        keys.append(AUTHOR_VERSION_KEY.format(author_id))
+    if catalog:
+        keys.append(CATALOG_VERSION_KEY)
+        keys.extend(catalog)
+    transaction.on_commit(lambda: bump_versions(keys))
+
+
+def viewer_changed(user_id):
+    """Изменились избранное, корзина или подписки пользователя."""
+    key = VIEWER_VERSION_KEY.format(user_id)
+    transaction.on_commit(lambda: bump_versions([key]))
+
+
+def ranking_changed():
+    """Изменились счётчики, по которым упорядочиваются рецепты."""
+    transaction.on_commit(lambda: bump_versions([RANKING_VERSION_KEY]))
+
+
+def carts_changed(user_ids=(), recipe_ids=()):
+    """Изменились корзины пользователей или ингредиенты рецептов в них.
+
+    Для рецептов версии корзин, где они лежат, сбрасываются одним
+    запросом после фиксации транзакции.
+    """
+    def bump():
+        ids = set(user_ids)
+        if recipe_ids:
+            ids.update(ShoppingCart.objects.filter(
+                recipe_id__in=recipe_ids
+            ).values_list('user_id', flat=True))
+        if ids:
+            bump_versions([CART_VERSION_KEY.format(pk) for pk in ids])
+    transaction.on_commit(bump)
+
+
+class DocumentCache:
+    """Готовые документы в памяти процесса с вытеснением LRU.
+
+    Суммарный размер не больше max_size байт. Одновременные запросы
+    одного ключа ждут единственную отрисовку.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.documents = OrderedDict()
+        self.rendering = {}
+        self.lock = threading.Lock()
+
+    def get_or_render(self, key, render):
+        with self.lock:
+            document = self.documents.get(key)
+            if document is not None:
+                self.documents.move_to_end(key)
+                return document
+            future = self.rendering.get(key)
+            owner = future is None
+            if owner:
+                future = self.rendering[key] = Future()
+        if not owner:
+            return future.result()
+        try:
+            document = render()
+        except BaseException as error:
+            with self.lock:
+                del self.rendering[key]
+            future.set_exception(error)
+            raise
+        with self.lock:
+            del self.rendering[key]
+            self.put(key, document)
+        future.set_result(document)
+        return document
+
+    def put(self, key, document):
+        if len(document) > self.max_size:
+            return
+        self.documents[key] = document
+        self.size += len(document)
+        while self.size > self.max_size:
+            _, evicted = self.documents.popitem(last=False)
+            self.size -= len(evicted)
+
+    def clear(self):
+        with self.lock:
+            self.documents.clear()
+            self.size = 0
+
+
+def get_documents():
+    """Кэш документов процесса, пересоздаётся при смене размера."""
+    global _documents
+    size = settings.SHOPPING_LIST_CACHE_SIZE
+    if _documents is None or _documents.max_size != size:
+        _documents = DocumentCache(size)
+    return _documents
+
+
+def conditional(*version_keys, per_user=False, extra_keys=None):
+    """ETag и Last-Modified по версиям из кэша.
+
+    Если клиент прислал актуальные If-None-Match или If-Modified-Since,
+    ответ 304 возвращается до запросов к базе и сериализации.
+    per_user добавляет версию избранного, корзины и подписок,
+    extra_keys - функция запроса с ключами версий, нужными только
+    некоторым запросам.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            keys = list(version_keys)
+            if extra_keys is not None:
+                keys.extend(extra_keys(request))
+            if per_user and request.user.is_authenticated:
+                keys.append(VIEWER_VERSION_KEY.format(request.user.pk))
+            versions = get_versions(keys)
+            values = [versions[key] for key in keys]
+            raw = (f'{values}:{request.user.pk}:'
+                   f'{request.META.get("HTTP_ACCEPT", "")}:'
+                   f'{normalized_url(request)}')
+            etag = f'"{sha1(raw.encode()).hexdigest()}"'
+            last_modified = max(values) // 10 ** 9
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified
+            )
+            if response is None:
+                response = method(self, request, *args, **kwargs)
+            if response.status_code in (status.HTTP_200_OK,
+                                        status.HTTP_304_NOT_MODIFIED):
+                response['ETag'] = etag
+                response['Last-Modified'] = http_date(last_modified)
+            patch_vary_headers(response, ('Accept', 'Authorization'))
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,12 @@
+from django.core.checks import Error, Tags, register
+
+from .cache import shared_cache_error
+
+
+@register(Tags.caches, deploy=True)
+def shared_cache_check(app_configs, **kwargs):
+    """manage.py check --deploy: кэш версий общий для всех процессов."""
+    error = shared_cache_error()
+    if error is None:
+        return []
+    return [Error(error, id='api.E001')]
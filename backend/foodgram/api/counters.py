@@ -0,0 +1,76 @@
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Subscribe, User
+
+BATCH_SIZE = 1000
+
+# Счётчик: модель, поле и связь, по которой он считается.
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'cart_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Subscribe, 'author'),
+    (User, 'following_count', Subscribe, 'user'),
+)
+
+
+def delta(signal, created=False):
+    """+1 при создании связи, -1 при удалении, 0 при изменении."""
+    if signal is post_delete:
+        return -1
+    return 1 if created else 0
+
+
+def change(model, pk, field, delta):
+    """Счётчик += delta одним UPDATE, без чтения строки.
+
+    Отрицательным счётчик не становится: расхождение с таблицей
+    связей исправляет reconcile.
+    """
+    if not delta:
+        return
+    objects = model.objects.filter(pk=pk)
+    if delta < 0:
+        objects = objects.filter(**{f'{field}__gte': -delta})
+    objects.update(**{field: F(field) + delta})
+
+
+def actual(related, relation):
+    """Настоящее значение счётчика подзапросом по таблице связей."""
+    return Coalesce(
+        Subquery(
+            related.objects.filter(
+                **{relation: OuterRef('pk')}
+            ).order_by().values(relation).annotate(
+                total=Count('pk')
+            ).values('total'),
+            output_field=IntegerField()
+        ),
+        0
+    )
+
+
+def reconcile(dry_run=False):
+    """Исправление разошедшихся счётчиков.
+
+    Значение пересчитывается в самом UPDATE, поэтому изменения между
+    поиском расхождений и записью не теряются. Возвращает число
+    исправленных строк по каждому счётчику.
+    """
+    repaired = {}
+    for model, field, related, relation in COUNTERS:
+        ids = list(model.objects.annotate(
+            counted=actual(related, relation)
+        ).exclude(
+            **{field: F('counted')}
+        ).order_by().values_list('pk', flat=True))
+        if not dry_run:
+            for offset in range(0, len(ids), BATCH_SIZE):
+                model.objects.filter(
+                    pk__in=ids[offset:offset + BATCH_SIZE]
+                ).update(**{field: actual(related, relation)})
+        repaired[f'{model._meta.model_name}.{field}'] = len(ids)
+    return repaired
@@ -0,0 +1,144 @@
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .background import EXPORTS, get_writer
+from .renderers import RENDERERS
+from .services import shopping_list
+from recipes.models import ShoppingListExport
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+
+
+def get_pool(reset=False):
+    """Пул процессов, создаётся при первой выгрузке в процессе."""
+    global _pool
+    if _pool is None or reset:
+        _pool = ProcessPoolExecutor(max_workers=settings.EXPORT_WORKERS)
+    return _pool
+
+
+def render_export(format, items):
+    """Документ выгрузки, выполняется в процессе пула."""
+    return RENDERERS[format]().document(items)
+
+
+def claim(job_id):
+    """Выгрузка в работу, если её ещё не взял другой процесс."""
+    return ShoppingListExport.objects.filter(
+        pk=job_id,
+        status=ShoppingListExport.PENDING
+    ).update(
+        status=ShoppingListExport.RUNNING,
+        started=timezone.now()
+    ) == 1
+
+
+def save_export(job_id, document=None, error=''):
+    """Запись файла или ошибки, если выгрузку не удалили."""
+    job = ShoppingListExport.objects.filter(pk=job_id).first()
+    if job is None:
+        return
+    if error:
+        job.status = ShoppingListExport.FAILED
+        job.error = error
+    else:
+        job.file.save(
+            f'{job.pk}.{job.format}', ContentFile(document), save=False
+        )
+        job.status = ShoppingListExport.DONE
+    job.finished = timezone.now()
+    job.save(update_fields=('file', 'status', 'error', 'finished'))
+
+
+def finish(job_id, render):
+    try:
+        document = render()
+    except Exception as error:
+        logger.exception('Не удалось сформировать выгрузку %s', job_id)
+        save_export(job_id, error=str(error) or type(error).__name__)
+    else:
+        save_export(job_id, document)
+
+
+def write_in_background(job_id, future):
+    try:
+        finish(job_id, future.result)
+    except Exception:
+        logger.exception('Не удалось сохранить выгрузку %s', job_id)
+    finally:
+        connection.close()
+
+
+def on_done(job_id, future):
+    get_writer(EXPORTS).submit(write_in_background, job_id, future)
+
+
+def run_export(job):
+    """Формирование выгрузки в пуле процессов или сразу.
+
+    Строки списка читаются здесь, в пул уходят только данные. При
+    EXPORT_SYNC или сломанном пуле документ формируется в текущем
+    процессе. Возвращает future пула или None.
+    """
+    if not claim(job.pk):
+        return None
+    items = list(shopping_list(job.user_id))
+    if not settings.EXPORT_SYNC:
+        try:
+            future = get_pool().submit(render_export, job.format, items)
+        except (BrokenProcessPool, RuntimeError):
+            logger.exception('Пул выгрузок недоступен')
+            get_pool(reset=True)
+        else:
+            future.add_done_callback(partial(on_done, job.pk))
+            return future
+    finish(job.pk, partial(render_export, job.format, items))
+    return None
+
+
+def schedule_export(job):
+    """Выгрузка после фиксации транзакции."""
+    transaction.on_commit(lambda: run_export(job))
+
+
+def requeue_stale():
+    """Возврат в очередь выгрузок, зависших дольше EXPORT_TIMEOUT."""
+    return ShoppingListExport.objects.filter(
+        status=ShoppingListExport.RUNNING,
+        started__lt=timezone.now() - timedelta(
+            seconds=settings.EXPORT_TIMEOUT
+        )
+    ).update(status=ShoppingListExport.PENDING, started=None)
+
+
+def expired_exports():
+    """Выгрузки, завершённые больше EXPORT_RETENTION_HOURS назад.
+
+    Срок считается от завершения: долго ждавшую в очереди выгрузку
+    клиент успеет скачать. Незавершённые остаются: их ещё формирует
+    пул или вернёт в очередь requeue_stale.
+    """
+    return ShoppingListExport.objects.filter(
+        status__in=(ShoppingListExport.DONE, ShoppingListExport.FAILED),
+        finished__lt=timezone.now() - timedelta(
+            hours=settings.EXPORT_RETENTION_HOURS
+        )
+    )
+
+
+def release_export(job):
+    """Удаление файла выгрузки после фиксации транзакции."""
+    if not job.file:
+        return
+    storage, name = job.file.storage, job.file.name
+    transaction.on_commit(lambda: storage.delete(name))
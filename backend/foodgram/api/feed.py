@@ -0,0 +1,155 @@
+import logging
+from itertools import islice
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+
+from .background import FEED, get_writer
+from .cache import get_cache
+from recipes.models import FeedEntry, Recipe
+from users.models import User
+
+logger = logging.getLogger(__name__)
+
+PULL_AUTHORS_KEY = 'feed:pull_authors'
+BATCH_SIZE = 1000
+
+
+def pull_authors():
+    """Авторы, у которых подписчиков больше FEED_FANOUT_LIMIT.
+
+    Их рецепты не раскладываются по лентам, а читаются при запросе
+    ленты. Список пересчитывается раз в FEED_PULL_AUTHORS_TIMEOUT.
+    """
+    cache = get_cache()
+    authors = cache.get(PULL_AUTHORS_KEY)
+    if authors is None:
+        authors = frozenset(User.objects.filter(
+            followers_count__gt=settings.FEED_FANOUT_LIMIT
+        ).values_list('id', flat=True))
+        cache.set(
+            PULL_AUTHORS_KEY, authors, settings.FEED_PULL_AUTHORS_TIMEOUT
+        )
+    return authors
+
+
+def add_entries(rows):
+    """Записи из троек (подписчик, рецепт, дата) пачками."""
+    rows = iter(rows)
+    while True:
+        batch = [
+            FeedEntry(user_id=user_id, recipe_id=recipe_id,
+                      pub_date=pub_date)
+            for user_id, recipe_id, pub_date in islice(rows, BATCH_SIZE)
+        ]
+        if not batch:
+            return
+        FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def run_in_background(func, *args):
+    try:
+        func(*args)
+    except Exception:
+        logger.exception('Не удалось обновить ленты: %s%s', func.__name__,
+                         args)
+    finally:
+        connection.close()
+
+
+def after_commit(func, *args):
+    """func(*args) после фиксации транзакции, вне запроса.
+
+    Выполняется в очереди FEED api.background, при FEED_SYNC - сразу
+    после фиксации. Записи, потерянные при остановке процесса, восстанавливает
+    backfill_feed.
+    """
+    def submit():
+        if settings.FEED_SYNC:
+            func(*args)
+        else:
+            get_writer(FEED).submit(run_in_background, func, *args)
+    transaction.on_commit(submit)
+
+
+def followers_recipes(**filters):
+    """Тройки (подписчик, рецепт, дата) по подпискам на авторов."""
+    return Recipe.objects.filter(
+        author__following_users__isnull=False, **filters
+    ).order_by().values_list(
+        'author__following_users__user_id', 'id', 'pub_date'
+    )
+
+
+def fan_out(recipe_id, author_id):
+    """Новый рецепт в ленты подписчиков автора."""
+    if author_id in pull_authors():
+        return
+    add_entries(followers_recipes(pk=recipe_id).iterator())
+
+
+def follow(user_id, author_id):
+    """Рецепты автора в ленту подписчика, если подписка ещё есть."""
+    if author_id in pull_authors():
+        return
+    add_entries(followers_recipes(
+        author_id=author_id,
+        author__following_users__user_id=user_id
+    ).iterator())
+
+
+def leave_pull_mode(author_id):
+    """Автор, у которого подписчиков снова не больше FEED_FANOUT_LIMIT.
+
+    Его рецепты раскладываются по лентам всех подписчиков, в том числе
+    подписавшихся, пока они читались при запросе ленты.
+    """
+    if author_id not in pull_authors() or User.objects.filter(
+        pk=author_id, followers_count__gt=settings.FEED_FANOUT_LIMIT
+    ).exists():
+        return
+    get_cache().delete(PULL_AUTHORS_KEY)
+    add_entries(followers_recipes(author_id=author_id).iterator())
+
+
+def unfollow(user_id, author_id):
+    FeedEntry.objects.filter(
+        user_id=user_id,
+        recipe__author_id=author_id
+    ).delete()
+
+
+def rebuild(user_ids):
+    """Ленты пользователей заново по их подпискам."""
+    recipes = followers_recipes(
+        author__following_users__user_id__in=user_ids
+    ).exclude(author_id__in=pull_authors())
+    with transaction.atomic():
+        FeedEntry.objects.filter(user_id__in=user_ids).delete()
+        add_entries(recipes.iterator())
+
+
+def feed_sources(user):
+    """Источники ленты для api.pagination.FeedPagination.
+
+    Записи ленты - один диапазон по индексу (user, -pub_date,
+    -recipe); рецепты авторов из pull_authors читаются вторым
+    запросом, только если такие авторы есть.
+    """
+    sources = [
+        FeedEntry.objects.filter(user=user).select_related(
+            'recipe__author'
+        ).defer('recipe__search_vector')
+    ]
+    pulled = pull_authors()
+    if pulled:
+        sources.append(
+            Recipe.objects.filter(
+                author_id__in=pulled,
+                author__following_users__user=user
+            ).select_related('author').defer('search_vector').annotate(
+                recipe_id=F('id')
+            )
+        )
+    return sources
@@ -0,0 +1,132 @@
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import F
+
+from .background import IMAGES, get_writer
+from .cache import recipes_changed
+from recipes.images import make_variants
+from recipes.models import ImageBlob, Recipe
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+
+
+def get_pool(reset=False):
+    """Пул процессов, создаётся при первой картинке в процессе."""
+    global _pool
+    if _pool is None or reset:
+        _pool = ProcessPoolExecutor(max_workers=settings.IMAGE_WORKERS)
+    return _pool
+
+
+def variant_args(recipe):
+    return (
+        str(settings.MEDIA_ROOT),
+        recipe.image.name,
+        settings.IMAGE_VARIANTS,
+        settings.IMAGE_FORMATS,
+        settings.IMAGE_QUALITY
+    )
+
+
+def save_variants(recipe_id, name, result):
+    """Запись размеров и копий, если картинка рецепта не сменилась."""
+    updated = Recipe.objects.filter(pk=recipe_id, image=name).update(
+        image_width=result['width'],
+        image_height=result['height'],
+        image_variants=result['variants']
+    )
+    if updated:
+        recipes_changed(recipe_ids=(recipe_id,))
+
+
+def write_in_background(recipe_id, name, result):
+    try:
+        save_variants(recipe_id, name, result)
+    except Exception:
+        logger.exception('Не удалось сохранить копии картинки %s', name)
+    finally:
+        connection.close()
+
+
+def on_done(recipe_id, name, future):
+    try:
+        result = future.result()
+    except Exception:
+        logger.exception('Не удалось обработать картинку %s', name)
+        return
+    get_writer(IMAGES).submit(write_in_background, recipe_id, name, result)
+
+
+def process_image(recipe):
+    """Создание копий картинки в пуле процессов или сразу.
+
+    Копии одинаковой картинки другого рецепта используются повторно.
+    При IMAGE_PROCESSING_SYNC или сломанном пуле картинка
+    обрабатывается в текущем процессе.
+    """
+    name = recipe.image.name
+    processed = Recipe.objects.filter(image=name).exclude(
+        pk=recipe.pk
+    ).exclude(image_variants={}).values(
+        'image_width', 'image_height', 'image_variants'
+    ).first()
+    if processed is not None:
+        save_variants(recipe.pk, name, {
+            'width': processed['image_width'],
+            'height': processed['image_height'],
+            'variants': processed['image_variants'],
+        })
+        return
+    if not settings.IMAGE_PROCESSING_SYNC:
+        try:
+            future = get_pool().submit(make_variants, *variant_args(recipe))
+        except (BrokenProcessPool, RuntimeError):
+            logger.exception('Пул обработки картинок недоступен')
+            get_pool(reset=True)
+        else:
+            future.add_done_callback(partial(on_done, recipe.pk, name))
+            return
+    save_variants(recipe.pk, name, make_variants(*variant_args(recipe)))
+
+
+def schedule_image_processing(recipe):
+    """Обработка картинки после фиксации транзакции."""
+    transaction.on_commit(lambda: process_image(recipe))
+
+
+def release_image(name, variants):
+    """Минус ссылка на картинку, файл с копиями удаляется без ссылок.
+
+    Счётчик уменьшается в транзакции изменения рецепта. После её
+    фиксации строка ImageBlob блокируется, и файл удаляется, только
+    если ссылок так и не появилось: загрузка того же файла
+    (ContentAddressedStorage.save) ждёт эту блокировку и записывает
+    файл заново. Рецепты, созданные в обход хранилища, файл держат.
+    """
+    if not name:
+        return
+    ImageBlob.objects.filter(name=name, references__gt=0).update(
+        references=F('references') - 1
+    )
+
+    def delete():
+        with transaction.atomic():
+            blob, _ = ImageBlob.objects.select_for_update().get_or_create(
+                name=name
+            )
+            if blob.references or Recipe.objects.filter(image=name).exists():
+                return
+            default_storage.delete(name)
+            for formats in variants.values():
+                for variant in formats.values():
+                    default_storage.delete(variant)
+            blob.delete()
+    transaction.on_commit(delete)
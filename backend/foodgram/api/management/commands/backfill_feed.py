@@ -0,0 +1,48 @@
+import time
+
+from django.core.management import BaseCommand
+
+from api.cache import get_cache
+from api.feed import PULL_AUTHORS_KEY, rebuild
+from recipes.models import FeedEntry
+from users.models import Subscribe
+
+
+class Command(BaseCommand):
+    help = ('Rebuild following feeds from subscriptions, e.g. after '
+            'changing FEED_FANOUT_LIMIT')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users',
+            help='Comma separated user ids, all users by default'
+        )
+        parser.add_argument('--chunk-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        get_cache().delete(PULL_AUTHORS_KEY)
+        if options['users']:
+            ids = sorted({int(pk) for pk in options['users'].split(',')})
+        else:
+            ids = sorted({
+                *Subscribe.objects.order_by().values_list(
+                    'user_id', flat=True
+                ).distinct(),
+                *FeedEntry.objects.order_by().values_list(
+                    'user_id', flat=True
+                ).distinct()
+            })
+        start = time.perf_counter()
+        for offset in range(0, len(ids), options['chunk_size']):
+            rebuild(ids[offset:offset + options['chunk_size']])
+            self.stdout.write(
+                f'Обработано лент: '
+                f'{min(offset + options["chunk_size"], len(ids))} '
+                f'из {len(ids)}',
+                ending='\r'
+            )
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово! Лент: {len(ids)}, '
+            f'время: {time.perf_counter() - start:.2f} с'
+        ))
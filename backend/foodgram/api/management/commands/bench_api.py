@@ -0,0 +1,426 @@
+import json
+import tempfile
+
+from django.core.management import BaseCommand, CommandError
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from api.bench import (BENCH_IMAGE_BASE64,
+                       format_row,
+                       measure,
+                       seed_dataset,
+                       test_database)
+from api.exports import run_export
+from api.feed import rebuild
+from api.ranking import refresh
+from api.similar import build
+from recipes.models import (Favorite,
+                            Ingredient,
+                            IngredientRecipe,
+                            Recipe,
+                            ShoppingCart,
+                            ShoppingListExport,
+                            Tag)
+from users.models import Subscribe, User
+
+# Бюджет SQL-запросов на вызов эндпоинта не зависит от размера страницы:
+# замер плюс запас в один запрос на чтение и два на запись.
+QUERY_BUDGETS = {
+    'recipes-list': 8,
+    'recipes-list-cursor': 7,
+    'recipes-feed': 7,
+    'recipes-list-tags': 9,
+    'recipes-list-author': 8,
+    'recipes-list-ingredients': 8,
+    'recipes-list-coverage': 8,
+    'recipes-list-favorited': 8,
+    'recipes-list-popular': 8,
+    'recipes-list-ranked': 8,
+    'recipes-list-trending': 7,
+    'recipes-list-in-cart': 8,
+    'recipes-detail': 7,
+    'recipes-similar': 7,
+    # Ссылка на ImageBlob, раскладка по лентам, счётчики, строка баллов,
+    # подпись для api.similar и запись в журнал api.recipe_index.
+    'recipes-create': 25,
+    'recipes-create-large': 25,
+    'recipes-patch-name': 11,
+    # Сброс версий корзин с рецептом, подпись и журнал индекса.
+    'recipes-patch-ingredients': 25,
+    # Счётчики и событие в журнале баллов (api.ranking).
+    'recipes-favorite-post': 7,
+    'recipes-favorite-delete': 8,
+    # Отвечает полным рецептом (WriteRecipeSerializer).
+    'recipes-shopping-cart-post': 13,
+    'recipes-shopping-cart-delete': 8,
+    'recipes-download-shopping-cart': 2,
+    'recipes-download-csv': 2,
+    'recipes-shopping-list': 2,
+    'users-list': 4,
+    'users-detail': 3,
+    'users-me': 2,
+    # Авторы, их рецепты одним запросом и id их подписок (followers).
+    'users-subscriptions': 5,
+    # Счётчики подписок и раскладка рецептов автора в ленту.
+    'users-subscribe-post': 9,
+    'users-subscribe-delete': 9,
+    'tags-list': 2,
+    'tags-detail': 2,
+    'ingredients-list': 2,
+    'ingredients-search': 1,
+    'ingredients-detail': 2,
+    # При EXPORT_SYNC документ формируется и сохраняется в запросе.
+    'exports-create': 9,
+    'exports-list': 3,
+    'exports-detail': 2,
+    'exports-download': 2,
+    'exports-download-pending': 2,
+}
+
+# Ожидаемый ответ по методу; эндпоинты только для авторизованных
+# отвечают анониму 401. Любой другой статус - ошибка замера.
+EXPECTED_STATUSES = {'get': 200, 'post': 201, 'patch': 200, 'delete': 204}
+STATUS_OVERRIDES = {
+    'exports-create': 202,
+    'exports-download-pending': 409,
+}
+AUTHENTICATED_ONLY = {
+    'recipes-feed',
+    'recipes-download-shopping-cart',
+    'recipes-download-csv',
+    'recipes-shopping-list',
+    'users-list',
+    'users-subscriptions',
+    'users-me',
+    'exports-create',
+    'exports-list',
+    'exports-detail',
+    'exports-download',
+    'exports-download-pending',
+}
+
+
+class Command(BaseCommand):
+    help = ('Measure SQL queries, latency and peak memory of every API '
+            'endpoint on a seeded test database')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--recipes', type=int, default=500)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument(
+            '--page-sizes',
+            default='6,20,50',
+            help='Comma separated values of the limit query parameter'
+        )
+        parser.add_argument(
+            '--json',
+            dest='json_path',
+            help='Write the results to this file'
+        )
+        parser.add_argument('--keepdb', action='store_true')
+        parser.add_argument(
+            '--cache',
+            action='store_true',
+            help='Keep response caches on (off by default)'
+        )
+
+    def handle(self, *args, **options):
+        with test_database(keepdb=options['keepdb']), \
+                tempfile.TemporaryDirectory() as media, \
+                tempfile.TemporaryDirectory() as similar, \
+                tempfile.TemporaryDirectory() as exports, \
+                override_settings(MEDIA_ROOT=media,
+                                  SIMILAR_INDEX_ROOT=similar,
+                                  EXPORTS_ROOT=exports,
+                                  IMAGE_PROCESSING_SYNC=True,
+                                  EXPORT_SYNC=True,
+                                  FEED_SYNC=True):
+            viewer = seed_dataset(
+                users=options['users'],
+                recipes=options['recipes'],
+                ingredients=options['ingredients']
+            )
+            rebuild((viewer.pk,))
+            refresh(rebuild=True)
+            build()
+            if options['cache']:
+                results = self.run_scenarios(viewer, options)
+            else:
+                with override_settings(RECIPES_CACHE_TIMEOUT=0,
+                                       RECIPE_FRAGMENT_TIMEOUT=0,
+                                       SHOPPING_LIST_CACHE_SIZE=0):
+                    results = self.run_scenarios(viewer, options)
+        self.report(results, options.get('json_path'))
+
+    def scenarios(self, viewer, page_sizes):
+        """Эндпоинты из api/urls.py.
+
+        Кортежи (имя, метод, url, сброс состояния[, тело запроса]).
+        """
+        followed = viewer.followers.first().author
+        recipe = Recipe.objects.filter(author=followed).first()
+        free_recipe = Recipe.objects.exclude(
+            recipe__user=viewer
+        ).exclude(shop_cart__user=viewer).first()
+        other = User.objects.exclude(pk=viewer.pk).first()
+        free_author = User.objects.exclude(
+            pk=viewer.pk
+        ).filter(following_users__isnull=True).first()
+        tag = recipe.tags.first()
+        ingredients = ','.join(map(str, IngredientRecipe.objects.filter(
+            recipe=recipe
+        ).values_list('ingredient_id', flat=True)[:2]))
+        ingredient = recipe.ingredients.first()
+        edited = Recipe.objects.exclude(
+            pk__in=(recipe.pk, free_recipe.pk)
+        ).order_by('pk').last()
+        edited_rows = list(
+            edited.ingredient_list.values('ingredient_id', 'amount')
+        )
+        edited_tags = list(edited.tags.values_list('id', flat=True))
+        replacement = Ingredient.objects.exclude(
+            pk__in=[row['ingredient_id'] for row in edited_rows]
+        ).first()
+        done_export = ShoppingListExport.objects.create(
+            user=viewer, format='txt'
+        )
+        run_export(done_export)
+        pending_export = ShoppingListExport.objects.create(
+            user=viewer, format='pdf'
+        )
+
+        def remove_favorite():
+            Favorite.objects.filter(user=viewer, recipe=free_recipe).delete()
+
+        def add_favorite():
+            Favorite.objects.create(user=viewer, recipe=free_recipe)
+
+        def remove_from_cart():
+            ShoppingCart.objects.filter(
+                user=viewer, recipe=free_recipe
+            ).delete()
+
+        def add_to_cart():
+            ShoppingCart.objects.create(user=viewer, recipe=free_recipe)
+
+        def unsubscribe():
+            Subscribe.objects.filter(user=viewer, author=free_author).delete()
+
+        def subscribe():
+            Subscribe.objects.create(user=viewer, author=free_author)
+
+        def remove_created():
+            Recipe.objects.filter(name='Новый рецепт').delete()
+
+        def restore_edited():
+            Recipe.objects.filter(pk=edited.pk).update(name=edited.name)
+            IngredientRecipe.objects.filter(recipe=edited).delete()
+            IngredientRecipe.objects.bulk_create(
+                IngredientRecipe(recipe=edited, **row) for row in edited_rows
+            )
+            edited.tags.set(edited_tags)
+
+        def remove_exports():
+            ShoppingListExport.objects.filter(
+                user=viewer, format='csv'
+            ).delete()
+
+        def new_recipe(ingredients):
+            return {
+                'name': 'Новый рецепт',
+                'text': 'Описание',
+                'image': BENCH_IMAGE_BASE64,
+                'cooking_time': 10,
+                'tags': list(Tag.objects.values_list('id', flat=True)),
+                'ingredients': [
+                    {'id': pk, 'amount': 10}
+                    for pk in Ingredient.objects.values_list(
+                        'id', flat=True
+                    )[:ingredients]
+                ]
+            }
+
+        for limit in page_sizes:
+            yield ('recipes-list', 'get',
+                   f'/api/recipes/?limit={limit}', None)
+            yield ('recipes-list-cursor', 'get',
+                   f'/api/recipes/?cursor=&limit={limit}', None)
+            yield ('recipes-feed', 'get',
+                   f'/api/recipes/feed/?limit={limit}', None)
+            yield ('recipes-list-tags', 'get',
+                   f'/api/recipes/?limit={limit}&tags={tag.slug}', None)
+            yield ('recipes-list-author', 'get',
+                   f'/api/recipes/?limit={limit}&author={followed.pk}', None)
+            yield ('recipes-list-ingredients', 'get',
+                   f'/api/recipes/?limit={limit}&ingredients={ingredients}',
+                   None)
+            yield ('recipes-list-coverage', 'get',
+                   f'/api/recipes/?limit={limit}&ingredients={ingredients}'
+                   f'&ingredients_mode=coverage', None)
+            yield ('users-list', 'get', f'/api/users/?limit={limit}', None)
+            yield ('users-subscriptions', 'get',
+                   f'/api/users/subscriptions/?limit={limit}', None)
+        yield ('recipes-list-popular', 'get',
+               '/api/recipes/?ordering=favorites', None)
+        yield ('recipes-list-ranked', 'get',
+               '/api/recipes/?ordering=popular', None)
+        yield ('recipes-list-trending', 'get',
+               '/api/recipes/?ordering=trending&cursor=', None)
+        yield ('recipes-list-favorited', 'get',
+               '/api/recipes/?is_favorited=1', None)
+        yield ('recipes-list-in-cart', 'get',
+               '/api/recipes/?is_in_shopping_cart=1', None)
+        yield 'recipes-detail', 'get', f'/api/recipes/{recipe.pk}/', None
+        yield ('recipes-similar', 'get',
+               f'/api/recipes/{recipe.pk}/similar/', None)
+        yield ('recipes-download-shopping-cart', 'get',
+               '/api/recipes/download_shopping_cart/', None)
+        yield ('recipes-download-csv', 'get',
+               '/api/recipes/download_shopping_cart/?format=csv', None)
+        yield ('recipes-shopping-list', 'get',
+               '/api/recipes/shopping_list/', None)
+        yield 'users-detail', 'get', f'/api/users/{other.pk}/', None
+        yield 'users-me', 'get', '/api/users/me/', None
+        yield 'tags-list', 'get', '/api/tags/', None
+        yield 'tags-detail', 'get', f'/api/tags/{tag.pk}/', None
+        yield 'ingredients-list', 'get', '/api/ingredients/', None
+        yield ('ingredients-search', 'get',
+               f'/api/ingredients/?name={ingredient.name[:4]}', None)
+        yield ('ingredients-detail', 'get',
+               f'/api/ingredients/{ingredient.pk}/', None)
+        yield 'exports-list', 'get', '/api/exports/', None
+        yield ('exports-detail', 'get',
+               f'/api/exports/{done_export.pk}/', None)
+        yield ('exports-download', 'get',
+               f'/api/exports/{done_export.pk}/download/', None)
+        yield ('exports-download-pending', 'get',
+               f'/api/exports/{pending_export.pk}/download/', None)
+        yield ('exports-create', 'post', '/api/exports/', remove_exports,
+               {'format': 'csv'})
+        favorite_url = f'/api/recipes/{free_recipe.pk}/favorite/'
+        cart_url = f'/api/recipes/{free_recipe.pk}/shopping_cart/'
+        subscribe_url = f'/api/users/{free_author.pk}/subscribe/'
+        yield 'recipes-favorite-post', 'post', favorite_url, remove_favorite
+        yield 'recipes-favorite-delete', 'delete', favorite_url, add_favorite
+        yield ('recipes-shopping-cart-post', 'post', cart_url,
+               remove_from_cart)
+        yield ('recipes-shopping-cart-delete', 'delete', cart_url,
+               add_to_cart)
+        yield 'users-subscribe-post', 'post', subscribe_url, unsubscribe
+        yield ('recipes-create', 'post', '/api/recipes/', remove_created,
+               new_recipe(3))
+        yield ('recipes-create-large', 'post', '/api/recipes/',
+               remove_created, new_recipe(30))
+        edited_url = f'/api/recipes/{edited.pk}/'
+        yield ('recipes-patch-name', 'patch', edited_url, restore_edited,
+               {'name': 'Переименованный рецепт'})
+        yield ('recipes-patch-ingredients', 'patch', edited_url,
+               restore_edited, {
+                   'ingredients': [
+                       {'id': edited_rows[0]['ingredient_id'],
+                        'amount': edited_rows[0]['amount'] % 500 + 1},
+                       {'id': replacement.pk, 'amount': 10},
+                   ] + [
+                       {'id': row['ingredient_id'], 'amount': row['amount']}
+                       for row in edited_rows[2:]
+                   ],
+                   'tags': edited_tags[:1]
+               })
+        yield 'users-subscribe-delete', 'delete', subscribe_url, subscribe
+
+    def run_scenarios(self, viewer, options):
+        page_sizes = [
+            int(size) for size in options['page_sizes'].split(',') if size
+        ]
+        anonymous = APIClient(raise_request_exception=False)
+        authenticated = APIClient(raise_request_exception=False)
+        authenticated.force_authenticate(viewer)
+        results = []
+        for scenario in self.scenarios(viewer, page_sizes):
+            name, method, url, reset, *data = scenario
+            if name not in QUERY_BUDGETS:
+                raise CommandError(f'No query budget for {name}')
+            clients = (('auth', authenticated),)
+            if reset is None:
+                clients = (('anon', anonymous),) + clients
+            else:
+                reset()
+            for mode, client in clients:
+                def call(client=client, method=method, url=url, data=data):
+                    if data:
+                        return getattr(client, method)(
+                            url, data[0], format='json'
+                        )
+                    response = getattr(client, method)(url)
+                    if response.streaming:
+                        # Файл выгрузки читается, как его читает клиент.
+                        b''.join(response.streaming_content)
+                        response.close()
+                    return response
+
+                stats = measure(call, repeat=options['repeat'], teardown=reset)
+                response = stats.pop('result')
+                stats.update(
+                    name=name,
+                    method=method.upper(),
+                    url=url,
+                    user=mode,
+                    status=response.status_code,
+                    expected=(
+                        401 if mode == 'anon' and name in AUTHENTICATED_ONLY
+                        else STATUS_OVERRIDES.get(
+                            name, EXPECTED_STATUSES[method]
+                        )
+                    ),
+                    budget=QUERY_BUDGETS[name]
+                )
+                results.append(stats)
+        return results
+
+    def report(self, results, json_path=None):
+        widths = (30, 6, 5, 6, 8, 8, 8, 10, 0)
+        self.stdout.write(format_row(
+            ('endpoint', 'method', 'user', 'status', 'queries',
+             'p50 ms', 'p95 ms', 'peak KiB', 'url'),
+            widths
+        ))
+        violations = []
+        failures = []
+        for row in results:
+            over = row['queries'] > row['budget']
+            failed = row['status'] != row['expected']
+            line = format_row(
+                (row['name'], row['method'], row['user'], row['status'],
+                 f"{row['queries']}/{row['budget']}",
+                 f"{row['p50_ms']:.2f}", f"{row['p95_ms']:.2f}",
+                 f"{row['peak_kb']:.0f}", row['url']),
+                widths
+            )
+            if over:
+                violations.append(row)
+            if failed:
+                failures.append(row)
+            if over or failed:
+                line = self.style.ERROR(line)
+            self.stdout.write(line)
+        if json_path:
+            with open(json_path, 'w', encoding='utf-8') as file:
+                json.dump(results, file, ensure_ascii=False, indent=2)
+        errors = []
+        if failures:
+            errors.append('Unexpected status: ' + ', '.join(
+                f"{row['method']} {row['url']} ({row['user']}): "
+                f"{row['status']} != {row['expected']}"
+                for row in failures
+            ))
+        if violations:
+            errors.append('Query budget exceeded: ' + ', '.join(
+                f"{row['method']} {row['url']} ({row['user']}): "
+                f"{row['queries']} > {row['budget']}"
+                for row in violations
+            ))
+        if errors:
+            raise CommandError('; '.join(errors))
+        self.stdout.write(self.style.SUCCESS('Все бюджеты соблюдены!'))
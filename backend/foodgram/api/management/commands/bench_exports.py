@@ -0,0 +1,83 @@
+import tempfile
+import time
+
+from django.core.management import BaseCommand
+from django.test.utils import override_settings
+
+from api import exports
+from api.bench import format_row, seed_dataset, test_database
+from recipes.models import ShoppingListExport
+
+
+class Command(BaseCommand):
+    help = ('Measure throughput of the shopping list export worker pool '
+            'for several pool sizes')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jobs', type=int, default=40)
+        parser.add_argument(
+            '--workers',
+            default='1,2,4',
+            help='Comma separated pool sizes, 0 renders in the process'
+        )
+        parser.add_argument(
+            '--cart',
+            type=int,
+            default=200,
+            help='Recipes in the shopping cart of every export'
+        )
+        parser.add_argument('--format', default='pdf')
+        parser.add_argument('--keepdb', action='store_true')
+
+    def handle(self, *args, **options):
+        widths = (8, 6, 10, 10, 10)
+        with test_database(keepdb=options['keepdb']), \
+                tempfile.TemporaryDirectory() as root, \
+                override_settings(EXPORTS_ROOT=root):
+            viewer = seed_dataset(recipes=options['cart'],
+                                  cart=options['cart'])
+            self.stdout.write(format_row(
+                ('workers', 'jobs', 'total s', 'jobs/s', 'p50 s'), widths
+            ))
+            for workers in options['workers'].split(','):
+                workers = int(workers)
+                with override_settings(EXPORT_WORKERS=max(workers, 1),
+                                       EXPORT_SYNC=workers == 0):
+                    total, latencies = self.run_jobs(viewer, options)
+                latencies.sort()
+                self.stdout.write(format_row(
+                    (workers, options['jobs'], f'{total:.2f}',
+                     f"{options['jobs'] / total:.1f}",
+                     f'{latencies[len(latencies) // 2]:.2f}'),
+                    widths
+                ))
+
+    def run_jobs(self, viewer, options):
+        """Время на все выгрузки и время каждой от создания до файла."""
+        ShoppingListExport.objects.all().delete()
+        pool = exports.get_pool(reset=True)
+        ShoppingListExport.objects.bulk_create(
+            [ShoppingListExport(user=viewer, format=options['format'])
+             for _ in range(options['jobs'])]
+        )
+        jobs = list(ShoppingListExport.objects.order_by('id'))
+        start = time.perf_counter()
+        for job in jobs:
+            exports.run_export(job)
+        unfinished = ShoppingListExport.objects.exclude(
+            status__in=(ShoppingListExport.DONE, ShoppingListExport.FAILED)
+        )
+        while unfinished.exists():
+            time.sleep(0.01)
+        total = time.perf_counter() - start
+        pool.shutdown()
+        failed = ShoppingListExport.objects.filter(
+            status=ShoppingListExport.FAILED
+        ).count()
+        if failed:
+            self.stderr.write(f'С ошибками: {failed}')
+        latencies = [
+            (job.finished - job.created).total_seconds()
+            for job in ShoppingListExport.objects.all()
+        ]
+        return total, latencies
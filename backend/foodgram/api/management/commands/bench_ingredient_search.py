@@ -0,0 +1,152 @@
+import random
+import time
+
+from django.core.management import BaseCommand
+from django.db.models import Count, ExpressionWrapper, F, FloatField
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from api import recipe_index
+from api.bench import (BATCH_SIZE,
+                       format_row,
+                       grow_recipes,
+                       measure,
+                       test_database)
+from api.recipe_index import RecipeIngredientIndex, get_recipe_index
+from recipes.models import Ingredient, IngredientRecipe, Recipe
+from users.models import User
+
+INGREDIENTS = 2000
+# Номера ингредиентов в запросах по частоте: 0 - самый частый.
+QUERIES = ((0,), (0, 1), (0, 5, 20), (3, 40, 200, 900), (1500,),
+           (0, 1, 2, 3, 4, 5, 6, 7))
+
+
+class Command(BaseCommand):
+    help = ('Measure recipe search by ingredients (?ingredients=) with '
+            'the in-memory inverted index against SQL GROUP BY/HAVING')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            default='10000,100000',
+            help='Comma separated numbers of recipes'
+        )
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument('--keepdb', action='store_true')
+
+    def handle(self, *args, **options):
+        sizes = sorted(
+            int(size) for size in options['sizes'].split(',') if size
+        )
+        widths = (10, 18, 10, 8, 10, 10, 10, 10)
+        rnd = random.Random(0)
+        client = APIClient(raise_request_exception=False)
+        with test_database(keepdb=options['keepdb']), override_settings(
+            RECIPES_CACHE_TIMEOUT=0, RECIPE_FRAGMENT_TIMEOUT=0
+        ):
+            author = User.objects.create(
+                email='ingredients@foodgram.bench',
+                username='ingredients-bench',
+                password='!'
+            )
+            Ingredient.objects.bulk_create(
+                [Ingredient(name=f'Ингредиент {index}',
+                            measurement_unit='г')
+                 for index in range(INGREDIENTS)],
+                batch_size=BATCH_SIZE
+            )
+            ingredients = list(
+                Ingredient.objects.order_by('id').values_list('id', flat=True)
+            )
+            total = 0
+            for size in sizes:
+                grow_recipes(author, ingredients, rnd, total, size)
+                total = size
+                self.report_build(size)
+                self.stdout.write(format_row(
+                    ('recipes', 'ingredients', 'mode', 'found', 'index ms',
+                     'api ms', 'sql ms', 'queries'),
+                    widths
+                ))
+                for numbers in QUERIES:
+                    ids = [ingredients[number] for number in numbers]
+                    for mode in recipe_index.MODES:
+                        self.report_query(client, size, ids, numbers, mode,
+                                          widths, options['repeat'])
+                self.report_update(author, ingredients, options['repeat'])
+
+    def report_build(self, size):
+        start = time.perf_counter()
+        index = RecipeIngredientIndex.build()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f'Рецептов: {size}, построение индекса: {elapsed * 1000:.0f} мс, '
+            f'память: {index.nbytes / 1024 / 1024:.1f} МБ'
+        )
+        recipe_index._index = None
+        get_recipe_index()
+
+    def report_query(self, client, size, ids, numbers, mode, widths, repeat):
+        index = get_recipe_index()
+        direct = measure(lambda: index.search(ids, mode), repeat=repeat)
+        api = measure(
+            lambda: client.get('/api/recipes/', {
+                'ingredients': ','.join(map(str, ids)),
+                'ingredients_mode': mode
+            }),
+            repeat=repeat
+        )
+        sql = measure(lambda: self.sql_search(ids, mode), repeat=repeat)
+        self.stdout.write(format_row(
+            (size, ','.join(map(str, numbers)), mode,
+             len(direct['result']), f"{direct['p50_ms']:.2f}",
+             f"{api['p50_ms']:.2f}", f"{sql['p50_ms']:.2f}",
+             api['queries']),
+            widths
+        ))
+
+    def sql_search(self, ids, mode):
+        """Тот же поиск группировкой в базе, первая страница."""
+        matched = IngredientRecipe.objects.filter(
+            ingredient_id__in=ids
+        ).order_by().values('recipe_id').annotate(
+            matched=Count('id', distinct=True)
+        )
+        if mode == 'all':
+            return list(matched.filter(
+                matched=len(ids)
+            ).order_by('-recipe_id')[:6])
+        return list(matched.annotate(
+            size=Count('recipe__ingredient_list', distinct=True)
+        ).annotate(coverage=ExpressionWrapper(
+            F('matched') * 1.0 / F('size'), output_field=FloatField()
+        )).order_by('-coverage', '-matched', '-recipe_id')[:6])
+
+    def report_update(self, author, ingredients, repeat):
+        """Время догона индексом журнала после изменения рецепта."""
+        recipe = Recipe.objects.filter(author=author).order_by('-id').first()
+        rows = list(IngredientRecipe.objects.filter(recipe=recipe))
+
+        def change():
+            IngredientRecipe.objects.filter(recipe=recipe).delete()
+            IngredientRecipe.objects.bulk_create(
+                [IngredientRecipe(recipe=recipe, ingredient_id=pk, amount=1)
+                 for pk in ingredients[:5]]
+            )
+            recipe_index.recipe_ingredients_changed((recipe.pk,))
+
+        def restore():
+            IngredientRecipe.objects.filter(recipe=recipe).delete()
+            IngredientRecipe.objects.bulk_create(rows)
+            recipe_index.recipe_ingredients_changed((recipe.pk,))
+            get_recipe_index()
+
+        index = get_recipe_index()
+        stats = measure(lambda _: get_recipe_index(), repeat=repeat,
+                        setup=change, teardown=restore)
+        self.stdout.write(
+            f'Догон журнала после изменения рецепта: '
+            f'{stats["p50_ms"]:.2f} мс (p95 {stats["p95_ms"]:.2f}), '
+            f'индекс перестроен: {stats["result"] is not index}'
+        )
@@ -0,0 +1,98 @@
+import random
+
+from django.core.management import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from api.bench import (BATCH_SIZE,
+                       BENCH_IMAGE,
+                       format_row,
+                       measure,
+                       test_database)
+from recipes.models import Recipe
+from users.models import User
+
+WORDS = (
+    'курица', 'говядина', 'свинина', 'рыба', 'картофель', 'морковь',
+    'лук', 'чеснок', 'томаты', 'сыр', 'сливки', 'грибы', 'рис', 'гречка',
+    'капуста', 'перец', 'яблоки', 'тесто', 'салат', 'суп', 'запеканка',
+    'пирог', 'котлеты', 'жаркое', 'рагу', 'соус', 'домашний', 'быстрый',
+    'острый', 'сладкий', 'нежный', 'праздничный', 'запечь', 'обжарить',
+    'тушить', 'варить', 'нарезать', 'смешать', 'посолить', 'подавать',
+)
+NEEDLES = ('Борщ украинский с пампушками', 'Пельмени сибирские домашние')
+QUERIES = ('курица', 'запеченная курица с сыром', 'борщ', 'пельмени',
+           'грибной суп', 'несуществующееслово')
+
+
+class Command(BaseCommand):
+    help = ('Measure latency of full-text recipe search (?search=) '
+            'on a test database growing to the given sizes')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            default='10000,100000,1000000',
+            help='Comma separated numbers of recipes'
+        )
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument('--keepdb', action='store_true')
+
+    def handle(self, *args, **options):
+        sizes = sorted(
+            int(size) for size in options['sizes'].split(',') if size
+        )
+        widths = (10, 30, 8, 8, 8, 8)
+        self.stdout.write(format_row(
+            ('recipes', 'query', 'found', 'queries', 'p50 ms', 'p95 ms'),
+            widths
+        ))
+        rnd = random.Random(0)
+        client = APIClient(raise_request_exception=False)
+        with test_database(keepdb=options['keepdb']), override_settings(
+            RECIPES_CACHE_TIMEOUT=0, RECIPE_FRAGMENT_TIMEOUT=0
+        ):
+            author = User.objects.create(
+                email='search@foodgram.bench',
+                username='search-bench',
+                password='!'
+            )
+            total = 0
+            for size in sizes:
+                self.grow(author, rnd, total, size)
+                total = size
+                for query in QUERIES:
+                    stats = measure(
+                        lambda: client.get(
+                            '/api/recipes/', {'search': query}
+                        ),
+                        repeat=options['repeat']
+                    )
+                    self.stdout.write(format_row(
+                        (size, query, stats['result'].data.get('count'),
+                         stats['queries'], f"{stats['p50_ms']:.2f}",
+                         f"{stats['p95_ms']:.2f}"),
+                        widths
+                    ))
+
+    def grow(self, author, rnd, start, size):
+        """Добавление рецептов с номерами от start до size."""
+        for offset in range(start, size, BATCH_SIZE):
+            recipes = []
+            for index in range(offset, min(offset + BATCH_SIZE, size)):
+                if index % 10000 == 0:
+                    name = NEEDLES[index // 10000 % len(NEEDLES)]
+                else:
+                    name = ' '.join(rnd.sample(WORDS, 3)).capitalize()
+                recipes.append(Recipe(
+                    author=author,
+                    name=name,
+                    image=BENCH_IMAGE,
+                    text=' '.join(rnd.choices(WORDS, k=30)),
+                    cooking_time=rnd.randint(5, 180)
+                ))
+            Recipe.objects.bulk_create(recipes)
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE recipes_recipe')
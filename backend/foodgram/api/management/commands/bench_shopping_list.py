@@ -0,0 +1,108 @@
+import time
+import warnings
+from io import BytesIO
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.http import HttpResponse
+from fpdf import FPDF
+
+from api.bench import format_row, measure
+from api.cache import DocumentCache
+from api.renderers import (FONT_PATH,
+                           CSVRenderer,
+                           PDFRenderer,
+                           TextRenderer,
+                           load_font)
+
+
+def make_items(count):
+    return [
+        {'ingredient__name': f'Ингредиент номер {index}',
+         'ingredient__measurement_unit': 'г',
+         'total_amount': index % 500 + 1}
+        for index in range(count)
+    ]
+
+
+def legacy_pdf(items):
+    """Прежний download_shopping_cart: шрифт на каждый запрос и копии."""
+    response = HttpResponse(content_type='application/pdf')
+    buffer = BytesIO()
+    pdf_file = FPDF()
+    pdf_file.add_page()
+    pdf_file.add_font('DejaVuSans', fname=FONT_PATH)
+    pdf_file.set_font('DejaVuSans', size=settings.PDF_SIZE_FONT)
+    pdf_file.cell(settings.CELL_WIDTH, settings.CELL_HEIGHT,
+                  'Shopping List', ln=True, align='C')
+    for item in items:
+        pdf_file.cell(
+            settings.CELL_AUTO_WIDTH,
+            settings.CELL_HEIGHT,
+            txt=(f'{item["total_amount"]}'
+                 f' {item["ingredient__measurement_unit"]}'
+                 f' - {item["ingredient__name"]}'),
+            ln=True
+        )
+    buffer.write(pdf_file.output())
+    pdf_file = buffer.getvalue()
+    buffer.close()
+    response.write(pdf_file)
+    return response
+
+
+def cached(renderer):
+    """Повторное скачивание: документ берётся из кэша процесса."""
+    documents = DocumentCache(settings.SHOPPING_LIST_CACHE_SIZE)
+
+    def call(items):
+        return documents.get_or_render(
+            len(items), lambda: renderer.document(items)
+        )
+    return call
+
+
+class Command(BaseCommand):
+    help = ('Measure render time and peak memory of the shopping list '
+            'in every download format')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            default='10,100,1000',
+            help='Comma separated numbers of shopping list rows'
+        )
+        parser.add_argument('--repeat', type=int, default=10)
+
+    def handle(self, *args, **options):
+        warnings.simplefilter('ignore', DeprecationWarning)
+        start = time.perf_counter()
+        load_font()
+        self.stdout.write(
+            f'Урезание шрифта: {(time.perf_counter() - start) * 1000:.1f} '
+            f'мс, один раз на процесс; разбор - в каждом PDF'
+        )
+        widths = (12, 6, 10, 10, 10)
+        self.stdout.write(format_row(
+            ('format', 'rows', 'p50 ms', 'p95 ms', 'peak KiB'), widths
+        ))
+        modes = (
+            ('legacy pdf', legacy_pdf),
+            ('pdf', PDFRenderer().document),
+            ('pdf cached', cached(PDFRenderer())),
+            ('txt', TextRenderer().document),
+            ('csv', CSVRenderer().document),
+        )
+        for size in options['sizes'].split(','):
+            items = make_items(int(size))
+            for name, func in modes:
+                stats = measure(
+                    func,
+                    repeat=options['repeat'],
+                    setup=lambda items=items: items
+                )
+                self.stdout.write(format_row(
+                    (name, size, f"{stats['p50_ms']:.2f}",
+                     f"{stats['p95_ms']:.2f}", f"{stats['peak_kb']:.0f}"),
+                    widths
+                ))
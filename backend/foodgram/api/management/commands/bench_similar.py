@@ -0,0 +1,134 @@
+import random
+import tempfile
+import time
+
+import numpy as np
+from django.core.management import BaseCommand
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from api import similar
+from api.bench import (BATCH_SIZE,
+                       format_row,
+                       grow_recipes,
+                       measure,
+                       test_database)
+from recipes.models import Ingredient, IngredientRecipe, Recipe
+from users.models import User
+
+INGREDIENTS = 2000
+SAMPLE = 50
+
+
+class Command(BaseCommand):
+    help = ('Measure similar recipes lookups (MinHash/LSH) and their '
+            'recall against exact Jaccard similarity on a growing catalogue')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            default='10000,100000',
+            help='Comma separated numbers of recipes'
+        )
+        parser.add_argument('--repeat', type=int, default=100)
+        parser.add_argument('--limit', type=int, default=6)
+        parser.add_argument('--keepdb', action='store_true')
+
+    def handle(self, *args, **options):
+        sizes = sorted(
+            int(size) for size in options['sizes'].split(',') if size
+        )
+        widths = (10, 10, 10, 10, 10, 10, 10, 10)
+        self.stdout.write(format_row(
+            ('recipes', 'build s', 'disk MB', 'p50 us', 'p95 us',
+             'api ms', 'update ms', 'recall'),
+            widths
+        ))
+        rnd = random.Random(0)
+        client = APIClient(raise_request_exception=False)
+        with test_database(keepdb=options['keepdb']), \
+                tempfile.TemporaryDirectory() as root, \
+                override_settings(SIMILAR_INDEX_ROOT=root,
+                                  RECIPES_CACHE_TIMEOUT=0,
+                                  RECIPE_FRAGMENT_TIMEOUT=0):
+            author = User.objects.create(
+                email='similar@foodgram.bench',
+                username='similar-bench',
+                password='!'
+            )
+            Ingredient.objects.bulk_create(
+                [Ingredient(name=f'Ингредиент {index}',
+                            measurement_unit='г')
+                 for index in range(INGREDIENTS)],
+                batch_size=BATCH_SIZE
+            )
+            ingredients = list(
+                Ingredient.objects.order_by('id').values_list('id', flat=True)
+            )
+            total = 0
+            for size in sizes:
+                grow_recipes(author, ingredients, rnd, total, size)
+                total = size
+                start = time.perf_counter()
+                path = similar.build()
+                built = time.perf_counter() - start
+                disk = sum(file.stat().st_size for file in path.iterdir())
+                index = similar.get_similar_index()
+                recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+                queries = rnd.sample(recipe_ids, SAMPLE)
+                lookup = measure(
+                    lambda: index.similar(
+                        rnd.choice(queries), options['limit']
+                    ),
+                    repeat=options['repeat']
+                )
+                api = measure(
+                    lambda: client.get(
+                        f'/api/recipes/{rnd.choice(queries)}/similar/'
+                    ),
+                    repeat=min(options['repeat'], 20)
+                )
+                update = measure(
+                    lambda: similar.update({rnd.choice(recipe_ids)}),
+                    repeat=min(options['repeat'], 20)
+                )
+                self.stdout.write(format_row(
+                    (size, f'{built:.2f}', f'{disk / 1024 / 1024:.1f}',
+                     f"{lookup['p50_ms'] * 1000:.0f}",
+                     f"{lookup['p95_ms'] * 1000:.0f}",
+                     f"{api['p50_ms']:.2f}", f"{update['p50_ms']:.2f}",
+                     f'{self.recall(index, queries, options["limit"]):.2f}'),
+                    widths
+                ))
+
+    def recall(self, index, queries, limit):
+        """Доля настоящих limit самых похожих рецептов в ответе индекса.
+
+        Точное сходство Жаккара считается перебором всех рецептов.
+        """
+        pairs = np.array(
+            IngredientRecipe.objects.order_by().values_list(
+                'recipe_id', 'ingredient_id'
+            ),
+            dtype=np.int64
+        )
+        recipes = np.unique(pairs[:, 0])
+        sizes = np.bincount(pairs[:, 0])
+        found = total = 0
+        for recipe_id in queries:
+            mine = pairs[pairs[:, 0] == recipe_id, 1]
+            shared = np.bincount(
+                pairs[np.isin(pairs[:, 1], mine), 0], minlength=len(sizes)
+            )[recipes]
+            jaccard = shared / (sizes[recipes] + len(mine) - shared)
+            jaccard[recipes == recipe_id] = 0
+            best = np.sort(jaccard)[::-1][:limit]
+            best = best[best > 0]
+            if not len(best):
+                continue
+            # При равенстве сходства подходит любой рецепт с тем же Жаккаром.
+            ids, _ = index.similar(recipe_id, limit)
+            exact = jaccard[np.searchsorted(recipes, ids)]
+            found += min(np.sum(exact >= best[-1]), len(best))
+            total += len(best)
+        return found / total if total else 1.0
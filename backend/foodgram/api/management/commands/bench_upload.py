@@ -0,0 +1,95 @@
+import base64
+import json
+import os
+from io import BytesIO
+
+from django.core.management import BaseCommand
+from django.test import RequestFactory
+from django.test.client import encode_multipart
+from django.test.utils import override_settings
+from drf_base64.fields import Base64ImageField
+from PIL import Image
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+
+from api.bench import format_row, measure
+from api.parsers import LimitedJSONParser, LimitedMultiPartParser
+from recipes.fields import StreamingImageField
+
+BOUNDARY = 'BenchBoundary'
+MULTIPART_CONTENT = f'multipart/form-data; boundary={BOUNDARY}'
+
+
+def noise_png(size):
+    """PNG из шума примерно заданного размера, почти не сжимается."""
+    side = int((size / 3) ** 0.5)
+    image = Image.frombytes('RGB', (side, side), os.urandom(side * side * 3))
+    buffer = BytesIO()
+    image.save(buffer, 'PNG', compress_level=1)
+    return buffer.getvalue()
+
+
+class Command(BaseCommand):
+    help = ('Measure peak memory of parsing a recipe image upload: '
+            'base64 in JSON (old and streaming field) and multipart')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            default='1,5,9',
+            help='Comma separated image sizes in MiB'
+        )
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        widths = (26, 10, 10, 10, 12)
+        self.stdout.write(format_row(
+            ('mode', 'image MiB', 'p50 ms', 'p95 ms', 'peak MiB'), widths
+        ))
+        factory = RequestFactory()
+        with override_settings(MAX_IMAGE_SIZE=64 * 2 ** 20,
+                               MAX_REQUEST_BODY_SIZE=128 * 2 ** 20):
+            for size in options['sizes'].split(','):
+                content = noise_png(float(size) * 2 ** 20)
+                data_url = ('data:image/png;base64,'
+                            + base64.b64encode(content).decode())
+                json_body = json.dumps({'image': data_url}).encode()
+                upload = BytesIO(content)
+                upload.name = 'bench.png'
+                multipart_body = encode_multipart(BOUNDARY, {'image': upload})
+                modes = (
+                    ('base64 drf_base64', json_body, 'application/json',
+                     JSONParser, Base64ImageField),
+                    ('base64 streaming', json_body, 'application/json',
+                     LimitedJSONParser, StreamingImageField),
+                    ('multipart streaming', multipart_body,
+                     MULTIPART_CONTENT, LimitedMultiPartParser,
+                     StreamingImageField),
+                )
+                for name, body, content_type, parser, field in modes:
+                    def make_request(body=body, content_type=content_type,
+                                     parser=parser):
+                        return Request(
+                            factory.generic(
+                                'POST', '/api/recipes/', body,
+                                content_type=content_type
+                            ),
+                            parsers=[parser()]
+                        )
+
+                    def call(request, field=field):
+                        image = field().to_internal_value(
+                            request.data['image']
+                        )
+                        image.close()
+                        return image
+
+                    stats = measure(
+                        call, repeat=options['repeat'], setup=make_request
+                    )
+                    self.stdout.write(format_row(
+                        (name, f'{len(content) / 2 ** 20:.1f}',
+                         f"{stats['p50_ms']:.1f}", f"{stats['p95_ms']:.1f}",
+                         f"{stats['peak_kb'] / 1024:.1f}"),
+                        widths
+                    ))
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management import BaseCommand
+
+from api.similar import build
+
+
+class Command(BaseCommand):
+    help = ('Build the similar recipes index from recipe ingredients '
+            'after loading data or changing SIMILAR_* settings; requests '
+            'never build it')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        path = build()
+        size = sum(file.stat().st_size for file in path.iterdir())
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово! Индекс: {path}, {size / 1024 / 1024:.1f} МБ, '
+            f'время: {time.perf_counter() - start:.2f} с'
+        ))
@@ -0,0 +1,25 @@
+from django.core.management import BaseCommand
+
+from api.exports import expired_exports
+
+
+class Command(BaseCommand):
+    help = ('Delete shopping list exports and their files older than '
+            'EXPORT_RETENTION_HOURS')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report what would be deleted'
+        )
+
+    def handle(self, *args, **options):
+        exports = expired_exports()
+        if options['dry_run']:
+            self.stdout.write(f'Будет удалено выгрузок: {exports.count()}')
+            return
+        deleted, _ = exports.delete()
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово! Удалено выгрузок: {deleted}'
+        ))
@@ -0,0 +1,52 @@
+import time
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.db.models import Count
+
+from api.exports import requeue_stale, run_export
+from recipes.models import ShoppingListExport
+
+
+class Command(BaseCommand):
+    help = ('Render queued shopping list exports, including ones left '
+            'unfinished by a restarted process')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--timeout',
+            type=int,
+            default=settings.EXPORT_TIMEOUT,
+            help='Seconds to wait for queued exports (EXPORT_TIMEOUT)'
+        )
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale()
+        if requeued:
+            self.stdout.write(f'Возвращено в очередь: {requeued}')
+        jobs = list(ShoppingListExport.objects.filter(
+            status=ShoppingListExport.PENDING
+        ).order_by('created'))
+        start = time.perf_counter()
+        for job in jobs:
+            run_export(job)
+        ids = [job.pk for job in jobs]
+        unfinished = ShoppingListExport.objects.filter(
+            pk__in=ids,
+            status__in=(ShoppingListExport.PENDING,
+                        ShoppingListExport.RUNNING)
+        )
+        deadline = start + options['timeout']
+        while unfinished.exists() and time.perf_counter() < deadline:
+            time.sleep(0.1)
+        finished = dict(ShoppingListExport.objects.filter(
+            pk__in=ids
+        ).values_list('status').annotate(
+            count=Count('id')
+        ).order_by())
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово! Выгрузок: {len(ids)}, готово: '
+            f'{finished.get(ShoppingListExport.DONE, 0)}, с ошибками: '
+            f'{finished.get(ShoppingListExport.FAILED, 0)}, время: '
+            f'{time.perf_counter() - start:.2f} с'
+        ))
@@ -0,0 +1,55 @@
+import time
+
+from django.core.management import BaseCommand
+
+from api.images import get_pool, save_variants, variant_args
+from recipes.images import make_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = ('Create resized WebP/JPEG variants for recipe images that '
+            'do not have them yet')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Reprocess every recipe image'
+        )
+        parser.add_argument('--chunk-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.only('id', 'image').order_by('id')
+        if not options['all']:
+            recipes = recipes.filter(image_variants={})
+        start = time.perf_counter()
+        done = failed = 0
+        pool = get_pool()
+        ids = list(recipes.values_list('id', flat=True))
+        for offset in range(0, len(ids), options['chunk_size']):
+            chunk = list(recipes.filter(
+                id__in=ids[offset:offset + options['chunk_size']]
+            ))
+            futures = [
+                (recipe, pool.submit(make_variants, *variant_args(recipe)))
+                for recipe in chunk
+            ]
+            for recipe, future in futures:
+                try:
+                    result = future.result()
+                except Exception as error:
+                    failed += 1
+                    self.stderr.write(f'{recipe.image.name}: {error}')
+                    continue
+                save_variants(recipe.pk, recipe.image.name, result)
+                done += 1
+            self.stdout.write(
+                f'Обработано картинок: {done + failed} из {len(ids)}',
+                ending='\r'
+            )
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово! Обработано: {done}, с ошибками: {failed}, '
+            f'время: {time.perf_counter() - start:.2f} с'
+        ))
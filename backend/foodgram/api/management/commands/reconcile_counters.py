@@ -0,0 +1,28 @@
+from django.core.management import BaseCommand
+
+from api.cache import RANKING_VERSION_KEY, bump_versions
+from api.counters import reconcile
+
+
+class Command(BaseCommand):
+    help = ('Recount favorites, carts, recipes and subscriptions counters '
+            'that drifted from their tables')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report drifted counters'
+        )
+
+    def handle(self, *args, **options):
+        repaired = reconcile(dry_run=options['dry_run'])
+        for counter, rows in repaired.items():
+            self.stdout.write(f'{counter}: {rows}')
+        if options['dry_run']:
+            return
+        if any(repaired.values()):
+            bump_versions([RANKING_VERSION_KEY])
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово! Исправлено счётчиков: {sum(repaired.values())}'
+        ))
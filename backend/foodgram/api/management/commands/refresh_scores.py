@@ -0,0 +1,37 @@
+import time
+
+from django.core.management import BaseCommand
+
+from api.ranking import refresh
+
+
+class Command(BaseCommand):
+    help = ('Add favorite and shopping cart events to the time-decayed '
+            'recipe popularity scores')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Recount from existing rows and clear the event log'
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=0,
+            help='Repeat every N seconds instead of running once'
+        )
+
+    def handle(self, *args, **options):
+        rebuild = options['rebuild']
+        while True:
+            start = time.perf_counter()
+            changed = refresh(rebuild=rebuild)
+            self.stdout.write(self.style.SUCCESS(
+                f'Готово! Рецептов с новыми баллами: {changed}, '
+                f'время: {time.perf_counter() - start:.2f} с'
+            ))
+            if not options['interval']:
+                return
+            rebuild = False
+            time.sleep(options['interval'])
@@ -1,6 +1,208 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+
+from django.db.models import F, Q
+from django.db.models.constants import LOOKUP_SEP
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Постраничный вывод по курсору.
+
+    Курсор хранит значения полей ordering крайнего объекта страницы,
+    поэтому любая страница - это диапазон по индексу без OFFSET и
+    COUNT(*). Пустые значения считаются наибольшими, как в Postgres.
+    Поля могут идти через связи один к одному: score__popular.
+    """
+    ordering = ()
+    page_size = 6
+    page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def __init__(self, ordering=None):
+        if ordering is not None:
+            self.ordering = ordering
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return page_size if page_size > 0 else self.page_size
+
+    def get_field(self, model, name):
+        *relations, name = name.split(LOOKUP_SEP)
+        for relation in relations:
+            model = model._meta.get_field(relation).related_model
+        return model._meta.get_field(name)
+
+    def get_value(self, instance, name):
+        for attribute in name.split(LOOKUP_SEP):
+            instance = getattr(instance, attribute)
+        return instance
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            if len(cursor['p']) != len(self.fields):
+                raise ValueError
+            position = [
+                None if value is None
+                else self.get_field(model, name).to_python(value)
+                for (name, _), value in zip(self.fields, cursor['p'])
+            ]
+            return position, bool(cursor.get('r'))
+        except (BinasciiError, KeyError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, instance, reverse):
+        position = []
+        for name, _ in self.fields:
+            value = self.get_value(instance, name)
+            position.append(
+                value.isoformat() if hasattr(value, 'isoformat') else value
+            )
+        cursor = json.dumps({'p': position, 'r': int(reverse)})
+        return replace_query_param(
+            self.base_url,
+            self.cursor_query_param,
+            urlsafe_b64encode(cursor.encode('ascii')).decode('ascii')
+        )
+
+    def order_by(self, model, reverse):
+        expressions = []
+        for name, descending in self.fields:
+            nullable = self.get_field(model, name).null
+            if descending != reverse:
+                expressions.append(F(name).desc(nulls_first=nullable))
+            else:
+                expressions.append(F(name).asc(nulls_last=nullable))
+        return expressions
+
+    def after(self, model, position, reverse):
+        """Условие "строго после позиции" в порядке order_by."""
+        condition = Q(pk__in=[])
+        equal = Q()
+        for (name, descending), value in zip(self.fields, position):
+            nullable = self.get_field(model, name).null
+            if descending != reverse:
+                if value is None:
+                    later = Q(**{f'{name}__isnull': False})
+                else:
+                    later = Q(**{f'{name}__lt': value})
+            elif value is None:
+                later = None
+            else:
+                later = Q(**{f'{name}__gt': value})
+                if nullable:
+                    later |= Q(**{f'{name}__isnull': True})
+            if later is not None:
+                condition |= equal & later
+            if value is None:
+                equal &= Q(**{f'{name}__isnull': True})
+            else:
+                equal &= Q(**{name: value})
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        position, reverse = self.start(request, queryset.model)
+        page = self.fetch(queryset, queryset.model, position, reverse)
+        return self.finish(page, position, reverse)
+
+    def start(self, request, model):
+        self.fields = [
+            (name.lstrip('-'), name.startswith('-')) for name in self.ordering
+        ]
+        self.base_url = remove_query_param(
+            request.build_absolute_uri(), self.cursor_query_param
+        )
+        self.limit = self.get_page_size(request)
+        return self.decode_cursor(request, model)
+
+    def fetch(self, queryset, model, position, reverse):
+        """Страница и ещё один объект, чтобы понять, есть ли следующая."""
+        queryset = queryset.order_by(*self.order_by(model, reverse))
+        if position is not None:
+            queryset = queryset.filter(self.after(model, position, reverse))
+        return list(queryset[:self.limit + 1])
+
+    def finish(self, page, position, reverse):
+        has_more = len(page) > self.limit
+        page = page[:self.limit]
+        if reverse:
+            page.reverse()
+        self.next = self.previous = None
+        if page and (has_more or reverse):
+            self.next = self.encode_cursor(page[-1], reverse=False)
+        if page and position is not None and (has_more or not reverse):
+            self.previous = self.encode_cursor(page[0], reverse=True)
+        return page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.next,
+            'previous': self.previous,
+            'results': data
+        })
+
+
+class FeedPagination(KeysetPagination):
+    """Курсор по нескольким querysets с общим порядком, см. api.feed.
+
+    Метаданные полей берутся у модели первого источника, все поля
+    ordering идут в одном направлении. Объекты с одинаковой позицией
+    считаются одним и тем же.
+    """
+    ordering = ('-pub_date', '-recipe_id')
+
+    def position(self, instance):
+        return tuple(
+            (value is None, value) for value in (
+                self.get_value(instance, name) for name, _ in self.fields
+            )
+        )
+
+    def paginate_queryset(self, sources, request, view=None):
+        model = sources[0].model
+        position, reverse = self.start(request, model)
+        page = {}
+        for queryset in sources:
+            for instance in self.fetch(queryset, model, position, reverse):
+                page.setdefault(self.position(instance), instance)
+        descending = self.fields[0][1] != reverse
+        page = [
+            page[key] for key in sorted(page, reverse=descending)
+        ]
+        return self.finish(page, position, reverse)
 
 
 class CustomPagination(PageNumberPagination):
+    """Нумерация страниц или курсор, если передан параметр cursor.
+
+    Курсорный режим доступен во view с атрибутом cursor_ordering.
+    """
     page_size = 6
     page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        ordering = getattr(view, 'cursor_ordering', None)
+        if ordering and self.cursor_query_param in request.query_params:
+            self.keyset = KeysetPagination(ordering)
+            self.keyset.page_size = self.page_size
+            return self.keyset.paginate_queryset(queryset, request, view)
+        self.keyset = None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,56 @@
+from django.conf import settings
+from rest_framework import exceptions, status
+from rest_framework.parsers import JSONParser, MultiPartParser
+from rest_framework.utils import json
+
+
+class RequestTooLarge(exceptions.APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Слишком большой запрос.'
+    default_code = 'request_too_large'
+
+
+def check_content_length(parser_context):
+    """Отказ по заголовку Content-Length до чтения тела запроса."""
+    request = (parser_context or {}).get('request')
+    if request is None:
+        return
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        length = 0
+    if length > settings.MAX_REQUEST_BODY_SIZE:
+        raise RequestTooLarge()
+
+
+class LimitedJSONParser(JSONParser):
+    """JSON не больше MAX_REQUEST_BODY_SIZE, в том числе без Content-Length.
+
+    Байты тела освобождаются до разбора, поэтому в памяти одновременно
+    только текст запроса и результат разбора.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        check_content_length(parser_context)
+        limit = settings.MAX_REQUEST_BODY_SIZE
+        body = stream.read(limit + 1) if stream is not None else b''
+        if len(body) > limit:
+            raise RequestTooLarge()
+        encoding = (parser_context or {}).get(
+            'encoding', settings.DEFAULT_CHARSET
+        )
+        try:
+            text = body.decode(encoding)
+            del body
+            parse_constant = json.strict_constant if self.strict else None
+            return json.loads(text, parse_constant=parse_constant)
+        except ValueError as error:
+            raise exceptions.ParseError(f'JSON parse error - {error}')
+
+
+class LimitedMultiPartParser(MultiPartParser):
+    """Multipart не больше MAX_REQUEST_BODY_SIZE, файлы пишутся на диск."""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        check_content_length(parser_context)
+        return super().parse(stream, media_type, parser_context)
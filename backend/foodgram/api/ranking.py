@@ -0,0 +1,166 @@
+import math
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max
+from django.utils import timezone
+
+from .cache import ranking_changed
+from recipes.models import (Favorite,
+                            RankingEvent,
+                            RankingState,
+                            Recipe,
+                            RecipeScore,
+                            ShoppingCart)
+
+BATCH_SIZE = 1000
+# Модель записей и источник её событий (вес - RANKING_WEIGHTS).
+SOURCES = (
+    (Favorite, RankingEvent.FAVORITE),
+    (ShoppingCart, RankingEvent.SHOPPING_CART),
+)
+# Баллы растут как exp(rate * возраст эпохи); эпоха сдвигается
+# задолго до переполнения float.
+MAX_EXPONENT = 100
+
+
+def get_rates():
+    """Скорость затухания каждого балла по периоду полураспада."""
+    return {
+        'popular': math.log(2) / settings.POPULAR_HALF_LIFE,
+        'trending': math.log(2) / settings.TRENDING_HALF_LIFE,
+    }
+
+
+def add_missing():
+    """Строки баллов для рецептов, созданных в обход сигналов."""
+    missing = Recipe.objects.filter(
+        score__isnull=True
+    ).order_by().values_list('id', flat=True)
+    RecipeScore.objects.bulk_create(
+        [RecipeScore(recipe_id=pk) for pk in missing],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True
+    )
+
+
+def rebase(state, now, rates):
+    """Перенос эпохи на now: все баллы умножаются на exp(-rate * age)."""
+    age = (now - state.epoch).total_seconds()
+    RecipeScore.objects.update(**{
+        name: F(name) * math.exp(-rate * age)
+        for name, rate in rates.items()
+    })
+    state.epoch = now
+
+
+def record(instance, sign):
+    """Событие журнала в транзакции, изменившей избранное или корзину.
+
+    Время события - время добавления записи, поэтому удаление вычитает
+    ровно столько, сколько добавила запись.
+    """
+    source = dict(SOURCES)[type(instance)]
+    RankingEvent.objects.create(
+        recipe_id=instance.recipe_id,
+        source=source,
+        sign=sign,
+        happened=instance.created
+    )
+
+
+def add_weights(weights, events, epoch, rates):
+    """Вес событий (рецепт, источник, знак, время) в масштабе эпохи."""
+    for recipe_id, source, sign, happened in events:
+        age = (happened - epoch).total_seconds()
+        weight = sign * settings.RANKING_WEIGHTS[source]
+        scores = weights[recipe_id]
+        for name, rate in rates.items():
+            scores[name] += weight * math.exp(rate * age)
+
+
+def new_events(epoch, rates):
+    """Вес событий журнала RankingEvent по рецептам.
+
+    События читаются пачками и удаляются в той же транзакции, поэтому
+    каждое учитывается один раз, а зафиксированные позже начала
+    пересчёта (с меньшим id тоже) остаются следующему пересчёту.
+    """
+    weights = defaultdict(lambda: dict.fromkeys(rates, 0.0))
+    last = RankingEvent.objects.aggregate(last=Max('id'))['last'] or 0
+    while True:
+        events = list(RankingEvent.objects.filter(
+            id__lte=last
+        ).order_by('id').values_list(
+            'id', 'recipe_id', 'source', 'sign', 'happened'
+        )[:BATCH_SIZE])
+        if not events:
+            return weights
+        add_weights(weights, [event[1:] for event in events], epoch, rates)
+        RankingEvent.objects.filter(
+            id__in=[event[0] for event in events]
+        ).delete()
+
+
+def live_weights(epoch, rates):
+    """Вес всех существующих избранного и корзин, для rebuild."""
+    weights = defaultdict(lambda: dict.fromkeys(rates, 0.0))
+    for model, source in SOURCES:
+        rows = model.objects.order_by().values_list('recipe_id', 'created')
+        add_weights(
+            weights,
+            ((recipe_id, source, 1, created)
+             for recipe_id, created in rows.iterator(chunk_size=BATCH_SIZE)),
+            epoch, rates
+        )
+    return weights
+
+
+def add_scores(weights):
+    ids = list(weights)
+    for offset in range(0, len(ids), BATCH_SIZE):
+        scores = RecipeScore.objects.in_bulk(ids[offset:offset + BATCH_SIZE])
+        for recipe_id, score in scores.items():
+            for name, weight in weights[recipe_id].items():
+                # Удаление вычитает то же, что добавила запись; max
+                # убирает только ошибку округления.
+                setattr(score, name, max(getattr(score, name) + weight, 0))
+        RecipeScore.objects.bulk_update(scores.values(), tuple(get_rates()))
+
+
+def refresh(rebuild=False):
+    """Учёт событий избранного и корзин в баллах RecipeScore.
+
+    Балл - сумма весов записей, затухающих с периодом полураспада
+    POPULAR_HALF_LIFE или TRENDING_HALF_LIFE от времени добавления.
+    Вместо уменьшения всех баллов запись весит exp(rate * (время
+    добавления - эпоха)), поэтому пересчёт касается только рецептов из
+    журнала, а порядок баллов тот же, что у затухающих. Удаление
+    записи вычитает её вес. rebuild считает баллы заново по
+    существующим записям и очищает журнал. Возвращает число рецептов
+    с новыми баллами.
+    """
+    now = timezone.now()
+    RankingState.objects.get_or_create(pk=1, defaults={'epoch': now})
+    rates = get_rates()
+    with transaction.atomic():
+        state = RankingState.objects.select_for_update().get(pk=1)
+        if rebuild:
+            RecipeScore.objects.update(popular=0, trending=0)
+            RankingEvent.objects.all().delete()
+            state.epoch = now
+        age = (now - state.epoch).total_seconds()
+        if max(rates.values()) * age > MAX_EXPONENT:
+            rebase(state, now, rates)
+        add_missing()
+        if rebuild:
+            weights = live_weights(state.epoch, rates)
+        else:
+            weights = new_events(state.epoch, rates)
+        add_scores(weights)
+        state.refreshed = now
+        state.save()
+        if weights or rebuild:
+            ranking_changed()
+    return len(weights)
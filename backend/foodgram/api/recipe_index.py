@@ -0,0 +1,278 @@
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from recipes.models import IngredientRecipe, RecipeIndexChange
+
+MODES = ('all', 'coverage')
+EMPTY = np.empty(0, dtype=np.int64)
+# Сколько найденных id передаётся в базу одним запросом (см. filter_found).
+FILTER_CHUNK_SIZE = 900
+PRUNE_INTERVAL = 60
+
+_index = None
+_pending = threading.local()
+_pruned_at = float('-inf')
+
+
+def encode(ids):
+    """Отсортированные id: первый id и разности в наименьшем типе."""
+    if not len(ids):
+        return 0, np.empty(0, dtype=np.uint8)
+    deltas = np.diff(ids)
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if not len(deltas) or deltas.max() <= np.iinfo(dtype).max:
+            return int(ids[0]), deltas.astype(dtype)
+    return int(ids[0]), deltas.astype(np.uint64)
+
+
+def decode(postings):
+    first, deltas = postings
+    ids = np.empty(len(deltas) + 1, dtype=np.int64)
+    ids[0] = first
+    np.cumsum(deltas, dtype=np.int64, out=ids[1:])
+    ids[1:] += first
+    return ids
+
+
+class RecipeIngredientIndex:
+    """Обратный индекс ингредиент -> id рецептов в памяти процесса.
+
+    Списки рецептов отсортированы и сжаты разностями соседних id
+    (см. encode), пересечения и подсчёт совпадений - в NumPy. Для
+    изменения рецепта хранятся пары (рецепт, ингредиент), по которым
+    индекс построен, и ингредиенты изменённых после этого рецептов.
+    checked - время, с которого читается журнал RecipeIndexChange,
+    seen - уже учтённые записи журнала за RECIPE_INDEX_COMMIT_GRACE.
+    """
+
+    def __init__(self, rows, checked=None):
+        pairs = np.array(rows, dtype=np.int64).reshape(-1, 2)
+        recipes, ingredients = pairs[:, 0], pairs[:, 1]
+        self.checked = checked
+        self.seen = set()
+        # Пары один раз отсортированы по ингредиенту и по рецепту.
+        by_ingredient = np.unique((ingredients << 32) | recipes)
+        self.recipe_keys = np.unique((recipes << 32) | ingredients)
+        self.sizes = np.bincount(
+            self.recipe_keys >> 32
+        ).astype(np.uint16)
+        self.changed = {}
+        self.postings = {}
+        keys = by_ingredient >> 32
+        bounds = np.flatnonzero(np.diff(keys)) + 1
+        for chunk in np.split(by_ingredient, bounds):
+            if len(chunk):
+                self.postings[int(chunk[0] >> 32)] = encode(
+                    chunk & 0xffffffff
+                )
+
+    @classmethod
+    def build(cls):
+        checked = timezone.now()
+        return cls(
+            list(IngredientRecipe.objects.order_by().values_list(
+                'recipe_id', 'ingredient_id'
+            )),
+            checked
+        )
+
+    @property
+    def nbytes(self):
+        return (
+            self.recipe_keys.nbytes + self.sizes.nbytes
+            + sum(deltas.nbytes for _, deltas in self.postings.values())
+        )
+
+    def recipes(self, ingredient_id):
+        postings = self.postings.get(ingredient_id)
+        return EMPTY if postings is None else decode(postings)
+
+    def ingredients(self, recipe_id):
+        """Ингредиенты рецепта, по которым он сейчас в индексе."""
+        if recipe_id in self.changed:
+            return self.changed[recipe_id]
+        start, end = np.searchsorted(
+            self.recipe_keys, (recipe_id << 32, (recipe_id + 1) << 32)
+        )
+        return frozenset(
+            int(key) for key in self.recipe_keys[start:end] & 0xffffffff
+        )
+
+    def update(self, recipe_ids):
+        """Перечитывание ингредиентов рецептов из базы.
+
+        Повторное обновление того же рецепта ничего не меняет,
+        удалённые рецепты пропадают из индекса.
+        """
+        new = {pk: set() for pk in recipe_ids}
+        for recipe_id, ingredient_id in IngredientRecipe.objects.filter(
+            recipe_id__in=new
+        ).values_list('recipe_id', 'ingredient_id'):
+            new[recipe_id].add(ingredient_id)
+        affected = {}
+        for recipe_id, ingredients in new.items():
+            for ingredient_id in self.ingredients(recipe_id) | ingredients:
+                affected.setdefault(ingredient_id, set()).add(recipe_id)
+        for ingredient_id, recipes in affected.items():
+            # Список уже отсортирован: позиции ищутся двоичным поиском.
+            ids = self.recipes(ingredient_id)
+            recipes = np.array(sorted(recipes), dtype=np.int64)
+            positions = np.searchsorted(ids, recipes)
+            found = positions < len(ids)
+            found[found] = ids[positions[found]] == recipes[found]
+            ids = np.delete(ids, positions[found])
+            added = recipes[[ingredient_id in new[pk] for pk in recipes]]
+            ids = np.insert(ids, np.searchsorted(ids, added), added)
+            self.postings[ingredient_id] = encode(ids)
+        if max(new, default=0) >= len(self.sizes):
+            self.sizes = np.pad(
+                self.sizes, (0, max(new) + 1 - len(self.sizes))
+            )
+        for recipe_id, ingredients in new.items():
+            self.changed[recipe_id] = frozenset(ingredients)
+            self.sizes[recipe_id] = len(ingredients)
+
+    def search(self, ingredient_ids, mode='all'):
+        """id рецептов по ингредиентам.
+
+        all - рецепты со всеми ингредиентами, новые сначала; coverage -
+        с любым из них, сначала те, у которых больше доля своих
+        ингредиентов из списка, затем больше совпадений.
+        """
+        lists = [self.recipes(pk) for pk in ingredient_ids]
+        if not lists:
+            return EMPTY
+        if mode == 'all':
+            lists.sort(key=len)
+            found = lists[0]
+            for ids in lists[1:]:
+                if not len(found):
+                    break
+                found = np.intersect1d(found, ids, assume_unique=True)
+            return found[::-1]
+        found, matched = np.unique(np.concatenate(lists), return_counts=True)
+        coverage = matched / self.sizes[found]
+        return found[np.lexsort((-found, -matched, -coverage))]
+
+
+def log_changes():
+    """Одна запись журнала на рецепт за транзакцию.
+
+    Рецепты копятся в _pending до фиксации; первый колбэк on_commit
+    пишет их все, остальные ничего не делают. После отката рецепты
+    попадут в журнал со следующей транзакцией, что безвредно.
+    Записи старше RECIPE_INDEX_CHANGES_TIMEOUT удаляются не чаще раза
+    в PRUNE_INTERVAL секунд.
+    """
+    global _pruned_at
+    recipe_ids = getattr(_pending, 'recipe_ids', None)
+    if not recipe_ids:
+        return
+    _pending.recipe_ids = set()
+    now = timezone.now()
+    RecipeIndexChange.objects.bulk_create(
+        [RecipeIndexChange(recipe_id=pk, changed=now) for pk in recipe_ids]
+    )
+    if time.monotonic() - _pruned_at > PRUNE_INTERVAL:
+        _pruned_at = time.monotonic()
+        RecipeIndexChange.objects.filter(changed__lt=now - timedelta(
+            seconds=settings.RECIPE_INDEX_CHANGES_TIMEOUT
+        )).delete()
+
+
+def recipe_ingredients_changed(recipe_ids):
+    """Запись изменённых рецептов в журнал после фиксации.
+
+    Время записи - почти время фиксации, поэтому индексы процессов
+    читают журнал по времени, а не по id.
+    """
+    recipe_ids = set(recipe_ids)
+    if recipe_ids:
+        if not hasattr(_pending, 'recipe_ids'):
+            _pending.recipe_ids = set()
+        _pending.recipe_ids.update(recipe_ids)
+        transaction.on_commit(log_changes)
+
+
+def get_recipe_index():
+    """Индекс процесса, догоняющий журнал изменений рецептов.
+
+    Записи журнала читаются с времени прошлой проверки минус
+    RECIPE_INDEX_COMMIT_GRACE; обновление рецепта повторять можно,
+    поэтому поздние записи не теряются. Если журнал мог быть очищен
+    или в нём больше RECIPE_INDEX_MAX_CHANGES новых записей, индекс
+    строится заново.
+    """
+    global _index
+    now = timezone.now()
+    grace = timedelta(seconds=settings.RECIPE_INDEX_COMMIT_GRACE)
+    if _index is not None and now - _index.checked > timedelta(
+        seconds=settings.RECIPE_INDEX_CHANGES_TIMEOUT
+    ) - grace:
+        _index = None
+    if _index is not None:
+        limit = settings.RECIPE_INDEX_MAX_CHANGES + len(_index.seen)
+        changes = list(RecipeIndexChange.objects.filter(
+            changed__gte=_index.checked - grace
+        ).order_by('id').values_list('id', 'recipe_id')[:limit + 1])
+        if len(changes) > limit:
+            _index = None
+        else:
+            recipe_ids = {
+                recipe_id for pk, recipe_id in changes
+                if pk not in _index.seen
+            }
+            if recipe_ids:
+                _index.update(recipe_ids)
+            _index.seen = {pk for pk, _ in changes}
+            _index.checked = now
+    if _index is None:
+        _index = RecipeIngredientIndex.build()
+    return _index
+
+
+def filter_found(found, queryset):
+    """Найденные id, которые есть в queryset, в том же порядке.
+
+    id передаются в базу пачками по FILTER_CHUNK_SIZE, поэтому
+    читаются только строки найденных рецептов, а не весь результат
+    остальных фильтров.
+    """
+    keep = np.zeros(len(found), dtype=bool)
+    for offset in range(0, len(found), FILTER_CHUNK_SIZE):
+        chunk = found[offset:offset + FILTER_CHUNK_SIZE]
+        matched = queryset.filter(
+            id__in=chunk.tolist()
+        ).order_by().values_list('id', flat=True)
+        keep[offset:offset + len(chunk)] = np.isin(chunk, list(matched))
+    return found[keep]
+
+
+def parse_ingredients(request):
+    """id из ?ingredients=1,2,3 (или повторённого параметра) и режим."""
+    try:
+        ids = list(dict.fromkeys(
+            int(value)
+            for values in request.query_params.getlist('ingredients')
+            for value in values.split(',') if value.strip()
+        ))
+    except ValueError:
+        raise ValidationError({'ingredients': ['Ожидаются id через запятую.']})
+    if len(ids) > settings.INGREDIENT_SEARCH_MAX_INGREDIENTS:
+        raise ValidationError({'ingredients': [
+            f'Не больше {settings.INGREDIENT_SEARCH_MAX_INGREDIENTS} '
+            f'ингредиентов.'
+        ]})
+    mode = request.query_params.get('ingredients_mode', 'all')
+    if mode not in MODES:
+        raise ValidationError({'ingredients_mode': [
+            f'Допустимые значения: {", ".join(MODES)}.'
+        ]})
+    return ids, mode
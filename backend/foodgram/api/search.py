@@ -0,0 +1,116 @@
+import time
+from bisect import bisect_left, bisect_right
+
+from django.conf import settings
+from django.db.models import Count, Max
+
+from .cache import (CATALOG_VERSION_KEY,
+                    GENERATION_KEY,
+                    INGREDIENTS_VERSION_KEY,
+                    bump_versions,
+                    get_versions)
+from recipes.models import Ingredient
+
+
+def normalize(value):
+    """Название для сравнения: без регистра, ё равно е, одиночные пробелы."""
+    return ' '.join(value.casefold().replace('ё', 'е').split())
+
+
+class IngredientIndex:
+    """Неизменяемый индекс названий ингредиентов в памяти процесса.
+
+    Совпадения по началу названия ищутся бинарным поиском по
+    отсортированному списку, вхождения в середину - str.find по
+    склеенным названиям. Сначала идут совпадения по началу, всего
+    не больше limit.
+    """
+
+    def __init__(self, rows, version=None):
+        entries = sorted(
+            (normalize(name), name, pk, unit) for pk, name, unit in rows
+        )
+        self.version = version
+        self.watermark = (
+            len(entries), max((entry[2] for entry in entries), default=None)
+        )
+        self.check_at = (
+            time.monotonic() + settings.INGREDIENT_INDEX_CHECK_INTERVAL
+        )
+        self.keys = [entry[0] for entry in entries]
+        self.items = [
+            {'id': pk, 'name': name, 'measurement_unit': unit}
+            for _, name, pk, unit in entries
+        ]
+        self.offsets = []
+        offset = 0
+        for key in self.keys:
+            self.offsets.append(offset)
+            offset += len(key) + 1
+        self.text = '\n'.join(self.keys)
+
+    @classmethod
+    def build(cls, version=None):
+        return cls(
+            Ingredient.objects.order_by().values_list(
+                'id', 'name', 'measurement_unit'
+            ),
+            version
+        )
+
+    def __len__(self):
+        return len(self.keys)
+
+    def search(self, value, limit):
+        query = normalize(value)
+        if not query:
+            return self.items[:limit]
+        start = bisect_left(self.keys, query)
+        end = bisect_right(self.keys, query + '\U0010ffff', lo=start)
+        found = self.items[start:min(end, start + limit)]
+        position = self.text.find(query)
+        while position != -1 and len(found) < limit:
+            index = bisect_right(self.offsets, position) - 1
+            if start <= index < end:
+                index = end - 1
+            else:
+                found.append(self.items[index])
+            if index + 1 == len(self.offsets):
+                break
+            position = self.text.find(query, self.offsets[index + 1])
+        return found
+
+
+_index = None
+
+
+def watermark():
+    """Число ингредиентов и наибольший id в базе."""
+    values = Ingredient.objects.aggregate(count=Count('id'), last=Max('id'))
+    return values['count'], values['last']
+
+
+def get_ingredient_index():
+    """Индекс, перестраиваемый при смене версии справочника ингредиентов.
+
+    Версия лежит в общем кэше. Раз в INGREDIENT_INDEX_CHECK_INTERVAL
+    секунд индекс ещё сверяет число и наибольший id ингредиентов с
+    базой: загрузку в обход сигналов видят все процессы.
+    """
+    global _index
+    version = get_versions([INGREDIENTS_VERSION_KEY])[INGREDIENTS_VERSION_KEY]
+    if (_index is not None and _index.version == version
+            and time.monotonic() >= _index.check_at):
+        _index.check_at = (
+            time.monotonic() + settings.INGREDIENT_INDEX_CHECK_INTERVAL
+        )
+        if watermark() != _index.watermark:
+            bump_versions(
+                [GENERATION_KEY, CATALOG_VERSION_KEY, INGREDIENTS_VERSION_KEY]
+            )
+            version = get_versions(
+                [INGREDIENTS_VERSION_KEY]
+            )[INGREDIENTS_VERSION_KEY]
+    if _index is None or _index.version != version:
+        _index = IngredientIndex.build(version)
+    return _index
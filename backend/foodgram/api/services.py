@@ -1,12 +1,163 @@
 from distutils.util import strtobool
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import (Case, F, IntegerField, Q, Sum, Value, When,
+                              Window)
+from django.db.models.functions import RowNumber
 from django_filters import rest_framework
 
-from recipes.models import Favorite, Recipe, ShoppingCart, Tag
+from .cache import (CART_VERSION_KEY,
+                    INGREDIENTS_VERSION_KEY,
+                    RANKING_VERSION_KEY,
+                    get_documents,
+                    get_versions)
+from .viewer import ViewerContext
+from recipes.models import IngredientRecipe, Recipe, Tag
 
 CHOICES_LIST = (
     ('0', 'False'),
     ('1', 'True')
 )
+# Порядок рецептов по ?ordering=; он же - поля курсора. popular и
+# trending - баллы RecipeScore, см. api.ranking.
+RECIPE_ORDERINGS = {
+    'new': ('-pub_date', 'id'),
+    'favorites': ('-favorites_count', '-pub_date', 'id'),
+    'popular': ('-score__popular', 'id'),
+    'trending': ('-score__trending', 'id'),
+}
+# Порядки по счётчикам и баллам, которые меняются без изменения рецептов.
+RANKED_ORDERINGS = ('favorites', 'popular', 'trending')
+
+
+def recipe_ordering(request):
+    return RECIPE_ORDERINGS.get(
+        request.query_params.get('ordering'), RECIPE_ORDERINGS['new']
+    )
+
+
+def ranking_keys(request):
+    """Версия счётчиков для ETag списков, упорядоченных по ним."""
+    if request.query_params.get('ordering') in RANKED_ORDERINGS:
+        return [RANKING_VERSION_KEY]
+    return []
+
+
+def search_recipes(queryset, value):
+    """Полнотекстовый поиск по названию и описанию рецепта.
+
+    В Postgres - по поддерживаемому триггером search_vector с GIN-индексом
+    и русской морфологией, в остальных базах - по вхождению слов.
+    Результаты упорядочены по релевантности.
+    """
+    value = value.strip()
+    if not value:
+        return queryset
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(
+            value,
+            config=settings.SEARCH_CONFIG,
+            search_type='websearch'
+        )
+        return queryset.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query)
+        ).order_by('-rank', '-pub_date', 'id')
+    condition = Q()
+    rank = Value(0)
+    for word in value.split():
+        # LIKE в SQLite не учитывает регистр только для латиницы.
+        in_name = in_text = Q()
+        for form in {word.lower(), word.capitalize()}:
+            in_name |= Q(name__icontains=form)
+            in_text |= Q(text__icontains=form)
+        condition &= in_name | in_text
+        rank += Case(
+            When(in_name, then=Value(2)),
+            default=Value(1),
+            output_field=IntegerField()
+        )
+    return queryset.filter(condition).annotate(
+        rank=rank
+    ).order_by('-rank', '-pub_date', 'id')
+
+
+def recipes_limit(request):
+    """recipes_limit из запроса в пределах настроек."""
+    try:
+        limit = int(request.query_params['recipes_limit'])
+    except (KeyError, ValueError):
+        return settings.SUBSCRIPTIONS_RECIPES_LIMIT
+    return min(max(limit, 0), settings.SUBSCRIPTIONS_MAX_RECIPES_LIMIT)
+
+
+def similar_limit(request):
+    """limit похожих рецептов из запроса в пределах настроек."""
+    try:
+        limit = int(request.query_params['limit'])
+    except (KeyError, ValueError):
+        return settings.SIMILAR_LIMIT
+    return min(max(limit, 0), settings.SIMILAR_MAX_LIMIT)
+
+
+def first_recipes(author_ids, limit):
+    """Первые limit рецептов каждого автора одним запросом.
+
+    Номер рецепта у автора считает оконная функция ROW_NUMBER, из
+    базы приходят только нужные строки. Возвращает {id автора: рецепты}.
+    """
+    recipes = {pk: [] for pk in author_ids}
+    if not recipes or limit <= 0:
+        return recipes
+    ranked = Recipe.objects.filter(author_id__in=recipes).only(
+        'id', 'author_id', 'name', 'image', 'image_variants', 'cooking_time'
+    ).annotate(recipe_rank=Window(
+        RowNumber(),
+        partition_by=(F('author_id'),),
+        order_by=(F('pub_date').desc(), F('id').asc())
+    )).order_by()
+    sql, params = ranked.query.sql_with_params()
+    for recipe in Recipe.objects.raw(
+        f'SELECT * FROM ({sql}) ranked WHERE recipe_rank <= %s '
+        f'ORDER BY author_id, recipe_rank',
+        (*params, limit)
+    ):
+        recipes[recipe.author_id].append(recipe)
+    return recipes
+
+
+def shopping_list(user):
+    """Ингредиенты из корзины пользователя с суммарным количеством.
+
+    Считается одним запросом с группировкой в базе, порядок - по названию
+    и единице измерения.
+    """
+    return IngredientRecipe.objects.filter(
+        recipe__shop_cart__user=user
+    ).values(
+        'ingredient__name',
+        'ingredient__measurement_unit'
+    ).annotate(
+        total_amount=Sum('amount')
+    ).order_by('ingredient__name', 'ingredient__measurement_unit')
+
+
+def render_shopping_list(user, renderer):
+    """Список покупок в формате renderer.
+
+    Документ кэшируется по пользователю, версиям корзины и справочника
+    ингредиентов и формату, поэтому повторное скачивание без изменений
+    корзины обходится чтением версий из кэша.
+    """
+    cart_key = CART_VERSION_KEY.format(user.pk)
+    versions = get_versions([cart_key, INGREDIENTS_VERSION_KEY])
+    key = (user.pk, versions[cart_key], versions[INGREDIENTS_VERSION_KEY],
+           renderer.format)
+    return get_documents().get_or_render(
+        key,
+        lambda: renderer.document(shopping_list(user).iterator())
+    )
 
 
 class RecipeFilter(rest_framework.FilterSet):
@@ -27,15 +178,30 @@ class RecipeFilter(rest_framework.FilterSet):
         to_field_name='slug',
         queryset=Tag.objects.all()
     )
+    search = rest_framework.CharFilter(method='filter_search')
+    ordering = rest_framework.ChoiceFilter(
+        choices=[(name, name) for name in RECIPE_ORDERINGS],
+        method='filter_ordering'
+    )
+
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
+    def filter_ordering(self, queryset, name, value):
+        if value in ('popular', 'trending'):
+            queryset = queryset.filter(
+                score__isnull=False
+            ).select_related('score')
+        return queryset.order_by(*RECIPE_ORDERINGS[value])
 
     def filter_is_favorited(self, queryset, name, value):
 
         if self.request.user.is_anonymous:
             return queryset.none()
 
-        favorites = Favorite.objects.filter(
-            user=self.request.user
-        ).values_list('recipe__id', flat=True)
+        favorites = ViewerContext.for_request(
+            self.request
+        ).lookup('favorite')
         if strtobool(value):
             return queryset.filter(id__in=favorites)
         return queryset.exclude(id__in=favorites)
@@ -45,9 +211,9 @@ class RecipeFilter(rest_framework.FilterSet):
         if self.request.user.is_anonymous:
             return queryset.none()
 
-        shopping_cart = ShoppingCart.objects.filter(
-            user=self.request.user
-        ).values_list('recipe__id', flat=True)
+        shopping_cart = ViewerContext.for_request(
+            self.request
+        ).lookup('shopping_cart')
         if strtobool(value):
             return queryset.filter(id__in=shopping_cart)
         return queryset.exclude(id__in=shopping_cart)
@@ -0,0 +1,166 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import (INGREDIENTS_VERSION_KEY,
+                    TAGS_VERSION_KEY,
+                    carts_changed,
+                    ranking_changed,
+                    recipes_changed,
+                    viewer_changed)
+from .counters import change, delta
+from .exports import release_export
+from .feed import after_commit, fan_out, follow, leave_pull_mode, unfollow
+from .images import release_image
+from .ranking import record
+from .recipe_index import recipe_ingredients_changed
+from .similar import similar_changed
+from recipes.models import (Favorite,
+                            Ingredient,
+                            IngredientRecipe,
+                            Recipe,
+                            RecipeScore,
+                            ShoppingCart,
+                            ShoppingListExport,
+                            Tag)
+from users.models import Subscribe, User
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    recipes_changed(recipe_ids=(instance.pk,))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(sender, instance, created, **kwargs):
+    if created:
+        after_commit(fan_out, instance.pk, instance.author_id)
+        RecipeScore.objects.create(recipe=instance)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipes_counted(sender, instance, signal, created=False, **kwargs):
+    change(User, instance.author_id, 'recipes_count',
+           delta(signal, created))
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    release_image(instance.image.name, instance.image_variants)
+
+
+@receiver(post_save, sender=IngredientRecipe)
+@receiver(post_delete, sender=IngredientRecipe)
+@receiver(post_save, sender=Recipe.tags.through)
+@receiver(post_delete, sender=Recipe.tags.through)
+def recipe_relation_changed(sender, instance, **kwargs):
+    recipes_changed(recipe_ids=(instance.recipe_id,))
+
+
+@receiver(post_save, sender=IngredientRecipe)
+@receiver(post_delete, sender=IngredientRecipe)
+def recipe_ingredient_changed(sender, instance, **kwargs):
+    carts_changed(recipe_ids=(instance.recipe_id,))
+    recipe_ingredients_changed((instance.recipe_id,))
+    similar_changed((instance.recipe_id,))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tag_changed(sender, **kwargs):
+    recipes_changed(catalog=(TAGS_VERSION_KEY,))
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    recipes_changed(catalog=(INGREDIENTS_VERSION_KEY,))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set,
+                        **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        recipes_changed(recipe_ids=(instance.pk,))
+    elif pk_set:
+        recipes_changed(recipe_ids=pk_set)
+    else:
+        recipes_changed(catalog=(TAGS_VERSION_KEY,))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def author_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) == {'last_login'}:
+        return
+    recipes_changed(author_id=instance.pk)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_save, sender=Subscribe)
+@receiver(post_delete, sender=Subscribe)
+def viewer_relation_changed(sender, instance, **kwargs):
+    viewer_changed(instance.user_id)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+def favorites_counted(sender, instance, signal, created=False, **kwargs):
+    change(Recipe, instance.recipe_id, 'favorites_count',
+           delta(signal, created))
+    ranking_changed()
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+def ranking_event(sender, instance, signal, created=False, **kwargs):
+    sign = delta(signal, created)
+    if sign:
+        record(instance, sign)
+
+
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+def carts_counted(sender, instance, signal, created=False, **kwargs):
+    change(Recipe, instance.recipe_id, 'cart_count', delta(signal, created))
+
+
+@receiver(post_save, sender=Subscribe)
+@receiver(post_delete, sender=Subscribe)
+def subscriptions_counted(sender, instance, signal, created=False,
+                          **kwargs):
+    change(User, instance.author_id, 'followers_count',
+           delta(signal, created))
+    change(User, instance.user_id, 'following_count',
+           delta(signal, created))
+
+
+@receiver(post_save, sender=Subscribe)
+def subscribed(sender, instance, created, **kwargs):
+    if created:
+        after_commit(follow, instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Subscribe)
+def unsubscribed(sender, instance, **kwargs):
+    unfollow(instance.user_id, instance.author_id)
+    after_commit(leave_pull_mode, instance.author_id)
+
+
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+def shopping_cart_changed(sender, instance, **kwargs):
+    carts_changed(user_ids=(instance.user_id,))
+
+
+@receiver(post_delete, sender=ShoppingListExport)
+def export_deleted(sender, instance, **kwargs):
+    release_export(instance)
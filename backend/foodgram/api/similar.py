@@ -0,0 +1,434 @@
+import fcntl
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+
+from .background import SIMILAR, get_writer
+from recipes.models import IngredientRecipe, Recipe
+
+logger = logging.getLogger(__name__)
+
+# Рецептов на пачку при построении подписей.
+BATCH_SIZE = 10000
+SEED = 0
+MIX = np.uint64(0x9E3779B97F4A7C15)
+CURRENT = 'CURRENT'
+SIGNATURES = 'signatures.bin'
+EXTRA = 'extra.bin'
+EMPTY = np.empty(0, dtype=np.int64)
+
+_local = threading.local()
+_index = None
+
+
+def get_meta():
+    return {
+        'permutations': settings.SIMILAR_PERMUTATIONS,
+        'band_rows': settings.SIMILAR_BAND_ROWS,
+        'seed': SEED,
+    }
+
+
+def get_hashes():
+    """Коэффициенты хешей a * x + b: одни и те же во всех процессах."""
+    rnd = np.random.default_rng(SEED)
+    size = settings.SIMILAR_PERMUTATIONS
+    return (
+        rnd.integers(1, 2 ** 63, size=size, dtype=np.uint64) | np.uint64(1),
+        rnd.integers(0, 2 ** 63, size=size, dtype=np.uint64)
+    )
+
+
+def signatures(pairs, hashes):
+    """Подписи MinHash по парам (рецепт, ингредиент).
+
+    Пары отсортированы по рецепту. Хеш - старшие 32 бита
+    a * x + b по модулю 2 ** 64, минимум по ингредиентам рецепта
+    считает np.minimum.reduceat. Возвращает id рецептов и подписи.
+    """
+    if not len(pairs):
+        return EMPTY, np.empty(
+            (0, settings.SIMILAR_PERMUTATIONS), dtype=np.uint32
+        )
+    recipes = pairs[:, 0]
+    starts = np.flatnonzero(np.diff(recipes, prepend=-1))
+    a, b = hashes
+    hashed = (
+        (pairs[:, 1:2].astype(np.uint64) * a + b) >> np.uint64(32)
+    ).astype(np.uint32)
+    return recipes[starts], np.minimum.reduceat(hashed, starts, axis=0)
+
+
+def band_keys(rows):
+    """Ключи корзин LSH: значения полосы подписи в одно число.
+
+    Старшие биты ключа - номер полосы, поэтому корзины всех полос
+    лежат в одном отсортированном массиве.
+    """
+    bands = settings.SIMILAR_PERMUTATIONS // settings.SIMILAR_BAND_ROWS
+    values = rows.reshape(
+        len(rows), bands, settings.SIMILAR_BAND_ROWS
+    ).astype(np.uint64)
+    keys = values[:, :, 0]
+    for column in range(1, values.shape[2]):
+        keys = keys * MIX ^ values[:, :, column]
+    shift = np.uint64(max((bands - 1).bit_length(), 1))
+    return keys >> shift | (
+        np.arange(bands, dtype=np.uint64) << np.uint64(64) - shift
+    )
+
+
+def get_root():
+    return Path(settings.SIMILAR_INDEX_ROOT)
+
+
+def current_path(root):
+    try:
+        path = root / (root / CURRENT).read_text().strip()
+    except FileNotFoundError:
+        return None
+    try:
+        meta = json.loads((path / 'meta.json').read_text())
+    except FileNotFoundError:
+        return None
+    return path if meta == get_meta() else None
+
+
+@contextmanager
+def locked(root):
+    """Одна запись в индекс за раз во всех процессах."""
+    with open(root / 'lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def open_signatures(path, rows=0):
+    """Подписи для записи; файл растёт, если рецептов больше rows."""
+    name = path / SIGNATURES
+    width = settings.SIMILAR_PERMUTATIONS * 4
+    size = name.stat().st_size if name.exists() else 0
+    if size < rows * width:
+        with open(name, 'ab') as file:
+            file.truncate(max(rows, size // width * 5 // 4) * width)
+        size = name.stat().st_size
+    return np.memmap(
+        name, dtype=np.uint32, mode='r+',
+        shape=(size // width, settings.SIMILAR_PERMUTATIONS)
+    )
+
+
+def write_bands(path, signatures):
+    """Корзины всех полос одним массивом, отсортированным по ключу."""
+    ids = np.flatnonzero(signatures.any(axis=1))
+    bands = settings.SIMILAR_PERMUTATIONS // settings.SIMILAR_BAND_ROWS
+    keys = np.empty((len(ids), bands), dtype=np.uint64)
+    for offset in range(0, len(ids), BATCH_SIZE):
+        chunk = ids[offset:offset + BATCH_SIZE]
+        keys[offset:offset + len(chunk)] = band_keys(signatures[chunk])
+    keys = keys.ravel()
+    order = np.argsort(keys, kind='stable')
+    np.save(path / 'keys.npy', keys[order])
+    np.save(
+        path / 'recipes.npy',
+        np.repeat(ids.astype(np.uint32), bands)[order]
+    )
+    (path / EXTRA).touch()
+    (path / 'meta.json').write_text(json.dumps(get_meta()))
+
+
+def publish(root, path):
+    """Переключение процессов на новое поколение индекса.
+
+    Предыдущее поколение остаётся на диске: процессы, которые ещё не
+    заметили смену CURRENT, дочитывают его. Более старые удаляются,
+    процесс, которому попался удалённый файл, открывает индекс заново
+    (см. find_similar).
+    """
+    try:
+        previous = root / (root / CURRENT).read_text().strip()
+    except FileNotFoundError:
+        previous = None
+    temp = root / f'{CURRENT}.tmp'
+    temp.write_text(path.name)
+    os.replace(temp, root / CURRENT)
+    for old in root.iterdir():
+        if old.is_dir() and old not in (path, previous):
+            shutil.rmtree(old, ignore_errors=True)
+
+
+def new_generation(root):
+    path = root / str(time.time_ns())
+    path.mkdir()
+    return path
+
+
+def build():
+    """Индекс похожих рецептов заново по IngredientRecipe."""
+    root = get_root()
+    root.mkdir(parents=True, exist_ok=True)
+    hashes = get_hashes()
+    with locked(root):
+        path = new_generation(root)
+        last = Recipe.objects.aggregate(last=Max('id'))['last'] or 0
+        matrix = open_signatures(path, last + 1)
+        for start in range(0, last + 1, BATCH_SIZE):
+            pairs = np.array(
+                IngredientRecipe.objects.filter(
+                    recipe_id__gte=start, recipe_id__lt=start + BATCH_SIZE
+                ).order_by('recipe_id').values_list(
+                    'recipe_id', 'ingredient_id'
+                ),
+                dtype=np.int64
+            ).reshape(-1, 2)
+            ids, rows = signatures(pairs, hashes)
+            matrix[ids] = rows
+        matrix.flush()
+        write_bands(path, matrix)
+        publish(root, path)
+    return path
+
+
+def extra_keys(path):
+    return (path / EXTRA).stat().st_size // 16
+
+
+def max_extra_keys():
+    bands = settings.SIMILAR_PERMUTATIONS // settings.SIMILAR_BAND_ROWS
+    return settings.SIMILAR_MAX_EXTRA * bands
+
+
+def compact():
+    """Перенос дописанных ключей в отсортированные корзины без базы.
+
+    Выполняется в очереди SIMILAR api.background, вне запроса; за время
+    ожидания корзины мог пересобрать другой процесс.
+    """
+    root = get_root()
+    with locked(root):
+        path = current_path(root)
+        if path is None or extra_keys(path) <= max_extra_keys():
+            return
+        new = new_generation(root)
+        shutil.copyfile(path / SIGNATURES, new / SIGNATURES)
+        write_bands(new, open_signatures(new))
+        publish(root, new)
+
+
+def run_compact():
+    try:
+        compact()
+    except OSError:
+        logger.exception('Не удалось пересобрать корзины похожих рецептов')
+
+
+def update(recipe_ids):
+    """Пересчёт подписей рецептов на месте.
+
+    Строка подписи перезаписывается в отображённом файле, новые
+    ключи корзин дописываются в extra.bin; старые ключи остаются, но
+    при поиске сходство считается по новой подписи. Когда дописанных
+    рецептов больше SIMILAR_MAX_EXTRA, корзины пересобираются.
+    """
+    root = get_root()
+    if not root.exists():
+        return False
+    with locked(root):
+        path = current_path(root)
+        if path is None:
+            return False
+        recipe_ids = np.array(sorted(recipe_ids), dtype=np.int64)
+        pairs = np.array(
+            IngredientRecipe.objects.filter(
+                recipe_id__in=recipe_ids.tolist()
+            ).order_by('recipe_id').values_list('recipe_id', 'ingredient_id'),
+            dtype=np.int64
+        ).reshape(-1, 2)
+        ids, rows = signatures(pairs, get_hashes())
+        # Рецепты без ингредиентов или удалённые - нулевая подпись.
+        new = np.zeros(
+            (len(recipe_ids), settings.SIMILAR_PERMUTATIONS), dtype=np.uint32
+        )
+        new[np.searchsorted(recipe_ids, ids)] = rows
+        matrix = open_signatures(path, int(recipe_ids[-1]) + 1)
+        matrix[recipe_ids] = new
+        matrix.flush()
+        keys = band_keys(rows)
+        extra = np.column_stack((
+            keys.ravel(), np.repeat(ids.astype(np.uint64), keys.shape[1])
+        ))
+        with open(path / EXTRA, 'ab') as file:
+            file.write(extra.tobytes())
+        return extra_keys(path) > max_extra_keys()
+
+
+def apply_pending():
+    recipe_ids = getattr(_local, 'pending', set())
+    _local.pending = set()
+    if not recipe_ids:
+        return
+    try:
+        if update(recipe_ids):
+            get_writer(SIMILAR).submit(run_compact)
+    except OSError:
+        logger.exception('Не удалось обновить индекс похожих рецептов')
+
+
+def similar_changed(recipe_ids):
+    """Пересчёт подписей рецептов после фиксации транзакции.
+
+    Рецепты копятся до фиксации, поэтому удаление рецепта со всеми
+    ингредиентами пересчитывает его один раз.
+    """
+    if not hasattr(_local, 'pending'):
+        _local.pending = set()
+    _local.pending.update(recipe_ids)
+    transaction.on_commit(apply_pending)
+
+
+class SimilarIndex:
+    """Индекс MinHash/LSH одного поколения, отображённый в память.
+
+    keys.npy и recipes.npy - корзины всех полос, отсортированные по
+    ключу; signatures.bin - подписи по id рецепта.
+    Подписи и дописанные ключи меняются на месте, поэтому перед
+    поиском сверяются размеры этих файлов.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.keys = np.load(path / 'keys.npy', mmap_mode='r')
+        self.recipes = np.load(path / 'recipes.npy', mmap_mode='r')
+        self.signatures = self.extra = None
+        self.sizes = (-1, -1)
+
+    def refresh(self):
+        sizes = (
+            (self.path / SIGNATURES).stat().st_size,
+            (self.path / EXTRA).stat().st_size
+        )
+        if sizes[0] != self.sizes[0]:
+            self.signatures = np.memmap(
+                self.path / SIGNATURES, dtype=np.uint32, mode='r',
+                shape=(
+                    sizes[0] // (settings.SIMILAR_PERMUTATIONS * 4),
+                    settings.SIMILAR_PERMUTATIONS
+                )
+            )
+        if sizes[1] != self.sizes[1]:
+            self.extra = np.fromfile(
+                self.path / EXTRA, dtype=np.uint64, count=sizes[1] // 16 * 2
+            ).reshape(-1, 2)
+        self.sizes = sizes
+
+    def candidates(self, keys):
+        """Рецепты из тех же корзин и число общих корзин.
+
+        Из больших корзин берутся SIMILAR_BUCKET_LIMIT новых рецептов.
+        """
+        starts = np.searchsorted(self.keys, keys, 'left')
+        ends = np.searchsorted(self.keys, keys, 'right')
+        starts = np.maximum(starts, ends - settings.SIMILAR_BUCKET_LIMIT)
+        found = [
+            self.recipes[start:end]
+            for start, end in zip(starts.tolist(), ends.tolist())
+            if start < end
+        ]
+        if len(self.extra):
+            found.append(self.extra[np.isin(self.extra[:, 0], keys), 1])
+        if not found:
+            return EMPTY, EMPTY
+        return np.unique(
+            np.concatenate(found).astype(np.int64), return_counts=True
+        )
+
+    def similar(self, recipe_id, limit):
+        """id похожих рецептов и оценка сходства Жаккара.
+
+        Кандидатов не больше SIMILAR_MAX_CANDIDATES - сначала те, что
+        чаще попали в общие корзины. Сходство - доля совпавших
+        значений подписи.
+        """
+        self.refresh()
+        if not 0 <= recipe_id < len(self.signatures):
+            return EMPTY, np.empty(0)
+        signature = np.array(self.signatures[recipe_id])
+        if not signature.any():
+            return EMPTY, np.empty(0)
+        ids, hits = self.candidates(band_keys(signature[None])[0])
+        keep = (ids != recipe_id) & (ids < len(self.signatures))
+        ids, hits = ids[keep], hits[keep]
+        if len(ids) > settings.SIMILAR_MAX_CANDIDATES:
+            best = np.argpartition(
+                -hits, settings.SIMILAR_MAX_CANDIDATES
+            )[:settings.SIMILAR_MAX_CANDIDATES]
+            ids = np.sort(ids[best])
+        scores = (self.signatures[ids] == signature).mean(axis=1)
+        order = np.lexsort((-ids, -scores))[:limit]
+        order = order[scores[order] > 0]
+        return ids[order], scores[order]
+
+
+def generation(root):
+    try:
+        stat = (root / CURRENT).stat()
+    except FileNotFoundError:
+        return None
+    return root, stat.st_ino, stat.st_mtime_ns
+
+
+class MissingIndex:
+    """Индекса ещё нет на диске: похожих рецептов нет.
+
+    Индекс строит команда build_similar_index, не запрос.
+    """
+
+    def similar(self, recipe_id, limit):
+        return EMPTY, np.empty(0)
+
+
+MISSING = MissingIndex()
+
+
+def get_similar_index():
+    """Индекс процесса или MISSING, если его ещё не построили.
+
+    Новое поколение (после build или пересборки корзин) замечается
+    по смене файла CURRENT.
+    """
+    global _index
+    root = get_root()
+    if _index is not None and _index[0] == generation(root):
+        return _index[1]
+    path = current_path(root)
+    if path is None:
+        _index = None
+        return MISSING
+    _index = (generation(root), SimilarIndex(path))
+    return _index[1]
+
+
+def find_similar(recipe_id, limit):
+    """Похожие рецепты по индексу процесса.
+
+    Если поколение, которое читал процесс, уже удалено, индекс
+    открывается заново.
+    """
+    global _index
+    try:
+        return get_similar_index().similar(recipe_id, limit)
+    except FileNotFoundError:
+        _index = None
+        return get_similar_index().similar(recipe_id, limit)
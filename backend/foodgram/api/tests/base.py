@@ -0,0 +1,78 @@
+import shutil
+import tempfile
+
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+from api import recipe_index, search, similar
+from api.bench import BENCH_IMAGE_BASE64, seed_dataset
+from api.cache import get_cache
+from recipes.models import Ingredient, Recipe, Tag
+
+
+class SeededAPITestCase(APITestCase):
+    """Небольшой набор данных из api.bench и чистые кэши процесса.
+
+    Файлы (картинки, выгрузки, индекс похожих) пишутся во временный
+    каталог. Версии кэша меняются после фиксации транзакции, поэтому
+    изменения выполняются внутри self.captureOnCommitCallbacks.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.root = tempfile.mkdtemp()
+        cls.files = override_settings(
+            MEDIA_ROOT=f'{cls.root}/media',
+            EXPORTS_ROOT=f'{cls.root}/exports',
+            SIMILAR_INDEX_ROOT=f'{cls.root}/similar',
+            IMAGE_PROCESSING_SYNC=True,
+            EXPORT_SYNC=True,
+            FEED_SYNC=True
+        )
+        cls.files.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.files.disable()
+        shutil.rmtree(cls.root, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = seed_dataset(
+            users=6, recipes=40, ingredients=30, tags=3, favorites=5,
+            cart=3, following=2
+        )
+
+    def setUp(self):
+        get_cache().clear()
+        recipe_index._index = None
+        search._index = None
+        similar._index = None
+        shutil.rmtree(f'{self.root}/similar', ignore_errors=True)
+
+    def commit(self, func, *args, **kwargs):
+        """Вызов func с выполнением колбэков on_commit."""
+        with self.captureOnCommitCallbacks(execute=True):
+            return func(*args, **kwargs)
+
+    def create_recipe(self, author, ingredients=None, **data):
+        """Рецепт через API, ingredients - id ингредиентов."""
+        if ingredients is None:
+            ingredients = Ingredient.objects.values_list(
+                'id', flat=True
+            )[:3]
+        self.client.force_authenticate(author)
+        response = self.commit(self.client.post, '/api/recipes/', {
+            'name': 'Новый рецепт',
+            'text': 'Описание',
+            'image': BENCH_IMAGE_BASE64,
+            'cooking_time': 10,
+            'tags': list(Tag.objects.values_list('id', flat=True)[:1]),
+            'ingredients': [{'id': pk, 'amount': 10} for pk in ingredients],
+            **data
+        }, format='json')
+        self.client.force_authenticate(None)
+        self.assertEqual(response.status_code, 201, response.data)
+        return Recipe.objects.get(pk=response.data['id'])
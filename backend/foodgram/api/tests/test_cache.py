@@ -0,0 +1,101 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, override_settings
+from rest_framework import status
+
+from api.cache import bump_versions, check_shared_cache, RECIPE_VERSION_KEY
+from recipes.models import Favorite, Recipe
+
+from .base import SeededAPITestCase
+
+LOCMEM = {'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'
+}}
+SHARED = {'default': {
+    'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+    'LOCATION': 'cache'
+}}
+
+
+class ConditionalResponseTests(SeededAPITestCase):
+    """ETag и 304 по версиям из кэша."""
+
+    def get(self, url, etag=None):
+        headers = {} if etag is None else {'HTTP_IF_NONE_MATCH': etag}
+        return self.client.get(url, **headers)
+
+    def test_not_modified(self):
+        response = self.get('/api/recipes/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            response = self.get('/api/recipes/', etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_recipe_change_resets_etag(self):
+        recipe = Recipe.objects.first()
+        url = f'/api/recipes/{recipe.pk}/'
+        etag = self.get(url)['ETag']
+        self.client.force_authenticate(recipe.author)
+        response = self.commit(
+            self.client.patch, url, {'name': 'Новое имя'}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.client.force_authenticate(None)
+        response = self.get(url, etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['name'], 'Новое имя')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_viewer_change_resets_only_own_etag(self):
+        recipe = Recipe.objects.exclude(recipe__user=self.viewer).first()
+        url = f'/api/recipes/{recipe.pk}/'
+        self.client.force_authenticate(self.viewer)
+        etag = self.get(url)['ETag']
+        self.commit(self.client.post, f'{url}favorite/')
+        response = self.get(url, etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['is_favorited'])
+        self.assertTrue(
+            Favorite.objects.filter(user=self.viewer, recipe=recipe).exists()
+        )
+
+    def test_version_bumped_elsewhere(self):
+        """Версию, изменённую другим процессом, видит следующий запрос."""
+        url = '/api/tags/'
+        etag = self.get(url)['ETag']
+        self.assertEqual(
+            self.get(url, etag).status_code, status.HTTP_304_NOT_MODIFIED
+        )
+        bump_versions(['tags:version'])
+        self.assertEqual(self.get(url, etag).status_code, status.HTTP_200_OK)
+
+    def test_etag_depends_on_user(self):
+        recipe = Recipe.objects.first()
+        url = f'/api/recipes/{recipe.pk}/'
+        etag = self.get(url)['ETag']
+        bump_versions([RECIPE_VERSION_KEY.format(recipe.pk)])
+        self.client.force_authenticate(self.viewer)
+        self.assertEqual(self.get(url, etag).status_code, status.HTTP_200_OK)
+
+
+class SharedCacheTests(SimpleTestCase):
+    """Версии кэша должны быть видны всем процессам."""
+
+    @override_settings(CACHES=LOCMEM, DEBUG=False)
+    def test_process_local_cache_in_production(self):
+        with self.assertRaises(ImproperlyConfigured):
+            check_shared_cache()
+
+    @override_settings(CACHES=LOCMEM, DEBUG=True, WEB_CONCURRENCY=4)
+    def test_process_local_cache_with_workers(self):
+        with self.assertRaises(ImproperlyConfigured):
+            check_shared_cache()
+
+    @override_settings(CACHES=LOCMEM, DEBUG=True, WEB_CONCURRENCY=1)
+    def test_process_local_cache_in_development(self):
+        check_shared_cache()
+
+    @override_settings(CACHES=SHARED, DEBUG=False, WEB_CONCURRENCY=4)
+    def test_shared_cache(self):
+        check_shared_cache()
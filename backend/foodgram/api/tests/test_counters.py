@@ -0,0 +1,67 @@
+from api.counters import reconcile
+from recipes.models import Recipe
+from users.models import User
+
+from .base import SeededAPITestCase
+
+
+class CounterTests(SeededAPITestCase):
+    """Счётчики меняются вместе с записями."""
+
+    def setUp(self):
+        super().setUp()
+        self.recipe = Recipe.objects.exclude(
+            recipe__user=self.viewer
+        ).exclude(shop_cart__user=self.viewer).first()
+        self.client.force_authenticate(self.viewer)
+
+    def toggle(self, method, url):
+        return self.commit(getattr(self.client, method), url)
+
+    def counts(self):
+        self.recipe.refresh_from_db()
+        return self.recipe.favorites_count, self.recipe.cart_count
+
+    def test_favorite_toggle(self):
+        favorites, cart = self.counts()
+        url = f'/api/recipes/{self.recipe.pk}/favorite/'
+        self.assertEqual(self.toggle('post', url).status_code, 201)
+        self.assertEqual(self.counts(), (favorites + 1, cart))
+        self.assertEqual(self.toggle('post', url).status_code, 400)
+        self.assertEqual(self.counts(), (favorites + 1, cart))
+        self.assertEqual(self.toggle('delete', url).status_code, 204)
+        self.assertEqual(self.counts(), (favorites, cart))
+        self.assertEqual(self.toggle('delete', url).status_code, 400)
+        self.assertEqual(self.counts(), (favorites, cart))
+
+    def test_shopping_cart_toggle(self):
+        favorites, cart = self.counts()
+        url = f'/api/recipes/{self.recipe.pk}/shopping_cart/'
+        self.assertEqual(self.toggle('post', url).status_code, 201)
+        self.assertEqual(self.counts(), (favorites, cart + 1))
+        self.assertEqual(self.toggle('post', url).status_code, 400)
+        self.assertEqual(self.counts(), (favorites, cart + 1))
+        self.assertEqual(self.toggle('delete', url).status_code, 204)
+        self.assertEqual(self.counts(), (favorites, cart))
+
+    def test_subscription_and_recipes(self):
+        author = User.objects.exclude(pk=self.viewer.pk).exclude(
+            following_users__user=self.viewer
+        ).first()
+        following = self.viewer.following_count
+        followers = author.followers_count
+        url = f'/api/users/{author.pk}/subscribe/'
+        self.assertEqual(self.toggle('post', url).status_code, 201)
+        self.assertEqual(self.toggle('post', url).status_code, 400)
+        self.viewer.refresh_from_db()
+        author.refresh_from_db()
+        self.assertEqual(self.viewer.following_count, following + 1)
+        self.assertEqual(author.followers_count, followers + 1)
+        recipes = author.recipes_count
+        self.create_recipe(author)
+        author.refresh_from_db()
+        self.assertEqual(author.recipes_count, recipes + 1)
+        self.assertEqual(
+            reconcile(dry_run=True),
+            dict.fromkeys(reconcile(dry_run=True), 0)
+        )
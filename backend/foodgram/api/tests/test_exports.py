@@ -0,0 +1,70 @@
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from api.exports import expired_exports
+from recipes.models import ShoppingListExport
+
+from .base import SeededAPITestCase
+
+
+class ShoppingListExportTests(SeededAPITestCase):
+    """Выгрузки списка покупок в фоне (EXPORT_SYNC)."""
+
+    def test_file_in_exports_root(self):
+        self.client.force_authenticate(self.viewer)
+        response = self.commit(
+            self.client.post, '/api/exports/', {'format': 'csv'}
+        )
+        self.assertEqual(response.status_code, 202)
+        job = ShoppingListExport.objects.get(pk=response.data['id'])
+        self.assertEqual(job.status, ShoppingListExport.DONE)
+        self.assertEqual(job.file.name, f'{job.pk}.csv')
+
+    def test_download_missing_file(self):
+        self.client.force_authenticate(self.viewer)
+        job_id = self.commit(
+            self.client.post, '/api/exports/', {'format': 'txt'}
+        ).data['id']
+        url = f'/api/exports/{job_id}/download/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        response.close()
+        job = ShoppingListExport.objects.get(pk=job_id)
+        job.file.storage.delete(job.file.name)
+        self.assertEqual(self.client.get(url).status_code, 410)
+
+    def test_one_unfinished_job_per_format(self):
+        ShoppingListExport.objects.create(user=self.viewer, format='pdf')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            ShoppingListExport.objects.create(user=self.viewer, format='pdf')
+        ShoppingListExport.objects.create(user=self.viewer, format='txt')
+
+    def test_cleanup_keeps_unfinished(self):
+        old = timezone.now() - timedelta(days=30)
+        for format, job_status in (('pdf', ShoppingListExport.PENDING),
+                                   ('txt', ShoppingListExport.RUNNING),
+                                   ('csv', ShoppingListExport.DONE)):
+            job = ShoppingListExport.objects.create(
+                user=self.viewer, format=format, status=job_status
+            )
+            ShoppingListExport.objects.filter(pk=job.pk).update(
+                created=old,
+                finished=old if job_status == ShoppingListExport.DONE
+                else None
+            )
+        self.assertEqual(
+            list(expired_exports().values_list('format', flat=True)),
+            ['csv']
+        )
+
+    def test_retention_from_finish(self):
+        job = ShoppingListExport.objects.create(
+            user=self.viewer, status=ShoppingListExport.DONE
+        )
+        ShoppingListExport.objects.filter(pk=job.pk).update(
+            created=timezone.now() - timedelta(days=30),
+            finished=timezone.now() - timedelta(minutes=1)
+        )
+        self.assertFalse(expired_exports().exists())
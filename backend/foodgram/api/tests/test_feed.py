@@ -0,0 +1,82 @@
+from django.test import override_settings
+
+from api.counters import reconcile
+from recipes.models import FeedEntry, Recipe
+from users.models import Subscribe, User
+
+from .base import SeededAPITestCase
+
+
+class FeedTests(SeededAPITestCase):
+    """Ленты обновляются после фиксации транзакции."""
+
+    def setUp(self):
+        super().setUp()
+        self.author = Recipe.objects.filter(
+            author__following_users__isnull=True
+        ).first().author
+        self.users = list(User.objects.exclude(
+            pk=self.author.pk
+        ).exclude(followers__author=self.author)[:3])
+
+    def subscribe(self, user):
+        self.client.force_authenticate(user)
+        response = self.commit(
+            self.client.post, f'/api/users/{self.author.pk}/subscribe/'
+        )
+        self.assertEqual(response.status_code, 201)
+
+    def unsubscribe(self, user):
+        self.client.force_authenticate(user)
+        response = self.commit(
+            self.client.delete, f'/api/users/{self.author.pk}/subscribe/'
+        )
+        self.assertEqual(response.status_code, 204)
+
+    def entries(self, user):
+        return set(FeedEntry.objects.filter(
+            user=user, recipe__author=self.author
+        ).values_list('recipe_id', flat=True))
+
+    def feed(self, user):
+        self.client.force_authenticate(user)
+        response = self.client.get('/api/recipes/feed/', {'limit': 50})
+        return {recipe['id'] for recipe in response.data['results']}
+
+    def test_follow_after_commit(self):
+        user = self.users[0]
+        self.client.force_authenticate(user)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.post(f'/api/users/{self.author.pk}/subscribe/')
+        self.assertEqual(self.entries(user), set())
+        for callback in callbacks:
+            callback()
+        recipes = set(self.author.author.values_list('id', flat=True))
+        self.assertEqual(self.entries(user), recipes)
+        self.assertEqual(self.feed(user), recipes)
+
+    def test_fan_out(self):
+        user = self.users[0]
+        self.subscribe(user)
+        recipe = self.create_recipe(self.author)
+        self.assertIn(recipe.pk, self.entries(user))
+        self.unsubscribe(user)
+        self.assertEqual(self.entries(user), set())
+
+    @override_settings(FEED_FANOUT_LIMIT=1)
+    def test_backfill_after_pull_mode(self):
+        first, second, late = self.users
+        Subscribe.objects.bulk_create([
+            Subscribe(user=first, author=self.author),
+            Subscribe(user=second, author=self.author),
+        ])
+        reconcile()
+        recipes = set(self.author.author.values_list('id', flat=True))
+        self.subscribe(late)
+        self.assertEqual(self.entries(late), set())
+        self.assertEqual(self.feed(late), recipes)
+        self.unsubscribe(first)
+        self.assertEqual(self.entries(late), set())
+        self.unsubscribe(second)
+        self.assertEqual(self.entries(late), recipes)
+        self.assertEqual(self.feed(late), recipes)
@@ -0,0 +1,79 @@
+import base64
+import io
+
+from django.core.files.storage import default_storage
+from PIL import Image
+
+from recipes.models import ImageBlob, Recipe
+
+from recipes.storage import file_hash, hashed_name
+from .base import SeededAPITestCase
+
+
+class ImageBlobTests(SeededAPITestCase):
+    """Одинаковые картинки - один файл со счётчиком ссылок."""
+
+    def delete(self, recipe):
+        self.client.force_authenticate(recipe.author)
+        response = self.commit(
+            self.client.delete, f'/api/recipes/{recipe.pk}/'
+        )
+        self.assertEqual(response.status_code, 204)
+
+    def test_shared_file(self):
+        first = self.create_recipe(self.viewer)
+        second = self.create_recipe(self.viewer)
+        name = first.image.name
+        self.assertEqual(second.image.name, name)
+        self.assertEqual(ImageBlob.objects.get(name=name).references, 2)
+        self.delete(first)
+        self.assertTrue(default_storage.exists(name))
+        self.assertEqual(ImageBlob.objects.get(name=name).references, 1)
+        self.delete(second)
+        self.assertFalse(default_storage.exists(name))
+        self.assertFalse(ImageBlob.objects.filter(name=name).exists())
+
+    def test_upload_between_release_and_delete(self):
+        """Загрузка того же файла, пока рецепт с ним ещё не сохранён."""
+        recipe = self.create_recipe(self.viewer)
+        name = recipe.image.name
+        with self.captureOnCommitCallbacks() as callbacks:
+            Recipe.objects.get(pk=recipe.pk).delete()
+        self.assertEqual(ImageBlob.objects.get(name=name).references, 0)
+        with default_storage.open(name) as file:
+            self.assertEqual(
+                default_storage.save('recipes/upload.png', file), name
+            )
+        for callback in callbacks:
+            callback()
+        self.assertTrue(default_storage.exists(name))
+        self.assertEqual(ImageBlob.objects.get(name=name).references, 1)
+
+    def test_reupload_after_delete(self):
+        recipe = self.create_recipe(self.viewer)
+        name = recipe.image.name
+        self.delete(recipe)
+        self.assertFalse(default_storage.exists(name))
+        recipe = self.create_recipe(self.viewer)
+        self.assertEqual(recipe.image.name, name)
+        self.assertTrue(default_storage.exists(name))
+
+    def test_original_without_metadata(self):
+        exif = Image.Exif()
+        exif[0x8825] = {2: (55.0, 45.0, 0.0)}  # GPSLatitude
+        exif[0x010f] = 'Camera'
+        photo = io.BytesIO()
+        Image.new('RGB', (8, 4), 'red').save(photo, 'JPEG', exif=exif)
+        recipe = self.create_recipe(
+            self.viewer,
+            image='data:image/jpeg;base64,'
+                  + base64.b64encode(photo.getvalue()).decode()
+        )
+        name = recipe.image.name
+        with default_storage.open(name) as file:
+            self.assertNotIn(b'Camera', file.read())
+            self.assertEqual(
+                hashed_name('recipes/photo.jpg', file_hash(file)), name
+            )
+            with Image.open(file) as image:
+                self.assertFalse(image.getexif())
@@ -0,0 +1,87 @@
+from api.ranking import refresh
+from recipes.models import RankingEvent, Recipe, RecipeScore
+
+from .base import SeededAPITestCase
+
+
+class RankingTests(SeededAPITestCase):
+    """Баллы популярности следуют за избранным и корзинами."""
+
+    def setUp(self):
+        super().setUp()
+        self.commit(refresh, rebuild=True)
+        self.recipe = Recipe.objects.exclude(
+            recipe__user=self.viewer
+        ).exclude(shop_cart__user=self.viewer).first()
+        self.client.force_authenticate(self.viewer)
+
+    def toggle(self, method, source='favorite'):
+        url = f'/api/recipes/{self.recipe.pk}/{source}/'
+        response = self.commit(getattr(self.client, method), url)
+        self.commit(refresh)
+        return response
+
+    def scores(self):
+        score = RecipeScore.objects.get(recipe=self.recipe)
+        return score.popular, score.trending
+
+    def assertScores(self, first, second):
+        for value, expected in zip(first, second):
+            self.assertAlmostEqual(value, expected, places=6)
+
+    def test_favorite_toggle(self):
+        before = self.scores()
+        self.toggle('post')
+        added = self.scores()
+        self.assertGreater(added[0], before[0])
+        self.assertGreater(added[1], before[1])
+        self.toggle('delete')
+        self.assertScores(self.scores(), before)
+        self.toggle('post')
+        self.assertScores(self.scores(), added)
+        self.assertFalse(RankingEvent.objects.exists())
+
+    def test_shopping_cart_toggle(self):
+        before = self.scores()
+        self.toggle('post', 'shopping_cart')
+        self.assertGreater(self.scores()[0], before[0])
+        self.toggle('delete', 'shopping_cart')
+        self.assertScores(self.scores(), before)
+
+    def test_events_counted_once(self):
+        self.toggle('post')
+        scores = self.scores()
+        self.assertEqual(self.commit(refresh), 0)
+        self.assertScores(self.scores(), scores)
+
+    def test_rebuild_matches_events(self):
+        self.toggle('post')
+        self.toggle('post', 'shopping_cart')
+        self.toggle('delete')
+        scores = self.scores()
+        self.commit(refresh, rebuild=True)
+        self.assertScores(self.scores(), scores)
+
+    def test_deleted_recipe_events(self):
+        self.commit(self.client.post,
+                    f'/api/recipes/{self.recipe.pk}/favorite/')
+        pk = self.recipe.pk
+        self.recipe.delete()
+        self.assertTrue(RankingEvent.objects.filter(
+            recipe_id=pk, sign=-1
+        ).exists())
+        self.commit(refresh)
+        self.assertFalse(RankingEvent.objects.exists())
+
+    def test_anonymous_cache_follows_scores(self):
+        self.client.force_authenticate(None)
+        url = '/api/recipes/?ordering=popular&limit=1'
+        self.client.get(url)
+        self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+        RecipeScore.objects.filter(recipe=self.recipe).update(popular=1e9)
+        self.client.force_authenticate(self.viewer)
+        self.toggle('post')
+        self.client.force_authenticate(None)
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['results'][0]['id'], self.recipe.pk)
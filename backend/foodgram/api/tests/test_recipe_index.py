@@ -0,0 +1,148 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.db.models import Count
+from django.utils import timezone
+
+from api import recipe_index
+from api.recipe_index import get_recipe_index
+from recipes.models import (Ingredient,
+                            IngredientRecipe,
+                            Recipe,
+                            RecipeIndexChange)
+
+from .base import SeededAPITestCase
+
+
+class IngredientSearchTests(SeededAPITestCase):
+    """Поиск рецептов по ?ingredients= в обоих режимах."""
+
+    def setUp(self):
+        super().setUp()
+        self.ingredients = list(
+            Ingredient.objects.order_by('id').values_list('id', flat=True)
+        )
+
+    def search(self, ids, mode='all', **params):
+        response = self.client.get('/api/recipes/', {
+            'ingredients': ','.join(map(str, ids)),
+            'ingredients_mode': mode,
+            'limit': 100,
+            **params
+        })
+        self.assertEqual(response.status_code, 200, response.data)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def expected(self, ids, mode, recipes=None):
+        """Тот же поиск по базе: id рецептов в порядке режима."""
+        if recipes is None:
+            recipes = Recipe.objects.all()
+        ingredients = {}
+        for recipe_id, ingredient_id in IngredientRecipe.objects.filter(
+            recipe__in=recipes
+        ).values_list('recipe_id', 'ingredient_id'):
+            ingredients.setdefault(recipe_id, set()).add(ingredient_id)
+        matched = {
+            pk: len(found & set(ids)) for pk, found in ingredients.items()
+        }
+        if mode == 'all':
+            return sorted(
+                (pk for pk, count in matched.items() if count == len(ids)),
+                reverse=True
+            )
+        return sorted(
+            (pk for pk, count in matched.items() if count),
+            key=lambda pk: (-matched[pk] / len(ingredients[pk]),
+                            -matched[pk], -pk)
+        )
+
+    def popular(self, number):
+        """Самые частые ингредиенты рецептов."""
+        return list(IngredientRecipe.objects.values('ingredient').annotate(
+            total=Count('id')
+        ).order_by('-total', 'ingredient').values_list(
+            'ingredient', flat=True
+        )[:number])
+
+    def test_modes(self):
+        for ids in (self.popular(1), self.popular(2), self.popular(3)):
+            for mode in recipe_index.MODES:
+                with self.subTest(ids=ids, mode=mode):
+                    found = self.search(ids, mode)
+                    self.assertTrue(found)
+                    self.assertEqual(found, self.expected(ids, mode))
+
+    def test_filters_narrow(self):
+        ids = self.popular(2)
+        author = Recipe.objects.filter(
+            ingredient_list__ingredient_id=ids[0]
+        ).values_list('author_id', flat=True).first()
+        for mode in recipe_index.MODES:
+            with self.subTest(mode=mode):
+                found = self.search(ids, mode, author=author)
+                self.assertEqual(found, self.expected(
+                    ids, mode, Recipe.objects.filter(author_id=author)
+                ))
+
+    def test_filter_chunks(self):
+        ids = self.popular(1)
+        tag = Recipe.objects.filter(
+            ingredient_list__ingredient_id=ids[0]
+        ).values_list('tags__slug', flat=True).first()
+        whole = self.search(ids, 'coverage', tags=tag)
+        get_recipe_index()
+        with mock.patch.object(recipe_index, 'FILTER_CHUNK_SIZE', 2):
+            self.assertEqual(self.search(ids, 'coverage', tags=tag), whole)
+        self.assertEqual(whole, self.expected(
+            ids, 'coverage', Recipe.objects.filter(tags__slug=tag)
+        ))
+
+    def test_created_recipe(self):
+        ids = self.ingredients[-2:]
+        index = get_recipe_index()
+        recipe = self.create_recipe(self.viewer, ingredients=ids)
+        for mode in recipe_index.MODES:
+            with self.subTest(mode=mode):
+                self.assertEqual(self.search(ids, mode)[0], recipe.pk)
+        self.assertIs(get_recipe_index(), index)
+
+    def test_changed_recipe(self):
+        ids = self.popular(1)
+        recipe = Recipe.objects.filter(
+            ingredient_list__ingredient_id=ids[0]
+        ).first()
+        self.assertIn(recipe.pk, self.search(ids))
+        self.commit(self.change, recipe, self.ingredients[-1:])
+        for mode in recipe_index.MODES:
+            with self.subTest(mode=mode):
+                self.assertNotIn(recipe.pk, self.search(ids, mode))
+                self.assertEqual(self.search(ids, mode),
+                                 self.expected(ids, mode))
+
+    def change(self, recipe, ids):
+        IngredientRecipe.objects.filter(recipe=recipe).delete()
+        IngredientRecipe.objects.bulk_create(
+            [IngredientRecipe(recipe=recipe, ingredient_id=pk, amount=1)
+             for pk in ids]
+        )
+        recipe_index.recipe_ingredients_changed((recipe.pk,))
+
+    def test_late_journal_entry(self):
+        """Запись, добавленная позже проверки, но с ранним временем."""
+        ids = self.ingredients[-1:]
+        recipe = Recipe.objects.exclude(
+            ingredient_list__ingredient_id=ids[0]
+        ).first()
+        index = get_recipe_index()
+        checked = index.checked
+        self.commit(self.change, recipe, ids)
+        RecipeIndexChange.objects.filter(recipe_id=recipe.pk).update(
+            changed=checked - timedelta(seconds=1)
+        )
+        self.assertIn(recipe.pk, self.search(ids))
+        self.assertIs(get_recipe_index(), index)
+
+    def test_stale_index_rebuilt(self):
+        index = get_recipe_index()
+        index.checked = timezone.now() - timedelta(days=1)
+        self.assertIsNot(get_recipe_index(), index)
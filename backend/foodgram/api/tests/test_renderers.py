@@ -0,0 +1,48 @@
+from django.http import HttpResponse
+from django.test import SimpleTestCase
+
+from api.renderers import (RENDERERS,
+                           CSVRenderer,
+                           PDFRenderer,
+                           ShoppingListRenderer,
+                           TextRenderer)
+
+ITEMS = [
+    {'ingredient__name': 'Соль', 'ingredient__measurement_unit': 'г',
+     'total_amount': 5},
+    {'ingredient__name': 'Молоко', 'ingredient__measurement_unit': 'мл',
+     'total_amount': 250},
+]
+
+
+class RendererTests(SimpleTestCase):
+
+    def test_stream_is_abstract(self):
+        with self.assertRaises(TypeError):
+            ShoppingListRenderer()
+        self.assertEqual(
+            set(RENDERERS.values()), {PDFRenderer, TextRenderer, CSVRenderer}
+        )
+
+    def test_text(self):
+        self.assertEqual(
+            TextRenderer().document(ITEMS).decode(),
+            'Список покупок\n\n5 г - Соль\n250 мл - Молоко\n'
+        )
+
+    def test_csv(self):
+        self.assertEqual(
+            CSVRenderer().document(ITEMS).decode().splitlines(),
+            ['name,measurement_unit,amount', 'Соль,г,5', 'Молоко,мл,250']
+        )
+
+    def test_pdf(self):
+        document = PDFRenderer().document(ITEMS)
+        self.assertIs(type(document), bytes)
+        self.assertTrue(document.startswith(b'%PDF'))
+        self.assertIn(b'DejaVuSans', document)
+
+    def test_response_keeps_document(self):
+        document = TextRenderer().document(ITEMS)
+        response = HttpResponse(document)
+        self.assertIs(next(iter(response)), document)
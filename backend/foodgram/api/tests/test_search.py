@@ -0,0 +1,74 @@
+from django.test import override_settings
+
+from api.cache import INGREDIENTS_VERSION_KEY, bump_versions
+from api import search
+from api.search import get_ingredient_index
+from recipes.models import Ingredient, Recipe
+
+from .base import SeededAPITestCase
+
+
+class IngredientIndexTests(SeededAPITestCase):
+    """Индекс названий ингредиентов в памяти процесса."""
+
+    def names(self, query):
+        response = self.client.get('/api/ingredients/', {'name': query})
+        return [item['name'] for item in response.data]
+
+    def test_version_bumped_elsewhere(self):
+        index = get_ingredient_index()
+        self.assertIs(get_ingredient_index(), index)
+        bump_versions([INGREDIENTS_VERSION_KEY])
+        self.assertIsNot(get_ingredient_index(), index)
+
+    def test_created_through_signals(self):
+        self.assertEqual(self.names('Авокадо'), [])
+        self.commit(
+            Ingredient.objects.create, name='Авокадо', measurement_unit='шт.'
+        )
+        self.assertEqual(self.names('авок'), ['Авокадо'])
+
+    @override_settings(INGREDIENT_INDEX_CHECK_INTERVAL=0)
+    def test_loaded_without_signals(self):
+        self.assertEqual(self.names('Бадьян'), [])
+        Ingredient.objects.bulk_create(
+            [Ingredient(name='Бадьян', measurement_unit='г')]
+        )
+        self.assertEqual(self.names('бадь'), ['Бадьян'])
+
+    @override_settings(INGREDIENT_SEARCH_LIMIT=3)
+    def test_limit_after_prefix_matches(self):
+        self.commit(Ingredient.objects.bulk_create, [
+            Ingredient(name=name, measurement_unit='г')
+            for name in ('Чумиза', 'Мука', 'Хумус', 'Мускат')
+        ])
+        search._index = None
+        self.assertEqual(self.names('му'), ['Мука', 'Мускат', 'Хумус'])
+        self.assertEqual(len(self.names('')), 3)
+        self.assertEqual(self.names('иза'), ['Чумиза'])
+
+
+class RecipeSearchTests(SeededAPITestCase):
+    """Поиск рецептов по ?search=."""
+
+    def test_cursor_keeps_relevance(self):
+        author = Recipe.objects.first().author
+        in_name = self.create_recipe(author, name='Борщ зелёный')
+        in_text = self.create_recipe(
+            author, name='Суп', text='Почти как борщ'
+        )
+        response = self.client.get(
+            '/api/recipes/', {'search': 'борщ', 'cursor': '', 'limit': 1}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [in_name.pk]
+        )
+        response = self.client.get(
+            '/api/recipes/', {'search': 'борщ', 'limit': 1, 'page': 2}
+        )
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [in_text.pk]
+        )
@@ -0,0 +1,73 @@
+from django.test import override_settings
+
+from api import similar
+from api.background import SIMILAR, get_writer
+from recipes.models import IngredientRecipe, Recipe
+
+from .base import SeededAPITestCase
+
+
+class SimilarIndexTests(SeededAPITestCase):
+    """Индекс похожих рецептов строит команда, запросы его обновляют."""
+
+    def setUp(self):
+        super().setUp()
+        self.recipe = Recipe.objects.order_by('id').first()
+        self.ingredients = list(IngredientRecipe.objects.filter(
+            recipe=self.recipe
+        ).values_list('ingredient_id', flat=True))
+
+    def similar_ids(self, recipe=None):
+        recipe = recipe or self.recipe
+        response = self.client.get(f'/api/recipes/{recipe.pk}/similar/')
+        self.assertEqual(response.status_code, 200)
+        return {item['id']: item['similarity'] for item in response.data}
+
+    def generations(self):
+        root = similar.get_root()
+        return sorted(path.name for path in root.iterdir() if path.is_dir())
+
+    def test_not_built_in_request(self):
+        self.assertEqual(self.similar_ids(), {})
+        self.assertFalse((similar.get_root() / similar.CURRENT).exists())
+
+    def test_created_and_changed(self):
+        similar.build()
+        copy = self.create_recipe(self.viewer, ingredients=self.ingredients)
+        self.assertEqual(self.similar_ids().get(copy.pk), 1.0)
+        self.assertEqual(self.similar_ids(copy).get(self.recipe.pk), 1.0)
+        self.commit(IngredientRecipe.objects.filter(recipe=copy).delete)
+        self.assertNotIn(copy.pk, self.similar_ids())
+        self.assertEqual(self.similar_ids(copy), {})
+
+    @override_settings(SIMILAR_MAX_EXTRA=0)
+    def test_compact_in_background(self):
+        first = similar.build()
+        copy = self.create_recipe(self.viewer, ingredients=self.ingredients)
+        get_writer(SIMILAR).submit(lambda: None).result()
+        current = similar.current_path(similar.get_root())
+        self.assertNotEqual(current, first)
+        self.assertEqual(similar.extra_keys(current), 0)
+        self.assertEqual(self.generations(), [first.name, current.name])
+        self.assertEqual(self.similar_ids().get(copy.pk), 1.0)
+
+    def test_previous_generation_kept(self):
+        first = similar.build()
+        second = similar.build()
+        self.assertEqual(self.generations(), [first.name, second.name])
+        third = similar.build()
+        self.assertEqual(self.generations(), [second.name, third.name])
+
+    def test_deleted_generation_reopened(self):
+        similar.build()
+        expected = self.similar_ids()
+        self.assertTrue(expected)
+        index = similar.get_similar_index()
+        similar.build()
+        similar.build()
+        with self.assertRaises(FileNotFoundError):
+            index.similar(self.recipe.pk, 6)
+        # Процесс успел сверить CURRENT до удаления своего поколения.
+        similar._index = (similar.generation(similar.get_root()), index)
+        ids, _ = similar.find_similar(self.recipe.pk, 6)
+        self.assertEqual(ids.tolist(), list(expected))
@@ -0,0 +1,20 @@
+from users.models import Subscribe
+
+from .base import SeededAPITestCase
+
+
+class SubscriptionsTests(SeededAPITestCase):
+    """Список подписок GET /api/users/subscriptions/."""
+
+    def test_followers_of_authors(self):
+        self.client.force_authenticate(self.viewer)
+        response = self.client.get('/api/users/subscriptions/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['results'])
+        for author in response.data['results']:
+            self.assertCountEqual(
+                author['followers'],
+                Subscribe.objects.filter(
+                    user_id=author['id']
+                ).values_list('id', flat=True)
+            )
@@ -4,13 +4,15 @@ from rest_framework import routers
 
 from django.conf import settings
 from users.views import UserCustomViewSet
-from api.views import TagsViewSet, IngredientsViewSet, RecipeViewSet
+from api.views import (TagsViewSet, IngredientsViewSet, RecipeViewSet,
+                       ShoppingListExportViewSet)
 
 router = routers.DefaultRouter()
 router.register('users', UserCustomViewSet)
 router.register('tags', TagsViewSet)
 router.register('ingredients', IngredientsViewSet)
 router.register('recipes', RecipeViewSet)
+router.register('exports', ShoppingListExportViewSet, basename='exports')
 
 
 urlpatterns = [
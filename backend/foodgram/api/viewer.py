@@ -0,0 +1,101 @@
+from django.conf import settings
+
+from recipes.models import Favorite, ShoppingCart
+from users.models import Subscribe
+
+RELATIONS = {
+    'favorite': (Favorite, 'recipe_id'),
+    'shopping_cart': (ShoppingCart, 'recipe_id'),
+    'following': (Subscribe, 'author_id'),
+}
+
+
+class ViewerContext:
+    """Избранное, корзина и подписки текущего пользователя.
+
+    Создаётся один раз на запрос, каждое множество id загружается
+    не более одного раза. Если у пользователя больше
+    VIEWER_CONTEXT_LIMIT связей, загружаются только id объектов
+    текущей страницы (см. prime).
+    """
+
+    def __init__(self, user, limit=None):
+        self.user = user
+        self.limit = limit or settings.VIEWER_CONTEXT_LIMIT
+        self._scope = {}
+        self._ids = {}
+
+    @classmethod
+    def for_request(cls, request):
+        if request is None:
+            return cls(None)
+        viewer = getattr(request, '_viewer_context', None)
+        if viewer is None:
+            viewer = cls(request.user)
+            request._viewer_context = viewer
+        return viewer
+
+    @property
+    def is_anonymous(self):
+        return self.user is None or self.user.is_anonymous
+
+    def prime(self, recipes=(), authors=()):
+        """Ограничение выборки объектами текущей страницы."""
+        recipe_ids = {recipe.pk for recipe in recipes}
+        author_ids = {author.pk for author in authors}
+        author_ids.update(recipe.author_id for recipe in recipes)
+        self._scope = {'recipe_id': recipe_ids, 'author_id': author_ids}
+        self._ids = {
+            relation: entry for relation, entry in self._ids.items()
+            if entry[1] is None
+        }
+
+    def _queryset(self, relation):
+        model, field = RELATIONS[relation]
+        return model.objects.filter(
+            user=self.user
+        ).order_by().values_list(field, flat=True)
+
+    def _load(self, relation):
+        """Множество id и id, для которых оно достоверно.
+
+        None вместо второго значения означает полное множество.
+        """
+        if relation not in self._ids:
+            field = RELATIONS[relation][1]
+            queryset = self._queryset(relation)
+            ids = set(queryset.distinct()[:self.limit + 1])
+            if len(ids) <= self.limit:
+                self._ids[relation] = (ids, None)
+            elif self._scope.get(field):
+                scope = self._scope[field]
+                ids = set(queryset.filter(**{f'{field}__in': scope}))
+                self._ids[relation] = (ids, scope)
+            else:
+                self._ids[relation] = (ids, ids)
+        return self._ids[relation]
+
+    def contains(self, relation, pk):
+        if self.is_anonymous:
+            return False
+        ids, known = self._load(relation)
+        if known is None or pk in known:
+            return pk in ids
+        field = RELATIONS[relation][1]
+        return self._queryset(relation).filter(**{field: pk}).exists()
+
+    def lookup(self, relation):
+        """id для фильтра `__in`: множество или подзапрос."""
+        ids, known = self._load(relation)
+        if known is None:
+            return ids
+        return self._queryset(relation)
+
+    def is_favorited(self, recipe):
+        return self.contains('favorite', recipe.pk)
+
+    def is_in_shopping_cart(self, recipe):
+        return self.contains('shopping_cart', recipe.pk)
+
+    def is_subscribed(self, author):
+        return self.contains('following', author.pk)
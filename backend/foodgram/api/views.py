@@ -1,26 +1,50 @@
-from io import BytesIO
-
 from django.conf import settings
-from django.http import HttpResponse
+from django.db import IntegrityError, transaction
+from django.http import FileResponse, Http404, HttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
-from fpdf import FPDF
 from rest_framework.response import Response
-from rest_framework import viewsets, status
+from rest_framework import mixins, viewsets, status
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticatedOrReadOnly, SAFE_METHODS
+from rest_framework.permissions import (IsAdminUser,
+                                        IsAuthenticated,
+                                        IsAuthenticatedOrReadOnly,
+                                        SAFE_METHODS)
 
-from .pagination import CustomPagination
-from .services import RecipeFilter
-from recipes.models import (Recipe,
+from .cache import (GENERATION_KEY,
+                    INGREDIENTS_VERSION_KEY,
+                    TAGS_VERSION_KEY,
+                    cache_anonymous_response,
+                    conditional,
+                    get_stats)
+from .exports import schedule_export
+from .feed import feed_sources
+from .pagination import CustomPagination, FeedPagination
+from .recipe_index import (filter_found,
+                           get_recipe_index,
+                           parse_ingredients)
+from .renderers import RENDERERS, CSVRenderer, PDFRenderer, TextRenderer
+from .search import get_ingredient_index
+from .services import (RecipeFilter,
+                       ranking_keys,
+                       recipe_ordering,
+                       render_shopping_list,
+                       shopping_list,
+                       similar_limit)
+from .similar import find_similar
+from .viewer import ViewerContext
+from recipes.models import (FeedEntry,
+                            Recipe,
                             Tag,
                             Ingredient,
                             ShoppingCart,
                             Favorite,
-                            IngredientRecipe)
+                            ShoppingListExport)
 from recipes.serializers import (TagSerializer, IngredientSerializer,
                                  WriteRecipeSerializer, RecipeCreateSerializer,
-                                 FavoriteSerializer, ShoppingCartSerializer)
+                                 FavoriteSerializer, ShoppingCartSerializer,
+                                 ShoppingListSerializer,
+                                 ShoppingListExportSerializer)
 
 
 class TagsViewSet(viewsets.ReadOnlyModelViewSet):
@@ -28,6 +52,14 @@ class TagsViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = TagSerializer
     permission_classes = (IsAuthenticatedOrReadOnly,)
 
+    @conditional(TAGS_VERSION_KEY)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional(TAGS_VERSION_KEY)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
 
 class IngredientsViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
@@ -35,6 +67,19 @@ class IngredientsViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = (IsAuthenticatedOrReadOnly,)
     filter_backends = (DjangoFilterBackend,)
 
+    @conditional(INGREDIENTS_VERSION_KEY)
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name is not None:
+            return Response(get_ingredient_index().search(
+                name, settings.INGREDIENT_SEARCH_LIMIT
+            ))
+        return super().list(request, *args, **kwargs)
+
+    @conditional(INGREDIENTS_VERSION_KEY)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
 
 class RecipeViewSet(viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
@@ -43,11 +88,111 @@ class RecipeViewSet(viewsets.ModelViewSet):
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
 
+    @property
+    def cursor_ordering(self):
+        # Порядок по индексу ингредиентов и по релевантности поиска
+        # не выражается полями модели - там нумерация страниц.
+        if {'ingredients', 'search'} & self.request.query_params.keys():
+            return None
+        return recipe_ordering(self.request)
+
+    def get_queryset(self):
+        if self.request.method not in SAFE_METHODS:
+            return Recipe.objects.all()
+        return Recipe.objects.select_related('author').defer('search_vector')
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        if page is not None:
+            ViewerContext.for_request(self.request).prime(recipes=page)
+        return page
+
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
             return WriteRecipeSerializer
         return RecipeCreateSerializer
 
+    @conditional(GENERATION_KEY, per_user=True, extra_keys=ranking_keys)
+    @cache_anonymous_response(extra_keys=ranking_keys)
+    def list(self, request, *args, **kwargs):
+        if 'ingredients' in request.query_params:
+            return self.list_by_ingredients(request)
+        return super().list(request, *args, **kwargs)
+
+    def list_by_ingredients(self, request):
+        """Рецепты по ?ingredients=1,2,3 из индекса api.recipe_index.
+
+        Остальные фильтры сужают найденное, ?ordering= не действует:
+        порядок задаёт ingredients_mode.
+        """
+        ids, mode = parse_ingredients(request)
+        found = get_recipe_index().search(ids, mode)
+        if len(found) and set(request.query_params) & (
+            RecipeFilter.base_filters.keys() - {'ordering'}
+        ):
+            found = filter_found(
+                found, self.filter_queryset(Recipe.objects.all())
+            )
+        page = self.paginator.paginate_queryset(found, request, view=self)
+        recipes = self.get_queryset().in_bulk([int(pk) for pk in page])
+        page = [recipes[pk] for pk in map(int, page) if pk in recipes]
+        ViewerContext.for_request(request).prime(recipes=page)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @conditional(GENERATION_KEY, per_user=True)
+    @cache_anonymous_response()
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    @action(
+        detail=False,
+        permission_classes=(IsAuthenticated,),
+        pagination_class=FeedPagination
+    )
+    def feed(self, request):
+        """Рецепты авторов из подписок, новые сначала, по курсору."""
+        page = self.paginator.paginate_queryset(
+            feed_sources(request.user), request, view=self
+        )
+        recipes = [
+            item.recipe if isinstance(item, FeedEntry) else item
+            for item in page
+        ]
+        ViewerContext.for_request(request).prime(recipes=recipes)
+        serializer = self.get_serializer(recipes, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=True)
+    @conditional(GENERATION_KEY, per_user=True)
+    @cache_anonymous_response()
+    def similar(self, request, pk=None):
+        """Рецепты с похожим набором ингредиентов, самые похожие сначала.
+
+        similarity - оценка сходства Жаккара по подписям MinHash
+        (см. api.similar).
+        """
+        try:
+            recipe_id = int(pk)
+        except ValueError:
+            raise Http404
+        ids, scores = find_similar(recipe_id, similar_limit(request))
+        # Сам рецепт читается вместе с похожими, чтобы проверить, что он есть.
+        recipes = self.get_queryset().in_bulk([recipe_id, *ids.tolist()])
+        if recipe_id not in recipes:
+            raise Http404
+        page = [recipes[pk] for pk in ids.tolist() if pk in recipes]
+        ViewerContext.for_request(request).prime(recipes=page)
+        data = self.get_serializer(page, many=True).data
+        similarity = dict(zip(ids.tolist(), scores.tolist()))
+        for item in data:
+            item['similarity'] = round(similarity[item['id']], 2)
+        return Response(data)
+
+    @action(detail=False, permission_classes=(IsAdminUser,))
+    def cache_stats(self, request):
+        return Response(get_stats())
+
     @action(
         detail=True,
         methods=('post', 'delete')
@@ -58,10 +203,17 @@ class RecipeViewSet(viewsets.ModelViewSet):
             pk=kwargs.get('pk')
         )
         if self.request.method == 'POST':
-            shopping_cart = ShoppingCart.objects.create(
-                user=self.request.user,
-                recipe=recipe
-            )
+            try:
+                with transaction.atomic():
+                    shopping_cart = ShoppingCart.objects.create(
+                        user=self.request.user,
+                        recipe=recipe
+                    )
+            except IntegrityError:
+                return Response(
+                    {'ERROR': 'Уже в корзине'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
             serializer = ShoppingCartSerializer(
                 shopping_cart,
                 context={'request': request}
@@ -72,7 +224,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
             )
         if self.request.method == 'DELETE':
             user = request.user
-            shop_cart = user.shop_cart.first()
+            shop_cart = user.shop_cart.filter(recipe=recipe).first()
             if not shop_cart:
                 return Response(
                     {'ERROR': 'Корзина не найдена'},
@@ -93,10 +245,17 @@ class RecipeViewSet(viewsets.ModelViewSet):
             pk=kwargs.get('pk')
         )
         if self.request.method == 'POST':
-            favorite = Favorite.objects.create(
-                user=self.request.user,
-                recipe=recipe
-            )
+            try:
+                with transaction.atomic():
+                    favorite = Favorite.objects.create(
+                        user=self.request.user,
+                        recipe=recipe
+                    )
+            except IntegrityError:
+                return Response(
+                    {'ERROR': 'Уже в избранном'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
             serializer = FavoriteSerializer(
                 favorite,
                 context={'request': request}
@@ -107,7 +266,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
             )
         if self.request.method == 'DELETE':
             user = request.user
-            favorite = user.favorite.first()
+            favorite = user.favorite.filter(recipe=recipe).first()
             if not favorite:
                 return Response(
                     {'ERROR': 'Избранного нет'},
@@ -118,40 +277,95 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_204_NO_CONTENT
             )
 
-    @action(detail=False)
+    @action(detail=False, permission_classes=(IsAuthenticated,))
+    def shopping_list(self, request):
+        return Response(ShoppingListSerializer(
+            shopping_list(request.user),
+            many=True
+        ).data)
+
+    @action(
+        detail=False,
+        permission_classes=(IsAuthenticated,),
+        renderer_classes=(PDFRenderer, TextRenderer, CSVRenderer)
+    )
     def download_shopping_cart(self, request):
-        item_shop_cart = ShoppingCart.objects.filter(user=self.request.user)
-        recipes = [item.recipe.id for item in item_shop_cart]
-        ingredients_in_recipes = IngredientRecipe.objects.filter(
-            recipe__in=recipes
+        """Список покупок в PDF, txt или csv.
+
+        Формат выбирается по Accept или ?format=, по умолчанию PDF.
+        """
+        renderer = request.accepted_renderer
+        response = HttpResponse(
+            render_shopping_list(request.user, renderer),
+            content_type=renderer.content_type
         )
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = ('attachment;'
-                                           ' filename="shopping_list.pdf"')
-        buffer = BytesIO()
-        pdf_file = FPDF()
-        pdf_file.add_page()
-        pdf_file.add_font('DejaVuSans', fname='api/DejaVuSans.ttf', uni=True)
-        pdf_file.set_font('DejaVuSans', size=settings.PDF_SIZE_FONT)
-        pdf_file.cell(
-            settings.CELL_WIDTH,
-            settings.CELL_HEIGHT,
-            'Shopping List',
-            ln=True,
-            align='C'
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_list.{renderer.format}"'
         )
-        for item in ingredients_in_recipes:
-            ingredient_text = (f'{item.amount}'
-                               f' {item.ingredient.measurement_unit}'
-                               f' - {item.ingredient.name}')
-            pdf_file.cell(
-                settings.CELL_AUTO_WIDTH,
-                settings.CELL_HEIGHT,
-                txt=ingredient_text,
-                ln=True
-            )
-        buffer.write(pdf_file.output(dest='S'))
-        pdf_file = buffer.getvalue()
-        buffer.close()
-        response.write(pdf_file)
         return response
+
+
+class ShoppingListExportViewSet(mixins.CreateModelMixin,
+                                mixins.ListModelMixin,
+                                mixins.RetrieveModelMixin,
+                                viewsets.GenericViewSet):
+    """Выгрузки списка покупок в фоне.
+
+    POST ставит выгрузку в очередь и сразу отвечает 202, статус
+    проверяется GET /exports/{id}/, готовый файл - /exports/{id}/download/.
+    Незавершённая выгрузка того же формата возвращается повторно.
+    """
+    serializer_class = ShoppingListExportSerializer
+    permission_classes = (IsAuthenticated,)
+    pagination_class = CustomPagination
+
+    def get_queryset(self):
+        return ShoppingListExport.objects.filter(user=self.request.user)
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        jobs = self.get_queryset().filter(
+            format=serializer.validated_data.get('format', 'pdf')
+        )
+        unfinished = jobs.filter(
+            status__in=(ShoppingListExport.PENDING,
+                        ShoppingListExport.RUNNING)
+        )
+        job = unfinished.first()
+        if job is None:
+            try:
+                with transaction.atomic():
+                    job = serializer.save(user=request.user)
+            except IntegrityError:
+                # Параллельный запрос уже поставил выгрузку в очередь,
+                # она могла успеть завершиться.
+                job = unfinished.first() or jobs.first()
+            else:
+                schedule_export(job)
+        return Response(
+            self.get_serializer(job).data,
+            status=status.HTTP_202_ACCEPTED
+        )
+
+    @action(detail=True)
+    def download(self, request, pk=None):
+        job = self.get_object()
+        if job.status != ShoppingListExport.DONE:
+            return Response(
+                {'ERROR': 'Выгрузка ещё не готова'},
+                status=status.HTTP_409_CONFLICT
+            )
+        try:
+            file = job.file.open('rb')
+        except FileNotFoundError:
+            return Response(
+                {'ERROR': 'Файл выгрузки удалён, создайте её заново'},
+                status=status.HTTP_410_GONE
+            )
+        return FileResponse(
+            file,
+            as_attachment=True,
+            filename=f'shopping_list.{job.format}',
+            content_type=RENDERERS[job.format]().content_type
+        )
@@ -66,6 +66,34 @@ DATABASES = {
     }
 }
 
+if os.getenv('USE_SQLITE', '').lower() == 'true':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        }
+    }
+
+# Версии ответов, журнал индекса ингредиентов и баллы читают все
+# процессы (воркеры gunicorn и команды), поэтому в работе кэш общий -
+# Memcached из docker-compose. Кэш в памяти процесса допустим только
+# для разработки с DEBUG и одним процессом (см. api.cache).
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+RECIPES_CACHE_ALIAS = 'default'
+# Число воркеров gunicorn, он читает ту же переменную окружения.
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', 1))
+RECIPES_CACHE_TIMEOUT = 60 * 5
+RECIPE_FRAGMENT_TIMEOUT = 60 * 60 * 24
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -89,6 +117,12 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.TokenAuthentication',
     ],
+
+    'DEFAULT_PARSER_CLASSES': [
+        'api.parsers.LimitedJSONParser',
+        'rest_framework.parsers.FormParser',
+        'api.parsers.LimitedMultiPartParser',
+    ],
 }
 
 DJOSER = {
@@ -115,6 +149,9 @@ STATIC_ROOT = BASE_DIR / 'static'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+EXPORTS_ROOT = BASE_DIR / 'exports'
+SIMILAR_INDEX_ROOT = BASE_DIR / 'similar'
+DEFAULT_FILE_STORAGE = 'recipes.storage.ContentAddressedStorage'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -126,7 +163,81 @@ MAX_VALUE_COOKING_TIME = 32000
 MIN_VALUE_AMOUNT = 1
 MAX_VALUE_AMOUNT = 32000
 
+VIEWER_CONTEXT_LIMIT = 1000
+
+# Рецептов каждого автора в списке подписок: без recipes_limit и наибольшее.
+SUBSCRIPTIONS_RECIPES_LIMIT = 3
+SUBSCRIPTIONS_MAX_RECIPES_LIMIT = 20
+# Рецепты авторов, у которых подписчиков больше, не раскладываются
+# по лентам, а читаются при запросе ленты (см. api.feed). Ленты
+# обновляются после фиксации в фоновом потоке, FEED_SYNC=true - сразу.
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', 10_000))
+FEED_PULL_AUTHORS_TIMEOUT = 60 * 5
+FEED_SYNC = os.getenv('FEED_SYNC', '').lower() == 'true'
+# Веса избранного и корзины в популярности рецепта и периоды
+# полураспада баллов ?ordering=popular и trending в секундах.
+RANKING_WEIGHTS = {'favorite': 1.0, 'shopping_cart': 0.5}
+POPULAR_HALF_LIFE = 60 * 60 * 24 * 30
+TRENDING_HALF_LIFE = 60 * 60 * 24
+# Как часто (в секундах) индекс названий ингредиентов сверяется с базой
+# на случай загрузки в обход сигналов (см. api.search).
+INGREDIENT_INDEX_CHECK_INTERVAL = 60
+# Наибольшее число подсказок в ответе на ?name=.
+INGREDIENT_SEARCH_LIMIT = 50
+# Поиск рецептов по ?ingredients=: наибольшее число ингредиентов в
+# запросе и журнал изменений в базе, по которому догоняют индексы
+# процессов (см. api.recipe_index); при большем отставании индекс
+# строится заново. Записи журнала перечитываются ещё
+# RECIPE_INDEX_COMMIT_GRACE секунд - на поздние записи и расхождение
+# часов серверов.
+INGREDIENT_SEARCH_MAX_INGREDIENTS = 20
+RECIPE_INDEX_CHANGES_TIMEOUT = 60 * 60
+RECIPE_INDEX_MAX_CHANGES = 1000
+RECIPE_INDEX_COMMIT_GRACE = 30
+# Похожие рецепты (api.similar): подпись MinHash из SIMILAR_PERMUTATIONS
+# хешей, полосы LSH по SIMILAR_BAND_ROWS значений - общая полоса у рецептов
+# со сходством около (1 / 32) ** (1 / 2) = 0.18 и выше. Корзины
+# пересобираются в фоновом потоке, когда изменённых рецептов больше
+# SIMILAR_MAX_EXTRA.
+SIMILAR_PERMUTATIONS = 64
+SIMILAR_BAND_ROWS = 2
+SIMILAR_BUCKET_LIMIT = 200
+SIMILAR_MAX_CANDIDATES = 2000
+SIMILAR_MAX_EXTRA = 1000
+SIMILAR_LIMIT = 6
+SIMILAR_MAX_LIMIT = 20
+
+SEARCH_CONFIG = 'russian'
+
+MAX_IMAGE_SIZE = 10 * 1024 * 1024
+MAX_IMAGE_PIXELS = 40_000_000
+MAX_REQUEST_BODY_SIZE = MAX_IMAGE_SIZE * 4 // 3 + 1024 * 1024
+
+IMAGE_VARIANTS = {
+    'small': 320,
+    'medium': 800,
+}
+IMAGE_FORMATS = ('webp', 'jpeg')
+IMAGE_QUALITY = 80
+# Качество повёрнутого по EXIF оригинала (recipes.images.strip_metadata).
+ORIGINAL_IMAGE_QUALITY = 92
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+IMAGE_PROCESSING_SYNC = (
+    os.getenv('IMAGE_PROCESSING_SYNC', '').lower() == 'true'
+)
+
 PDF_SIZE_FONT = 9
 CELL_WIDTH = 300
 CELL_HEIGHT = 15
 CELL_AUTO_WIDTH = 100
+# Суммарный размер готовых списков покупок в памяти процесса.
+SHOPPING_LIST_CACHE_SIZE = int(
+    os.getenv('SHOPPING_LIST_CACHE_SIZE', 32 * 2 ** 20)
+)
+
+EXPORT_WORKERS = int(os.getenv('EXPORT_WORKERS', 2))
+EXPORT_SYNC = os.getenv('EXPORT_SYNC', '').lower() == 'true'
+# Через сколько часов готовые выгрузки удаляются cleanup_exports.
+EXPORT_RETENTION_HOURS = int(os.getenv('EXPORT_RETENTION_HOURS', 24))
+# Через сколько секунд зависшая выгрузка снова ставится в очередь.
+EXPORT_TIMEOUT = 10 * 60
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
 
 application = get_wsgi_application()
+
+# Воркеры gunicorn не должны держать версии кэша каждый у себя.
+from api.cache import check_shared_cache  # noqa: E402
+
+check_shared_cache()
@@ -5,7 +5,8 @@ from recipes.models import (Tag,
                             IngredientRecipe,
                             Recipe,
                             Favorite,
-                            ShoppingCart)
+                            ShoppingCart,
+                            ShoppingListExport)
 
 
 @admin.register(Tag)
@@ -46,7 +47,9 @@ class RecipeAdmin(admin.ModelAdmin):
         'id',
         'author',
         'name',
-        'pub_date'
+        'pub_date',
+        'favorites_count',
+        'cart_count'
     )
     search_fields = (
         'name',
@@ -80,3 +83,19 @@ class ShoppingCartAdmin(admin.ModelAdmin):
         'user',
         'recipe'
     )
+
+
+@admin.register(ShoppingListExport)
+class ShoppingListExportAdmin(admin.ModelAdmin):
+    list_display = (
+        'id',
+        'user',
+        'format',
+        'status',
+        'created',
+        'finished'
+    )
+    list_filter = (
+        'status',
+        'format'
+    )
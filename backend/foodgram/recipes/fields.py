@@ -0,0 +1,139 @@
+import binascii
+import string
+import uuid
+from base64 import b64decode
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from PIL import Image
+from rest_framework import serializers
+from rest_framework.fields import SkipField
+
+from .images import strip_metadata
+
+CHUNK_SIZE = 64 * 1024
+# Переносы строк base64 в формате MIME.
+WHITESPACE = str.maketrans('', '', string.whitespace)
+
+SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'png', 'image/png'),
+    (b'\xff\xd8\xff', 'jpg', 'image/jpeg'),
+    (b'GIF87a', 'gif', 'image/gif'),
+    (b'GIF89a', 'gif', 'image/gif'),
+)
+
+
+def detect_image(head):
+    """Расширение и тип по первым байтам файла."""
+    for signature, extension, content_type in SIGNATURES:
+        if head.startswith(signature):
+            return extension, content_type
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp', 'image/webp'
+    return None
+
+
+class StreamingImageField(serializers.ImageField):
+    """Картинка строкой base64 (data URL) или файлом multipart.
+
+    base64 декодируется кусками во временный файл: размер проверяется
+    до декодирования, формат - по первому куску, поэтому в памяти
+    не держится вторая копия картинки. Метаданные (EXIF с GPS и
+    камерой, XMP, комментарии) убираются до сохранения, поэтому имя по
+    хешу содержимого считается уже от очищенного файла. Ссылка http
+    оставляет прежнюю картинку.
+    """
+    default_error_messages = {
+        'invalid_base64': 'Картинка должна быть строкой data:image/...;'
+                          'base64,...',
+        'unsupported': 'Поддерживаются только PNG, JPEG, GIF и WebP.',
+        'too_large': 'Размер картинки больше {max_size} МБ.',
+        'too_many_pixels': 'Картинка больше {max_pixels} пикселей.',
+    }
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            if data.startswith('http'):
+                raise SkipField()
+            data = self.decode(data)
+        elif hasattr(data, 'read'):
+            if getattr(data, 'size', 0) > settings.MAX_IMAGE_SIZE:
+                self.too_large()
+            detected = detect_image(data.read(12))
+            data.seek(0)
+            if detected is None:
+                self.fail('unsupported')
+            data.name = f'{uuid.uuid4()}.{detected[0]}'
+        file = super().to_internal_value(data)
+        width, height = file.image.size
+        if width * height > settings.MAX_IMAGE_PIXELS:
+            self.fail('too_many_pixels',
+                      max_pixels=settings.MAX_IMAGE_PIXELS)
+        return self.strip_metadata(file)
+
+    def strip_metadata(self, file):
+        stripped = TemporaryUploadedFile(
+            file.name, file.content_type, None, None
+        )
+        file.seek(0)
+        try:
+            strip_metadata(file, stripped, settings.ORIGINAL_IMAGE_QUALITY)
+        except (OSError, Image.DecompressionBombError):
+            # verify() не читает данные JPEG, обрезанный файл
+            # обнаруживается только при полном декодировании.
+            stripped.close()
+            self.fail('invalid_image')
+        finally:
+            file.close()
+        stripped.size = stripped.tell()
+        stripped.seek(0)
+        return stripped
+
+    def too_large(self):
+        self.fail('too_large', max_size=settings.MAX_IMAGE_SIZE // 2 ** 20)
+
+    def decode(self, data):
+        header, separator, payload = data.partition(',')
+        if (not separator or not header.startswith('data:image/')
+                or not header.endswith(';base64')):
+            self.fail('invalid_base64')
+        # Пробелы выбрасываются из каждого куска, а остаток меньше
+        # 4 символов переходит в следующий, чтобы декодировались
+        # целые группы.
+        length = len(payload) - sum(map(payload.count, string.whitespace))
+        padding = payload.rstrip()[-2:].count('=')
+        size = length // 4 * 3 - padding
+        if length % 4 or size <= 0:
+            self.fail('invalid_base64')
+        if size > settings.MAX_IMAGE_SIZE:
+            self.too_large()
+        file = None
+        rest = ''
+        try:
+            for start in range(0, len(payload), CHUNK_SIZE):
+                part = rest + payload[
+                    start:start + CHUNK_SIZE
+                ].translate(WHITESPACE)
+                cut = len(part) - len(part) % 4
+                part, rest = part[:cut], part[cut:]
+                if not part:
+                    continue
+                chunk = b64decode(part, validate=True)
+                if file is None:
+                    detected = detect_image(chunk)
+                    if detected is None:
+                        self.fail('unsupported')
+                    extension, content_type = detected
+                    file = TemporaryUploadedFile(
+                        f'{uuid.uuid4()}.{extension}',
+                        content_type,
+                        size,
+                        None
+                    )
+                file.write(chunk)
+        except (binascii.Error, ValueError):
+            if file is not None:
+                file.close()
+            self.fail('invalid_base64')
+        file.seek(0)
+        return file
@@ -0,0 +1,89 @@
+import os
+
+from PIL import Image, ImageOps
+
+FORMATS = {
+    'webp': ('WEBP', '.webp'),
+    'jpeg': ('JPEG', '.jpg'),
+}
+
+ORIENTATION = 0x0112
+# Всё остальное в info (EXIF, XMP, комментарии, текст PNG) не пишется.
+KEPT_INFO = ('icc_profile', 'transparency', 'background', 'duration',
+             'loop', 'dpi')
+
+
+def flatten(image):
+    """Картинка без прозрачности на белом фоне для JPEG."""
+    if image.mode == 'RGB':
+        return image
+    background = Image.new('RGB', image.size, 'white')
+    background.paste(image, mask=image.getchannel('A'))
+    return background
+
+
+def strip_metadata(source, target, quality):
+    """Копия картинки из source в target без метаданных.
+
+    Поворот из EXIF применяется к пикселям. JPEG без поворота
+    пересжимается с исходными таблицами квантования, анимация
+    сохраняется кадрами. Цветовой профиль остаётся.
+    """
+    with Image.open(source) as image:
+        image_format = image.format
+        options = {}
+        if getattr(image, 'is_animated', False):
+            options['save_all'] = True
+        elif image.getexif().get(ORIENTATION, 1) != 1:
+            image = ImageOps.exif_transpose(image)
+            options['quality'] = quality
+        elif image_format == 'JPEG':
+            options.update(quality='keep', subsampling='keep')
+        else:
+            options['quality'] = quality
+        image.info = {
+            key: value for key, value in image.info.items()
+            if key in KEPT_INFO
+        }
+        image.save(target, image_format, **options)
+
+
+def make_variants(root, name, sizes, formats, quality):
+    """Уменьшенные копии картинки рецепта без метаданных.
+
+    Работает без Django, чтобы выполняться в отдельном процессе.
+    sizes - {метка: наибольшая сторона}, formats - ключи FORMATS.
+    Копии сохраняются рядом с оригиналом в папку variants. Оригинал
+    только читается: его имя - хеш содержимого (recipes.storage).
+    """
+    path = os.path.join(root, name)
+    folder, filename = os.path.split(name)
+    stem = os.path.splitext(filename)[0]
+    os.makedirs(os.path.join(root, folder, 'variants'), exist_ok=True)
+    with Image.open(path) as original:
+        image = ImageOps.exif_transpose(original)
+        has_alpha = 'A' in image.getbands() or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+    variants = {}
+    for label, size in sizes.items():
+        resized = image.copy()
+        resized.thumbnail((size, size), Image.LANCZOS)
+        variants[label] = {}
+        for key in formats:
+            image_format, extension = FORMATS[key]
+            variant = os.path.join(
+                folder, 'variants', f'{stem}_{label}{extension}'
+            )
+            output = flatten(resized) if image_format == 'JPEG' else resized
+            output.save(
+                os.path.join(root, variant),
+                image_format,
+                quality=quality,
+                optimize=True
+            )
+            variants[label][key] = variant
+    return {
+        'width': image.width,
+        'height': image.height,
+        'variants': variants,
+    }
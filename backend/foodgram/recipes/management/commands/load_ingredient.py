@@ -1,27 +1,177 @@
 import csv
+import io
+import json
+import time
+from itertools import chain, islice
+from pathlib import Path
 
 from django.conf import settings
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
 
+from api.cache import INGREDIENTS_VERSION_KEY, recipes_changed
 from recipes.models import Ingredient
 
+MAX_LENGTH = 256
+CHUNK_SIZE = 64 * 1024
+ARRAY_SEPARATORS = ', \t\r\n'
+
+
+def read_csv(file):
+    for data in csv.DictReader(file):
+        yield data.get('name'), data.get('measurement_unit')
+
+
+def read_array(file):
+    """Элементы JSON-массива по одному, файл читается кусками.
+
+    В памяти - текущий кусок и недочитанный элемент, а не весь массив.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    while True:
+        while position < len(buffer) and buffer[position] in ARRAY_SEPARATORS:
+            position += 1
+        if buffer[position:position + 1] == ']':
+            return
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except ValueError:
+            chunk = file.read(CHUNK_SIZE)
+            if not chunk:
+                raise ValueError('массив JSON не закончен')
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item
+
+
+def read_json(file):
+    """Массив объектов или JSON Lines, и то и другое потоково."""
+    head = file.read(1)
+    while head.isspace():
+        head = file.read(1)
+    if head == '[':
+        items = read_array(file)
+    else:
+        items = (
+            json.loads(line)
+            for line in chain((head + file.readline(),), file)
+            if line.strip()
+        )
+    for data in items:
+        for item in data if isinstance(data, list) else (data,):
+            yield item.get('name'), item.get('measurement_unit')
+
+
+READERS = {'csv': read_csv, 'json': read_json}
+
 
 class Command(BaseCommand):
-    help = 'Load ingredients from a CSV file'
-
-    def handle(self, *args, **kwargs):
-        data_path = settings.BASE_DIR
-        with open(
-            f'{data_path}/ingredients.csv',
-            'r',
-            encoding='utf-8'
-        ) as file:
-            reader = csv.DictReader(file)
-            for data in reader:
-                name = data.get('name')
-                measurement_unit = data.get('measurement_unit')
-                Ingredient.objects.create(
-                    name=name,
-                    measurement_unit=measurement_unit
+    help = ('Load ingredients from a CSV or JSON file, skipping ones '
+            'that already exist')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default=str(Path(settings.BASE_DIR) / 'ingredients.csv')
+        )
+        parser.add_argument(
+            '--format',
+            choices=READERS,
+            help='File format, by default taken from the extension'
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        file_format = options['format'] or path.suffix.lstrip('.').lower()
+        if file_format == 'jsonl':
+            file_format = 'json'
+        if file_format not in READERS:
+            raise CommandError(f'Неизвестный формат файла: {path}')
+        if options['batch_size'] < 1:
+            raise CommandError('Размер пачки должен быть больше нуля.')
+        start = time.perf_counter()
+        self.read = self.created = 0
+        try:
+            with open(path, encoding='utf-8', newline='') as file:
+                rows = self.clean(READERS[file_format](file))
+                with transaction.atomic():
+                    if connection.vendor == 'postgresql':
+                        self.copy(rows, options['batch_size'])
+                    else:
+                        self.bulk_create(rows, options['batch_size'])
+                    recipes_changed(catalog=(INGREDIENTS_VERSION_KEY,))
+            self.skipped = self.read - self.created
+        except OSError as error:
+            raise CommandError(error)
+        except (ValueError, AttributeError) as error:
+            raise CommandError(f'Не удалось разобрать {path}: {error}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Все ингридиенты загружены! Прочитано строк: {self.read}, '
+            f'добавлено: {self.created}, пропущено: {self.skipped}, '
+            f'время: {time.perf_counter() - start:.2f} с'
+        ))
+
+    def clean(self, rows):
+        for name, measurement_unit in rows:
+            self.read += 1
+            name = (name or '').strip()
+            measurement_unit = (measurement_unit or '').strip()
+            if (name and measurement_unit
+                    and len(name) <= MAX_LENGTH
+                    and len(measurement_unit) <= MAX_LENGTH):
+                yield name, measurement_unit
+
+    def batches(self, rows, batch_size):
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                return
+            yield batch
+            self.stdout.write(f'Обработано строк: {self.read}', ending='\r')
+            self.stdout.flush()
+
+    def bulk_create(self, rows, batch_size):
+        before = Ingredient.objects.count()
+        seen = set()
+        for batch in self.batches(rows, batch_size):
+            objs = []
+            for key in batch:
+                if key not in seen:
+                    seen.add(key)
+                    objs.append(Ingredient(
+                        name=key[0], measurement_unit=key[1]
+                    ))
+            Ingredient.objects.bulk_create(objs, ignore_conflicts=True)
+        self.stdout.write('')
+        self.created = Ingredient.objects.count() - before
+
+    def copy(self, rows, batch_size):
+        """COPY во временную таблицу и одна вставка без дубликатов."""
+        table = Ingredient._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMPORARY TABLE ingredient_import '
+                '(name varchar(256), measurement_unit varchar(256)) '
+                'ON COMMIT DROP'
+            )
+            for batch in self.batches(rows, batch_size):
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(batch)
+                buffer.seek(0)
+                cursor.cursor.copy_expert(
+                    'COPY ingredient_import FROM STDIN WITH (FORMAT csv)',
+                    buffer
                 )
-        self.stdout.write(self.style.SUCCESS('Все ингридиенты загружены!'))
+            self.stdout.write('')
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT DISTINCT name, measurement_unit '
+                'FROM ingredient_import '
+                'ON CONFLICT (name, measurement_unit) DO NOTHING'
+            )
+            self.created = cursor.rowcount
@@ -0,0 +1,102 @@
+import os
+import posixpath
+import shutil
+
+from django.core.files.storage import default_storage
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+
+from api.cache import recipes_changed
+from recipes.models import ImageBlob, Recipe
+from recipes.storage import (ContentAddressedStorage,
+                             add_references,
+                             file_hash,
+                             hashed_name,
+                             is_hashed)
+
+
+class Command(BaseCommand):
+    help = ('Move recipe images to content-addressed names, merging '
+            'identical files, and report the space saved')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report what would be done'
+        )
+
+    def handle(self, *args, **options):
+        if not isinstance(default_storage, ContentAddressedStorage):
+            raise CommandError(
+                'DEFAULT_FILE_STORAGE должно быть ContentAddressedStorage.'
+            )
+        dry_run = options['dry_run']
+        names = Recipe.objects.exclude(image='').exclude(
+            image__isnull=True
+        ).order_by().values_list('image', flat=True).distinct()
+        moved = merged = missing = saved = 0
+        targets = set()
+        for name in list(names):
+            if is_hashed(name):
+                continue
+            if not default_storage.exists(name):
+                missing += 1
+                self.stderr.write(f'Файл не найден: {name}')
+                continue
+            size = default_storage.size(name)
+            with default_storage.open(name) as file:
+                target = hashed_name(name, file_hash(file))
+            if default_storage.exists(target) or target in targets:
+                merged += 1
+                saved += size
+            else:
+                moved += 1
+            targets.add(target)
+            if not dry_run:
+                self.migrate(name, target)
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Проверка" if dry_run else "Готово"}! Перемещено файлов: '
+            f'{moved}, объединено дубликатов: {merged}, не найдено: '
+            f'{missing}, освобождено: {saved / 2 ** 20:.2f} МБ '
+            f'({saved} байт)'
+        ))
+        if not dry_run and moved + merged:
+            self.stdout.write(
+                'Уменьшенные копии сброшены, создайте их заново: '
+                'python manage.py process_images'
+            )
+
+    def migrate(self, name, target):
+        """Перенос файла и ссылок на него под имя по хешу содержимого.
+
+        Файл копируется под новым именем в транзакции, а старый файл и
+        уменьшенные копии удаляются только после её фиксации: при откате
+        рецепты по-прежнему ссылаются на существующий файл.
+        """
+        with transaction.atomic():
+            recipes = Recipe.objects.filter(image=name)
+            variants = list(recipes.values_list('image_variants', flat=True))
+            ids = list(recipes.values_list('id', flat=True))
+            # Ссылки переходят к новому имени до копирования файла.
+            add_references(target, len(ids))
+            ImageBlob.objects.filter(name=name).delete()
+            if not default_storage.exists(target):
+                path = default_storage.path(target)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                shutil.copyfile(default_storage.path(name), f'{path}.tmp')
+                os.replace(f'{path}.tmp', path)
+            recipes.update(image=target, image_variants={})
+            recipes_changed(recipe_ids=ids)
+            transaction.on_commit(
+                lambda: self.delete_old(name, target, variants)
+            )
+
+    def delete_old(self, name, target, variants):
+        default_storage.delete(name)
+        stem = posixpath.splitext(posixpath.basename(target))[0]
+        for recipe_variants in variants:
+            for formats in recipe_variants.values():
+                for variant in formats.values():
+                    if stem not in variant:
+                        default_storage.delete(variant)
@@ -0,0 +1,60 @@
+# Generated by Django 3.2 on 2026-10-18 12:01
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+SEARCH_VECTOR = (
+    "setweight(to_tsvector('pg_catalog.russian', coalesce({0}name, '')), 'A')"
+    " || setweight(to_tsvector('pg_catalog.russian', coalesce({0}text, '')),"
+    " 'B')"
+)
+
+CREATE_SQL = (
+    'CREATE FUNCTION recipes_recipe_search_vector_update() '
+    'RETURNS trigger AS $$ BEGIN '
+    'NEW.search_vector := ' + SEARCH_VECTOR.format('NEW.') + '; '
+    'RETURN NEW; END $$ LANGUAGE plpgsql',
+    'CREATE TRIGGER recipes_recipe_search_vector_trigger '
+    'BEFORE INSERT OR UPDATE OF name, text ON recipes_recipe '
+    'FOR EACH ROW EXECUTE PROCEDURE recipes_recipe_search_vector_update()',
+    'UPDATE recipes_recipe SET search_vector = ' + SEARCH_VECTOR.format(''),
+    'CREATE INDEX recipe_search_vector_idx '
+    'ON recipes_recipe USING gin (search_vector)',
+)
+
+DROP_SQL = (
+    'DROP INDEX IF EXISTS recipe_search_vector_idx',
+    'DROP TRIGGER IF EXISTS recipes_recipe_search_vector_trigger '
+    'ON recipes_recipe',
+    'DROP FUNCTION IF EXISTS recipes_recipe_search_vector_update()',
+)
+
+
+def create_search_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for sql in CREATE_SQL:
+        schema_editor.execute(sql)
+
+
+def drop_search_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for sql in DROP_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_recipe_pub_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(create_search_trigger, drop_search_trigger),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 3.2 on 2026-10-18 12:05
+
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicates(apps, schema_editor):
+    """Повторно загруженные ингредиенты сводятся к первому экземпляру.
+
+    Если в рецепте были несколько экземпляров одного ингредиента,
+    остаётся одна строка с суммой количеств.
+    """
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    IngredientRecipe = apps.get_model('recipes', 'IngredientRecipe')
+    duplicates = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(
+        first_id=Min('id'), total=Count('id')
+    ).filter(total__gt=1).order_by()
+    for group in duplicates:
+        extra = Ingredient.objects.filter(
+            name=group['name'],
+            measurement_unit=group['measurement_unit']
+        ).exclude(id=group['first_id'])
+        IngredientRecipe.objects.filter(ingredient__in=extra).update(
+            ingredient_id=group['first_id']
+        )
+        extra.delete()
+        repeated = IngredientRecipe.objects.filter(
+            ingredient_id=group['first_id']
+        ).values('recipe_id').annotate(
+            first_id=Min('id'), amount=Sum('amount'), total=Count('id')
+        ).filter(total__gt=1).order_by()
+        for row in repeated:
+            IngredientRecipe.objects.filter(pk=row['first_id']).update(
+                amount=min(row['amount'], settings.MAX_VALUE_AMOUNT)
+            )
+            IngredientRecipe.objects.filter(
+                recipe_id=row['recipe_id'], ingredient_id=group['first_id']
+            ).exclude(pk=row['first_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+    ]
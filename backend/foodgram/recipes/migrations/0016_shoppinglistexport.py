@@ -0,0 +1,40 @@
+# Generated by Django 3.2 on 2026-10-18 12:31
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import recipes.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0015_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListExport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('format', models.CharField(choices=[('pdf', 'PDF'), ('txt', 'Текст'), ('csv', 'CSV')], default='pdf', max_length=3, verbose_name='Формат')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Формируется'), ('done', 'Готово'), ('failed', 'Ошибка')], default='pending', max_length=7, verbose_name='Статус')),
+                ('file', models.FileField(blank=True, storage=recipes.storage.ExportStorage(), upload_to='exports/', verbose_name='Файл')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Создана')),
+                ('started', models.DateTimeField(null=True, verbose_name='Начата')),
+                ('finished', models.DateTimeField(null=True, verbose_name='Завершена')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list_exports', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Выгрузка списка покупок',
+                'verbose_name_plural': 'Выгрузки списков покупок',
+                'ordering': ('-created',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='shoppinglistexport',
+            index=models.Index(fields=['status', 'created'], name='export_status_created_idx'),
+        ),
+    ]
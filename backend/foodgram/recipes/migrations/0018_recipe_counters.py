@@ -0,0 +1,64 @@
+# Generated by Django 3.2 on 2026-10-18 12:39
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+COUNTERS = (
+    ('Recipe', 'favorites_count', 'Favorite', 'recipe'),
+    ('Recipe', 'cart_count', 'ShoppingCart', 'recipe'),
+    ('User', 'recipes_count', 'Recipe', 'author'),
+    ('User', 'followers_count', 'Subscribe', 'author'),
+    ('User', 'following_count', 'Subscribe', 'user'),
+)
+APPS = {
+    'Recipe': 'recipes',
+    'Favorite': 'recipes',
+    'ShoppingCart': 'recipes',
+    'User': 'users',
+    'Subscribe': 'users',
+}
+
+
+def fill_counters(apps, schema_editor):
+    """Начальные значения счётчиков по таблицам связей."""
+    for model, field, related, relation in COUNTERS:
+        model = apps.get_model(APPS[model], model)
+        related = apps.get_model(APPS[related], related)
+        model.objects.update(**{field: Coalesce(
+            Subquery(
+                related.objects.filter(
+                    **{relation: OuterRef('pk')}
+                ).order_by().values(relation).annotate(
+                    total=Count('pk')
+                ).values('total'),
+                output_field=IntegerField()
+            ),
+            0
+        )})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0017_feedentry'),
+        ('users', '0011_user_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='cart_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В корзинах'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-favorites_count', '-pub_date', 'id'], name='recipe_favorites_count_idx'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 3.2 on 2026-10-18 12:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def add_scores(apps, schema_editor):
+    """Нулевые баллы существующих рецептов, счёт - refresh_scores."""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeScore = apps.get_model('recipes', 'RecipeScore')
+    RecipeScore.objects.bulk_create(
+        [RecipeScore(recipe_id=pk)
+         for pk in Recipe.objects.values_list('id', flat=True)],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0018_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RankingState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('favorite_id', models.PositiveBigIntegerField(default=0, verbose_name='Последнее учтённое избранное')),
+                ('shopping_cart_id', models.PositiveBigIntegerField(default=0, verbose_name='Последняя учтённая корзина')),
+                ('epoch', models.DateTimeField(verbose_name='Эпоха баллов')),
+                ('refreshed', models.DateTimeField(null=True, verbose_name='Пересчитано')),
+            ],
+            options={
+                'verbose_name': 'Состояние рейтинга',
+                'verbose_name_plural': 'Состояние рейтинга',
+            },
+        ),
+        migrations.CreateModel(
+            name='RecipeScore',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='score', serialize=False, to='recipes.recipe', verbose_name='Рецепт')),
+                ('popular', models.FloatField(default=0, verbose_name='Популярность')),
+                ('trending', models.FloatField(default=0, verbose_name='Популярность за последние дни')),
+            ],
+            options={
+                'verbose_name': 'Популярность рецепта',
+                'verbose_name_plural': 'Популярность рецептов',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='recipescore',
+            index=models.Index(fields=['-popular', 'recipe'], name='score_popular_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipescore',
+            index=models.Index(fields=['-trending', 'recipe'], name='score_trending_idx'),
+        ),
+        migrations.RunPython(add_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 3.2 on 2026-10-18 13:13
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_references(apps, schema_editor):
+    """Ссылки на уже загруженные картинки - число рецептов с ними."""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    ImageBlob = apps.get_model('recipes', 'ImageBlob')
+    ImageBlob.objects.bulk_create(
+        [ImageBlob(name=row['image'], references=row['total'])
+         for row in Recipe.objects.exclude(image='').values(
+             'image'
+         ).annotate(total=Count('id')).order_by()],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0019_recipescore'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Файл')),
+                ('references', models.PositiveIntegerField(default=0, verbose_name='Ссылок')),
+            ],
+            options={
+                'verbose_name': 'Файл картинки',
+                'verbose_name_plural': 'Файлы картинок',
+            },
+        ),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 3.2 on 2026-10-18 13:18
+
+from django.db import migrations
+from django.db.models import Count, IntegerField, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def remove_duplicates(apps, schema_editor):
+    """Повторные избранное и корзины удаляются, счётчики пересчитываются."""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    for model, field in (('Favorite', 'favorites_count'),
+                         ('ShoppingCart', 'cart_count')):
+        Model = apps.get_model('recipes', model)
+        duplicates = Model.objects.values('user_id', 'recipe_id').annotate(
+            first_id=Min('id'), total=Count('id')
+        ).filter(total__gt=1).order_by()
+        recipe_ids = set()
+        for row in duplicates:
+            Model.objects.filter(
+                user_id=row['user_id'], recipe_id=row['recipe_id']
+            ).exclude(id=row['first_id']).delete()
+            recipe_ids.add(row['recipe_id'])
+        Recipe.objects.filter(pk__in=recipe_ids).update(**{
+            field: Coalesce(Subquery(
+                Model.objects.filter(
+                    recipe_id=OuterRef('pk')
+                ).order_by().values('recipe_id').annotate(
+                    total=Count('id')
+                ).values('total'),
+                output_field=IntegerField()
+            ), 0)
+        })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0020_imageblob'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+    ]
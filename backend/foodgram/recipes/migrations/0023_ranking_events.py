@@ -0,0 +1,68 @@
+# Generated by Django 3.2 on 2026-10-18 13:21
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def log_uncounted(apps, schema_editor):
+    """События для записей после границы, ещё не учтённых в баллах."""
+    RankingState = apps.get_model('recipes', 'RankingState')
+    RankingEvent = apps.get_model('recipes', 'RankingEvent')
+    state = RankingState.objects.filter(pk=1).first()
+    for model, field, source in (
+        ('Favorite', 'favorite_id', 'favorite'),
+        ('ShoppingCart', 'shopping_cart_id', 'shopping_cart'),
+    ):
+        start = getattr(state, field) if state is not None else 0
+        rows = apps.get_model('recipes', model).objects.filter(
+            id__gt=start
+        ).values_list('recipe_id', 'created')
+        RankingEvent.objects.bulk_create(
+            [RankingEvent(recipe_id=recipe_id, source=source, sign=1,
+                          happened=created)
+             for recipe_id, created in rows.iterator()],
+            batch_size=1000
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0022_favorite_cart_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RankingEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipe_id', models.PositiveBigIntegerField(verbose_name='id рецепта')),
+                ('source', models.CharField(choices=[('favorite', 'Избранное'), ('shopping_cart', 'Корзина')], max_length=16, verbose_name='Источник')),
+                ('sign', models.SmallIntegerField(verbose_name='Знак')),
+                ('happened', models.DateTimeField(verbose_name='Время добавления записи')),
+            ],
+            options={
+                'verbose_name': 'Событие рейтинга',
+                'verbose_name_plural': 'События рейтинга',
+            },
+        ),
+        migrations.AddField(
+            model_name='favorite',
+            name='created',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Добавлено'),
+        ),
+        migrations.AddField(
+            model_name='shoppingcart',
+            name='created',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Добавлено'),
+        ),
+        migrations.RunPython(log_uncounted, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='rankingstate',
+            name='favorite_id',
+        ),
+        migrations.RemoveField(
+            model_name='rankingstate',
+            name='shopping_cart_id',
+        ),
+    ]
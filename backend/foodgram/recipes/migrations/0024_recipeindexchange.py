@@ -0,0 +1,25 @@
+# Generated by Django 3.2 on 2026-10-18 13:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0023_ranking_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeIndexChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipe_id', models.PositiveBigIntegerField(verbose_name='id рецепта')),
+                ('changed', models.DateTimeField(db_index=True, verbose_name='Изменён')),
+            ],
+            options={
+                'verbose_name': 'Изменение индекса ингредиентов',
+                'verbose_name_plural': 'Изменения индекса ингредиентов',
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 3.2 on 2026-10-18 13:42
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+import recipes.storage
+
+
+def fail_duplicates(apps, schema_editor):
+    """Из повторных незавершённых выгрузок остаётся последняя."""
+    ShoppingListExport = apps.get_model('recipes', 'ShoppingListExport')
+    unfinished = ShoppingListExport.objects.filter(
+        status__in=('pending', 'running')
+    )
+    duplicates = unfinished.values('user_id', 'format').annotate(
+        last_id=Max('id'), total=Count('id')
+    ).filter(total__gt=1).order_by()
+    for row in duplicates:
+        unfinished.filter(
+            user_id=row['user_id'], format=row['format']
+        ).exclude(id=row['last_id']).update(
+            status='failed', error='Повторная выгрузка'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0024_recipeindexchange'),
+    ]
+
+    operations = [
+        migrations.RunPython(fail_duplicates, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='shoppinglistexport',
+            name='file',
+            field=models.FileField(blank=True, storage=recipes.storage.ExportStorage(), upload_to='', verbose_name='Файл'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglistexport',
+            constraint=models.UniqueConstraint(condition=models.Q(status__in=('pending', 'running')), fields=('user', 'format'), name='unique_unfinished_export'),
+        ),
+    ]
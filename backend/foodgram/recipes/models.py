@@ -1,12 +1,15 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import (RegexValidator,
                                     MinValueValidator,
                                     MaxValueValidator)
 from django.db import models
+from django.utils import timezone
 
 from foodgram.settings import (MIN_VALUE_COOKING_TIME,
                                MAX_VALUE_COOKING_TIME,
                                MIN_VALUE_AMOUNT,
                                MAX_VALUE_AMOUNT)
+from recipes.storage import ExportStorage
 from users.models import User
 
 
@@ -25,6 +28,10 @@ class Ingredient(models.Model):
         ordering = ('name',)
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'measurement_unit'],
+                                    name='unique_ingredient')
+        ]
 
     def __str__(self):
         return self.name
@@ -78,6 +85,21 @@ class Recipe(models.Model):
         'Картинка',
         upload_to='recipes/',
     )
+    image_width = models.PositiveIntegerField(
+        'Ширина картинки',
+        null=True,
+        editable=False
+    )
+    image_height = models.PositiveIntegerField(
+        'Высота картинки',
+        null=True,
+        editable=False
+    )
+    image_variants = models.JSONField(
+        'Уменьшенные копии картинки',
+        default=dict,
+        editable=False
+    )
     text = models.TextField(
         'Описание'
     )
@@ -108,9 +130,38 @@ class Recipe(models.Model):
         auto_now_add=True,
         null=True
     )
+    search_vector = SearchVectorField(
+        'Поисковый вектор',
+        null=True,
+        editable=False
+    )
+    favorites_count = models.PositiveIntegerField(
+        'В избранном',
+        default=0,
+        editable=False
+    )
+    cart_count = models.PositiveIntegerField(
+        'В корзинах',
+        default=0,
+        editable=False
+    )
 
     class Meta:
         ordering = ('-pub_date',)
+        indexes = (
+            models.Index(
+                fields=('-pub_date', 'id'),
+                name='recipe_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=('author', '-pub_date', '-id'),
+                name='recipe_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=('-favorites_count', '-pub_date', 'id'),
+                name='recipe_favorites_count_idx'
+            ),
+        )
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
 
@@ -167,11 +218,19 @@ class Favorite(models.Model):
         related_name='recipe',
         verbose_name='Рецепт'
     )
+    created = models.DateTimeField(
+        'Добавлено',
+        default=timezone.now
+    )
 
     class Meta:
         ordering = ('user', )
         verbose_name = 'Избранное'
         verbose_name_plural = 'Избранное'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'recipe'],
+                                    name='unique_favorite')
+        ]
 
     def __str__(self):
         return f'{self.user} > {self.recipe}'
@@ -190,11 +249,252 @@ class ShoppingCart(models.Model):
         related_name='shop_cart',
         verbose_name='Рецепт'
     )
+    created = models.DateTimeField(
+        'Добавлено',
+        default=timezone.now
+    )
 
     class Meta:
         ordering = ('user',)
         verbose_name = 'Корзина'
         verbose_name_plural = 'Корзина'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'recipe'],
+                                    name='unique_shopping_cart')
+        ]
 
     def __str__(self):
         return f'{self.user} > {self.recipe}'
+
+
+class FeedEntry(models.Model):
+    """Рецепт в ленте подписчика автора, см. api.feed."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed',
+        verbose_name='Подписчик'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт'
+    )
+    pub_date = models.DateTimeField(
+        'Дата публикации',
+        null=True
+    )
+
+    class Meta:
+        ordering = ('-pub_date', '-recipe_id')
+        indexes = (
+            models.Index(
+                fields=('user', '-pub_date', '-recipe'),
+                name='feed_user_pub_date_idx'
+            ),
+        )
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'recipe'],
+                                    name='unique_feed_entry')
+        ]
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи лент'
+
+    def __str__(self):
+        return f'{self.user} > {self.recipe}'
+
+
+class RecipeScore(models.Model):
+    """Популярность рецепта, пересчитывается api.ranking.
+
+    Баллы хранятся в масштабе эпохи RankingState.epoch, поэтому
+    для сортировки их не нужно уменьшать со временем.
+    """
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='score',
+        verbose_name='Рецепт'
+    )
+    popular = models.FloatField(
+        'Популярность',
+        default=0
+    )
+    trending = models.FloatField(
+        'Популярность за последние дни',
+        default=0
+    )
+
+    class Meta:
+        indexes = (
+            models.Index(
+                fields=('-popular', 'recipe'),
+                name='score_popular_idx'
+            ),
+            models.Index(
+                fields=('-trending', 'recipe'),
+                name='score_trending_idx'
+            ),
+        )
+        verbose_name = 'Популярность рецепта'
+        verbose_name_plural = 'Популярность рецептов'
+
+    def __str__(self):
+        return f'{self.recipe_id}: {self.popular:.2f} / {self.trending:.2f}'
+
+
+class RankingState(models.Model):
+    """Эпоха баллов RecipeScore и время последнего пересчёта."""
+    epoch = models.DateTimeField('Эпоха баллов')
+    refreshed = models.DateTimeField('Пересчитано', null=True)
+
+    class Meta:
+        verbose_name = 'Состояние рейтинга'
+        verbose_name_plural = 'Состояние рейтинга'
+
+    def __str__(self):
+        return f'{self.refreshed}'
+
+
+class RankingEvent(models.Model):
+    """Добавление (+1) или удаление (-1) избранного или корзины.
+
+    Журнал для api.ranking: пересчёт учитывает события в баллах и
+    удаляет их в той же транзакции. Рецепт без внешнего ключа: при
+    удалении рецепта удаление его избранного тоже попадает в журнал.
+    """
+    FAVORITE = 'favorite'
+    SHOPPING_CART = 'shopping_cart'
+    SOURCES = (
+        (FAVORITE, 'Избранное'),
+        (SHOPPING_CART, 'Корзина'),
+    )
+    recipe_id = models.PositiveBigIntegerField('id рецепта')
+    source = models.CharField('Источник', max_length=16, choices=SOURCES)
+    sign = models.SmallIntegerField('Знак')
+    happened = models.DateTimeField('Время добавления записи')
+
+    class Meta:
+        verbose_name = 'Событие рейтинга'
+        verbose_name_plural = 'События рейтинга'
+
+    def __str__(self):
+        return f'{self.source} {self.sign:+d} > {self.recipe_id}'
+
+
+class RecipeIndexChange(models.Model):
+    """Рецепт с изменёнными ингредиентами, журнал для api.recipe_index."""
+    recipe_id = models.PositiveBigIntegerField('id рецепта')
+    changed = models.DateTimeField('Изменён', db_index=True)
+
+    class Meta:
+        verbose_name = 'Изменение индекса ингредиентов'
+        verbose_name_plural = 'Изменения индекса ингредиентов'
+
+    def __str__(self):
+        return f'{self.recipe_id} {self.changed}'
+
+
+class ShoppingListExport(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Формируется'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+    )
+    FORMATS = (
+        ('pdf', 'PDF'),
+        ('txt', 'Текст'),
+        ('csv', 'CSV'),
+    )
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_exports',
+        verbose_name='Пользователь'
+    )
+    format = models.CharField(
+        'Формат',
+        max_length=3,
+        choices=FORMATS,
+        default='pdf'
+    )
+    status = models.CharField(
+        'Статус',
+        max_length=7,
+        choices=STATUSES,
+        default=PENDING
+    )
+    file = models.FileField(
+        'Файл',
+        storage=ExportStorage(),
+        blank=True
+    )
+    error = models.TextField(
+        'Ошибка',
+        blank=True
+    )
+    created = models.DateTimeField(
+        'Создана',
+        auto_now_add=True
+    )
+    started = models.DateTimeField(
+        'Начата',
+        null=True
+    )
+    finished = models.DateTimeField(
+        'Завершена',
+        null=True
+    )
+
+    class Meta:
+        ordering = ('-created',)
+        indexes = (
+            models.Index(
+                fields=('status', 'created'),
+                name='export_status_created_idx'
+            ),
+        )
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'format'],
+                condition=models.Q(status__in=('pending', 'running')),
+                name='unique_unfinished_export'
+            )
+        ]
+        verbose_name = 'Выгрузка списка покупок'
+        verbose_name_plural = 'Выгрузки списков покупок'
+
+    def __str__(self):
+        return f'{self.user} > {self.format} ({self.status})'
+
+
+class ImageBlob(models.Model):
+    """Файл картинки в ContentAddressedStorage и число ссылок на него.
+
+    Строка блокируется на время изменения счётчика, поэтому повторная
+    загрузка и удаление того же файла не пересекаются (api.images).
+    """
+    name = models.CharField(
+        'Файл',
+        max_length=255,
+        unique=True
+    )
+    references = models.PositiveIntegerField(
+        'Ссылок',
+        default=0
+    )
+
+    class Meta:
+        verbose_name = 'Файл картинки'
+        verbose_name_plural = 'Файлы картинок'
+
+    def __str__(self):
+        return f'{self.name} ({self.references})'
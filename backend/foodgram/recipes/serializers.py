@@ -1,14 +1,29 @@
+import json
+from collections import OrderedDict
+
 from djoser.serializers import UserSerializer
-from rest_framework import serializers, exceptions
+from rest_framework import serializers
+from rest_framework.reverse import reverse
 from drf_base64.fields import Base64ImageField
 
 from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Manager, Prefetch, prefetch_related_objects
+from django.http import QueryDict
+from api.cache import carts_changed, get_fragments, recipes_changed
+from api.images import release_image, schedule_image_processing
+from api.recipe_index import recipe_ingredients_changed
+from api.similar import similar_changed
+from api.viewer import ViewerContext
+from .fields import StreamingImageField
 from .models import (Recipe,
                      Ingredient,
                      Tag,
                      IngredientRecipe,
                      Favorite,
-                     ShoppingCart)
+                     ShoppingCart,
+                     ShoppingListExport)
 
 from users.models import User
 
@@ -31,14 +46,48 @@ class UsersSerializer(UserSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        if user.is_anonymous:
-            return False
-        return obj.following_users.exists()
+        return ViewerContext.for_request(
+            self.context.get('request')
+        ).is_subscribed(obj)
+
+
+class AuthorSerializer(UserSerializer):
+    """Автор рецепта без признака подписки."""
+
+    class Meta:
+        model = User
+        fields = (
+            'id',
+            'email',
+            'username',
+            'first_name',
+            'last_name'
+        )
+
+
+def variant_urls(variants, request=None):
+    """Адреса уменьшенных копий картинки: {размер: {формат: url}}."""
+    return {
+        label: {
+            key: (
+                request.build_absolute_uri(url) if request is not None
+                else url
+            ) for key, url in formats.items()
+        } for label, formats in variants.items()
+    }
+
+
+def variant_names_to_urls(variants):
+    return {
+        label: {
+            key: default_storage.url(name) for key, name in formats.items()
+        } for label, formats in variants.items()
+    }
 
 
 class RecipesSerializer(serializers.ModelSerializer):
     image = Base64ImageField()
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
@@ -46,9 +95,16 @@ class RecipesSerializer(serializers.ModelSerializer):
             'id',
             'name',
             'image',
+            'image_variants',
             'cooking_time'
         )
 
+    def get_image_variants(self, obj):
+        return variant_urls(
+            variant_names_to_urls(obj.image_variants),
+            self.context.get('request')
+        )
+
 
 class IngredientSerializer(serializers.ModelSerializer):
     """Сериализация ингредиетов."""
@@ -117,11 +173,8 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
     """Сериализация создания рецепта."""
     author = UsersSerializer(read_only=True)
     ingredients = CreateIngredientSerializer(many=True)
-    image = Base64ImageField()
-    tags = serializers.PrimaryKeyRelatedField(
-        many=True,
-        queryset=Tag.objects.all()
-    )
+    image = StreamingImageField()
+    tags = serializers.ListField(child=serializers.IntegerField())
     cooking_time = serializers.IntegerField(
         min_value=settings.MIN_VALUE_COOKING_TIME,
         max_value=settings.MAX_VALUE_COOKING_TIME
@@ -140,38 +193,104 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             'cooking_time'
         )
 
-    def create_ingredient(self, recipe, ingredients):
+    def save(self, **kwargs):
         try:
-            IngredientRecipe.objects.bulk_create(
-                [IngredientRecipe(
-                    recipe=recipe,
-                    ingredient=Ingredient.objects.get(pk=ingredient['id']),
-                    amount=ingredient['amount']
-                ) for ingredient in ingredients]
-            )
-        except Exception:
-            raise exceptions.ValidationError(
-                {'error': 'ERROR'}
-            )
-
-    def validate(self, attrs):
-        if not attrs.get('ingredients'):
-            raise serializers.ValidationError(
-                'Добавьте ингредиенты!'
-            )
-        if not attrs.get('tags'):
-            raise serializers.ValidationError(
-                'Добавьте тэг!'
-            )
-        ingredients = self.context.get('ingredients', [])
-        list_ingredient = [ing['id'] for ing in ingredients]
-        unique_ingredient = set(list_ingredient)
-        if len(list_ingredient) != len(unique_ingredient):
+            return super().save(**kwargs)
+        finally:
+            image = self.validated_data.get('image')
+            if image is not None:
+                # Временный файл уже перемещён хранилищем.
+                image.close()
+
+    def to_internal_value(self, data):
+        if isinstance(data, QueryDict):
+            data = self.from_form(data)
+        return super().to_internal_value(data)
+
+    def from_form(self, data):
+        """Поля multipart: ingredients - JSON, tags - JSON или список."""
+        result = data.dict()
+        tags = data.getlist('tags')
+        if len(tags) == 1 and tags[0].lstrip().startswith('['):
+            result['tags'] = tags[0]
+        elif tags:
+            result['tags'] = tags
+        errors = {}
+        for field in ('ingredients', 'tags'):
+            if isinstance(result.get(field), str):
+                try:
+                    result[field] = json.loads(result[field])
+                except ValueError:
+                    errors[field] = ['Ожидается JSON-список.']
+        if errors:
+            raise serializers.ValidationError(errors)
+        return result
+
+    def validate_ingredients(self, value):
+        """Все ингредиенты одним запросом, ошибки - по каждому id."""
+        ids = [item['id'] for item in value]
+        if len(ids) != len(set(ids)):
             raise serializers.ValidationError(
                 'Ингредиенты не уникальны!'
             )
+        found = Ingredient.objects.in_bulk(ids)
+        errors = [
+            {} if item['id'] in found
+            else {'id': [f'Ингредиента с id={item["id"]} не существует.']}
+            for item in value
+        ]
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        for item in value:
+            item['ingredient'] = found[item['id']]
+        return value
+
+    def validate_tags(self, value):
+        if len(value) != len(set(value)):
+            raise serializers.ValidationError('Теги не уникальны!')
+        found = Tag.objects.in_bulk(value)
+        errors = [
+            f'Тега с id={pk} не существует.'
+            for pk in value if pk not in found
+        ]
+        if errors:
+            raise serializers.ValidationError(errors)
+        return [found[pk] for pk in value]
+
+    def create_ingredient(self, recipe, ingredients):
+        IngredientRecipe.objects.bulk_create(
+            [IngredientRecipe(
+                recipe=recipe,
+                ingredient=ingredient['ingredient'],
+                amount=ingredient['amount']
+            ) for ingredient in ingredients]
+        )
+        recipes_changed(recipe_ids=(recipe.pk,))
+        recipe_ingredients_changed((recipe.pk,))
+        similar_changed((recipe.pk,))
+
+    def create_tags(self, recipe, tags):
+        if not tags:
+            return
+        TagRecipe = Recipe.tags.through
+        TagRecipe.objects.bulk_create(
+            [TagRecipe(recipe=recipe, tag=tag) for tag in tags]
+        )
+
+    def validate(self, attrs):
+        if 'ingredients' in attrs or not self.partial:
+            if not attrs.get('ingredients'):
+                raise serializers.ValidationError(
+                    'Добавьте ингредиенты!'
+                )
+        if 'tags' in attrs or not self.partial:
+            if not attrs.get('tags'):
+                raise serializers.ValidationError(
+                    'Добавьте тэг!'
+                )
         return attrs
 
+    @transaction.atomic
     def create(self, validated_data):
         author = self.context.get('request').user
         tags = validated_data.pop('tags')
@@ -180,15 +299,75 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             author=author,
             **validated_data
         )
-        recipe.tags.set(tags)
+        self.create_tags(recipe, tags)
         self.create_ingredient(recipe, ingredients)
+        schedule_image_processing(recipe)
         return recipe
 
+    def update_ingredients(self, recipe, ingredients):
+        """Изменение только отличающихся ингредиентов рецепта."""
+        current = {
+            row.ingredient_id: row for row in IngredientRecipe.objects.filter(
+                recipe=recipe
+            ).only('id', 'ingredient_id', 'amount').order_by()
+        }
+        new = {item['id']: item for item in ingredients}
+        removed = current.keys() - new.keys()
+        if removed:
+            IngredientRecipe.objects.filter(
+                recipe=recipe,
+                ingredient_id__in=removed
+            ).delete()
+        changed = []
+        for pk, item in new.items():
+            row = current.get(pk)
+            if row is not None and row.amount != item['amount']:
+                row.amount = item['amount']
+                changed.append(row)
+        if changed:
+            IngredientRecipe.objects.bulk_update(changed, ['amount'])
+        added = [item for pk, item in new.items() if pk not in current]
+        if added:
+            self.create_ingredient(recipe, added)
+        if (changed or added) and not removed:
+            # bulk-операции не отправляют сигналы, удаление - отправляет.
+            carts_changed(recipe_ids=(recipe.pk,))
+
+    def update_tags(self, recipe, tags):
+        TagRecipe = Recipe.tags.through
+        current = set(
+            TagRecipe.objects.filter(
+                recipe=recipe
+            ).values_list('tag_id', flat=True)
+        )
+        new = {tag.pk: tag for tag in tags}
+        removed = current - new.keys()
+        if removed:
+            TagRecipe.objects.filter(
+                recipe=recipe,
+                tag_id__in=removed
+            ).delete()
+        self.create_tags(
+            recipe,
+            [tag for pk, tag in new.items() if pk not in current]
+        )
+
+    @transaction.atomic
     def update(self, instance, validated_data):
-        ingredients = validated_data.pop('ingredients', [])
-        old_recipe = instance.ingredient_list.all()
-        old_recipe.delete()
-        self.create_ingredient(instance, ingredients)
+        ingredients = validated_data.pop('ingredients', None)
+        tags = validated_data.pop('tags', None)
+        if ingredients is not None:
+            self.update_ingredients(instance, ingredients)
+        if tags is not None:
+            self.update_tags(instance, tags)
+        if 'image' in validated_data:
+            release_image(instance.image.name, instance.image_variants)
+            validated_data.update(
+                image_width=None,
+                image_height=None,
+                image_variants={}
+            )
+            schedule_image_processing(instance)
         return super().update(instance, validated_data)
 
     def to_representation(self, instance):
@@ -198,17 +377,16 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         ).data
 
 
-class WriteRecipeSerializer(serializers.ModelSerializer):
-    """Чтение рецепта."""
-    author = UsersSerializer(read_only=True)
+class RecipeFragmentSerializer(serializers.ModelSerializer):
+    """Часть рецепта, одинаковая для всех пользователей."""
+    author = AuthorSerializer(read_only=True)
     tags = TagSerializer(many=True, read_only=True)
     ingredients = IngredientRecipeSerializer(
         many=True,
         read_only=True,
         source='ingredient_list'
     )
-    is_favorited = serializers.SerializerMethodField()
-    is_in_shopping_cart = serializers.SerializerMethodField()
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
@@ -217,27 +395,89 @@ class WriteRecipeSerializer(serializers.ModelSerializer):
             'author',
             'name',
             'image',
+            'image_width',
+            'image_height',
+            'image_variants',
             'text',
             'ingredients',
             'tags',
-            'cooking_time',
+            'cooking_time'
+        )
+
+    def get_image_variants(self, obj):
+        return variant_names_to_urls(obj.image_variants)
+
+    @classmethod
+    def build(cls, recipes):
+        prefetch_related_objects(
+            recipes,
+            'author',
+            'tags',
+            Prefetch(
+                'ingredient_list',
+                queryset=IngredientRecipe.objects.select_related('ingredient')
+            )
+        )
+        return {
+            data['id']: data for data in cls(recipes, many=True).data
+        }
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    """Список рецептов из кэша частей одним запросом к кэшу."""
+
+    def to_representation(self, data):
+        recipes = data.all() if isinstance(data, Manager) else data
+        return self.child.represent(list(recipes))
+
+
+class WriteRecipeSerializer(RecipeFragmentSerializer):
+    """Чтение рецепта."""
+    is_favorited = serializers.SerializerMethodField()
+    is_in_shopping_cart = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Recipe
+        fields = RecipeFragmentSerializer.Meta.fields + (
             'is_favorited',
             'is_in_shopping_cart',
         )
+        list_serializer_class = RecipeListSerializer
+
+    def to_representation(self, instance):
+        return self.represent([instance])[0]
+
+    def represent(self, recipes):
+        """Части рецептов из кэша и признаки текущего пользователя."""
+        fragments = get_fragments(recipes, RecipeFragmentSerializer.build)
+        request = self.context.get('request')
+        viewer = ViewerContext.for_request(request)
+        representations = []
+        for recipe in recipes:
+            data = OrderedDict(fragments[recipe.pk])
+            data['author'] = OrderedDict(
+                data['author'],
+                is_subscribed=viewer.contains('following', recipe.author_id)
+            )
+            if request is not None and data['image']:
+                data['image'] = request.build_absolute_uri(data['image'])
+                data['image_variants'] = variant_urls(
+                    data.get('image_variants', {}), request
+                )
+            data['is_favorited'] = self.get_is_favorited(recipe)
+            data['is_in_shopping_cart'] = self.get_is_in_shopping_cart(recipe)
+            representations.append(data)
+        return representations
 
     def get_is_favorited(self, obj):
-        user = self.context.get('request').user
-        return (
-            user.is_authenticated
-            and obj.recipe.filter(user=user).exists()
-        )
+        return ViewerContext.for_request(
+            self.context.get('request')
+        ).is_favorited(obj)
 
     def get_is_in_shopping_cart(self, obj):
-        user = self.context.get('request').user
-        return (
-            user.is_authenticated
-            and obj.shop_cart.filter(user=user).exists()
-        )
+        return ViewerContext.for_request(
+            self.context.get('request')
+        ).is_in_shopping_cart(obj)
 
 
 class FavoriteSerializer(serializers.ModelSerializer):
@@ -269,6 +509,47 @@ class FavoriteSerializer(serializers.ModelSerializer):
         ).data
 
 
+class ShoppingListSerializer(serializers.Serializer):
+    """Строка списка покупок из api.services.shopping_list."""
+    name = serializers.CharField(source='ingredient__name')
+    measurement_unit = serializers.CharField(
+        source='ingredient__measurement_unit'
+    )
+    amount = serializers.IntegerField(source='total_amount')
+
+
+class ShoppingListExportSerializer(serializers.ModelSerializer):
+    """Сериализация выгрузки списка покупок."""
+    download = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ShoppingListExport
+        fields = (
+            'id',
+            'format',
+            'status',
+            'error',
+            'created',
+            'finished',
+            'download'
+        )
+        read_only_fields = (
+            'status',
+            'error',
+            'created',
+            'finished'
+        )
+
+    def get_download(self, obj):
+        if obj.status != ShoppingListExport.DONE:
+            return None
+        return reverse(
+            'exports-download',
+            args=(obj.pk,),
+            request=self.context.get('request')
+        )
+
+
 class ShoppingCartSerializer(serializers.ModelSerializer):
     """Сериализация корзины."""
 
@@ -0,0 +1,94 @@
+import hashlib
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+HASHED_NAME = re.compile(
+    r'(^|/)([0-9a-f]{2})/([0-9a-f]{2})/\2\3[0-9a-f]{60}\.'
+)
+
+
+def file_hash(content):
+    digest = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return digest.hexdigest()
+
+
+def hashed_name(name, digest):
+    """recipes/x.png -> recipes/ab/cd/abcd...png"""
+    folder = posixpath.dirname(name)
+    extension = os.path.splitext(name)[1].lower()
+    return posixpath.join(
+        folder, digest[:2], digest[2:4], digest + extension
+    )
+
+
+def is_hashed(name):
+    return HASHED_NAME.search(name) is not None
+
+
+def add_references(name, count=1):
+    """Ссылки на файл в ImageBlob.
+
+    UPDATE (или INSERT новой строки) блокирует строку до конца
+    транзакции, поэтому вызывается в транзакции до проверки файла.
+    """
+    from recipes.models import ImageBlob
+
+    blobs = ImageBlob.objects.filter(name=name)
+    if blobs.update(references=F('references') + count):
+        return
+    try:
+        with transaction.atomic():
+            ImageBlob.objects.create(name=name, references=count)
+    except IntegrityError:
+        blobs.update(references=F('references') + count)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Файлы с именем по SHA-256 содержимого в подпапках по его началу.
+
+    Одинаковые файлы хранятся один раз: при повторной загрузке
+    возвращается имя уже сохранённого файла. Каждое сохранение -
+    ссылка в ImageBlob, файл удаляется, когда ссылок не остаётся
+    (см. api.images.release_image).
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = hashed_name(name, file_hash(content))
+        with transaction.atomic(savepoint=False):
+            # Удаление того же файла ждёт блокировку строки.
+            add_references(name)
+            if self.exists(name):
+                return name
+            return super().save(name, content, max_length=max_length)
+
+
+class ExportStorage(FileSystemStorage):
+    """Выгрузки списков покупок в EXPORTS_ROOT, отдаются только через API.
+
+    Папка читается из настроек при каждом обращении, как MEDIA_ROOT.
+    """
+
+    @property
+    def base_location(self):
+        return settings.EXPORTS_ROOT
+
+    @property
+    def location(self):
+        return os.path.abspath(self.base_location)
@@ -0,0 +1,49 @@
+import base64
+import io
+from unittest import mock
+
+from django.test import SimpleTestCase
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+
+from recipes.fields import StreamingImageField
+
+
+class StreamingImageFieldTests(SimpleTestCase):
+    """Декодирование base64 кусками и проверка картинки."""
+
+    def setUp(self):
+        image = io.BytesIO()
+        Image.effect_noise((64, 64), 50).convert('RGB').save(image, 'PNG')
+        self.content = image.getvalue()
+        self.encoded = base64.b64encode(self.content).decode()
+
+    def decode(self, payload):
+        file = StreamingImageField().decode(f'data:image/png;base64,{payload}')
+        self.addCleanup(file.close)
+        return file.read()
+
+    @mock.patch('recipes.fields.CHUNK_SIZE', 1001)
+    def test_mime_line_breaks(self):
+        wrapped = '\r\n'.join(
+            self.encoded[start:start + 76]
+            for start in range(0, len(self.encoded), 76)
+        )
+        self.assertEqual(self.decode(wrapped + '\r\n'), self.content)
+
+    def test_invalid_characters(self):
+        with self.assertRaises(ValidationError):
+            self.decode(self.encoded[:-4] + '*' * 4)
+
+    def test_truncated_jpeg(self):
+        image = io.BytesIO()
+        Image.effect_noise((400, 400), 50).convert('RGB').save(image, 'JPEG')
+        truncated = image.getvalue()[:len(image.getvalue()) // 2]
+        with self.assertRaises(ValidationError) as context:
+            StreamingImageField().to_internal_value(
+                'data:image/jpeg;base64,'
+                + base64.b64encode(truncated).decode()
+            )
+        self.assertEqual(
+            context.exception.detail[0].code, 'invalid_image'
+        )
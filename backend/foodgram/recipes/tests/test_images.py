@@ -0,0 +1,68 @@
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+
+from django.test import SimpleTestCase
+from PIL import Image
+
+from recipes.images import make_variants, strip_metadata
+
+SIZES = {'small': 16, 'medium': 32}
+
+
+class MakeVariantsTests(SimpleTestCase):
+    """Копии без метаданных, оригинал не меняется."""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: повернуть на 90°
+        exif[0x010f] = 'Camera'
+        os.makedirs(os.path.join(self.root, 'recipes'))
+        self.name = 'recipes/photo.jpg'
+        self.path = os.path.join(self.root, self.name)
+        Image.new('RGB', (80, 40), 'red').save(self.path, exif=exif)
+
+    def digest(self):
+        with open(self.path, 'rb') as file:
+            return hashlib.sha256(file.read()).hexdigest()
+
+    def test_original_untouched(self):
+        before = self.digest()
+        result = make_variants(
+            self.root, self.name, SIZES, ('webp', 'jpeg'), 80
+        )
+        self.assertEqual(self.digest(), before)
+        with Image.open(self.path) as original:
+            self.assertEqual(original.getexif()[0x010f], 'Camera')
+        self.assertEqual((result['width'], result['height']), (40, 80))
+        for label, formats in result['variants'].items():
+            for variant in formats.values():
+                with Image.open(os.path.join(self.root, variant)) as image:
+                    self.assertFalse(image.getexif())
+                    self.assertEqual(max(image.size), SIZES[label])
+
+
+class StripMetadataTests(SimpleTestCase):
+    """Оригинал при загрузке: без EXIF, повёрнутый по нему."""
+
+    def test_rotated_without_exif(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        exif[0x010f] = 'Camera'
+        source = io.BytesIO()
+        Image.new('RGB', (80, 40), 'red').save(source, 'JPEG', exif=exif,
+                                               comment=b'secret')
+        source.seek(0)
+        target = io.BytesIO()
+        strip_metadata(source, target, 90)
+        data = target.getvalue()
+        self.assertNotIn(b'Camera', data)
+        self.assertNotIn(b'secret', data)
+        with Image.open(io.BytesIO(data)) as image:
+            self.assertEqual(image.format, 'JPEG')
+            self.assertEqual(image.size, (40, 80))
+            self.assertFalse(image.getexif())
@@ -0,0 +1,65 @@
+import io
+import json
+import tempfile
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase
+
+from recipes.management.commands import load_ingredient
+from recipes.models import Ingredient
+
+ITEMS = [
+    {'name': f'Ингредиент {index}', 'measurement_unit': 'г'}
+    for index in range(50)
+]
+
+
+class ReadJsonTests(SimpleTestCase):
+    """Массив и JSON Lines читаются по элементу."""
+
+    def read(self, text):
+        return list(load_ingredient.read_json(io.StringIO(text)))
+
+    @mock.patch.object(load_ingredient, 'CHUNK_SIZE', 7)
+    def test_array_in_chunks(self):
+        expected = [(item['name'], 'г') for item in ITEMS]
+        self.assertEqual(self.read(json.dumps(ITEMS)), expected)
+        self.assertEqual(
+            self.read(json.dumps(ITEMS, indent=2, ensure_ascii=False)),
+            expected
+        )
+
+    def test_json_lines(self):
+        text = '\n'.join(json.dumps(item) for item in ITEMS[:3]) + '\n\n'
+        self.assertEqual(
+            self.read(text), [(item['name'], 'г') for item in ITEMS[:3]]
+        )
+
+    def test_unfinished_array(self):
+        with self.assertRaises(ValueError):
+            self.read(json.dumps(ITEMS)[:-20])
+
+
+class LoadIngredientTests(TestCase):
+
+    def test_load_json(self):
+        with tempfile.NamedTemporaryFile(
+            'w', suffix='.json', encoding='utf-8'
+        ) as file:
+            json.dump(ITEMS + ITEMS[:5], file)
+            file.flush()
+            call_command('load_ingredient', file.name, stdout=io.StringIO())
+            call_command('load_ingredient', file.name, stdout=io.StringIO())
+        self.assertEqual(Ingredient.objects.count(), len(ITEMS))
+
+    def test_broken_json(self):
+        with tempfile.NamedTemporaryFile(
+            'w', suffix='.json', encoding='utf-8'
+        ) as file:
+            file.write('[{"name": "Соль", ')
+            file.flush()
+            with self.assertRaises(CommandError):
+                call_command(
+                    'load_ingredient', file.name, stdout=io.StringIO()
+                )
@@ -10,7 +10,10 @@ class UserAdmin(admin.ModelAdmin):
         'username',
         'email',
         'first_name',
-        'last_name'
+        'last_name',
+        'recipes_count',
+        'followers_count',
+        'following_count'
     )
     search_fields = (
         'username',
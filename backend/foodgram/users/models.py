@@ -16,6 +16,22 @@ class User(AbstractUser):
         max_length=256,
         unique=True
     )
+    recipes_count = models.PositiveIntegerField(
+        'Рецептов',
+        default=0,
+        editable=False
+    )
+    followers_count = models.PositiveIntegerField(
+        'Подписчиков',
+        default=0,
+        editable=False,
+        db_index=True
+    )
+    following_count = models.PositiveIntegerField(
+        'Подписок',
+        default=0,
+        editable=False
+    )
 
     class Meta:
         ordering = ('id',)
@@ -20,12 +20,22 @@ class CreateUserSerializer(UserCreateSerializer):
 
 
 class SubscribeSerializer(serializers.ModelSerializer):
-    """Список подписок."""
+    """Список подписок.
+
+    count_recipes - счётчик User.recipes_count, рецепты страницы
+    передаются в context['recipes'] (см. api.services.first_recipes),
+    followers - id подписок автора, загруженные prefetch.
+    """
+    followers = serializers.PrimaryKeyRelatedField(
+        many=True,
+        read_only=True
+    )
     recipes = serializers.SerializerMethodField(
         method_name='get_recipes'
     )
-    count_recipes = serializers.SerializerMethodField(
-        method_name='get_count_recipes'
+    count_recipes = serializers.IntegerField(
+        source='recipes_count',
+        read_only=True
     )
 
     class Meta:
@@ -41,16 +51,14 @@ class SubscribeSerializer(serializers.ModelSerializer):
             'count_recipes'
         )
 
-    def get_count_recipes(self, obj):
-        return obj.author.count()
-
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        if request is not None and request.GET.get('recipes_limit'):
-            recipes = obj.author.all()[:int(request.GET.get('recipes_limit'))]
-        else:
-            recipes = obj.author.all()
-        serializer = RecipesSerializer(recipes, many=True, read_only=True)
+        recipes = self.context.get('recipes', {}).get(obj.pk, ())
+        serializer = RecipesSerializer(
+            recipes,
+            many=True,
+            read_only=True,
+            context=self.context
+        )
         return serializer.data
 
     def validate(self, data):
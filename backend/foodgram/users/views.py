@@ -1,12 +1,17 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
 from rest_framework.decorators import action
-from rest_framework.permissions import (IsAuthenticatedOrReadOnly)
+from rest_framework.permissions import (IsAuthenticated,
+                                        IsAuthenticatedOrReadOnly)
 from rest_framework.response import Response
 from rest_framework import status
 
 from .serializers import SubscribeSerializer
 from api.pagination import CustomPagination
+from api.services import first_recipes, recipes_limit
+from api.viewer import ViewerContext
 from .models import User, Subscribe
 
 
@@ -14,8 +19,24 @@ class UserCustomViewSet(UserViewSet):
     queryset = User.objects.all()
     permission_classes = (IsAuthenticatedOrReadOnly,)
     pagination_class = CustomPagination
+    cursor_ordering = ('id',)
     http_method_names = ('get', 'post', 'delete')
 
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        if page is not None:
+            ViewerContext.for_request(self.request).prime(authors=page)
+        return page
+
+    @action(
+        detail=False,
+        methods=('get',),
+        permission_classes=(IsAuthenticated,)
+    )
+    def me(self, request, *args, **kwargs):
+        """Текущий пользователь, анониму - 401 вместо ошибки сериализации."""
+        return super().me(request, *args, **kwargs)
+
     @action(
         detail=True,
         methods=['post', 'delete'],
@@ -26,10 +47,17 @@ class UserCustomViewSet(UserViewSet):
         author = get_object_or_404(User, pk=id)
 
         if self.request.method == 'POST':
-            Subscribe.objects.create(user=user, author=author)
+            try:
+                with transaction.atomic():
+                    Subscribe.objects.create(user=user, author=author)
+            except IntegrityError:
+                return Response(
+                    {'ERROR': 'Вы уже подписаны'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
             return Response(status=status.HTTP_201_CREATED)
         if self.request.method == 'DELETE':
-            sub = author.following_users.first()
+            sub = author.following_users.filter(user=user).first()
             if sub is not None:
                 sub.delete()
             return Response(status=status.HTTP_204_NO_CONTENT)
@@ -37,15 +65,28 @@ class UserCustomViewSet(UserViewSet):
     @action(
         detail=False,
         methods=('get',),
-        url_path='subscriptions'
+        url_path='subscriptions',
+        permission_classes=(IsAuthenticated,)
     )
     def subscriptions(self, request):
-        user = self.request.user
-        sub = user.followers.all()
-        queryset = User.objects.filter(pk__in=sub.values('author_id'))
+        """Авторы с числом рецептов и первыми recipes_limit рецептами.
+
+        Страница - четыре запроса при любом числе авторов и рецептов.
+        """
+        queryset = User.objects.filter(following_users__user=request.user)
         pages = self.paginate_queryset(queryset)
+        prefetch_related_objects(pages, Prefetch(
+            'followers', queryset=Subscribe.objects.only('id', 'user_id')
+        ))
         serializer = SubscribeSerializer(
             pages,
-            many=True
+            many=True,
+            context={
+                'request': request,
+                'recipes': first_recipes(
+                    [author.pk for author in pages],
+                    recipes_limit(request)
+                )
+            }
         )
         return self.get_paginated_response(serializer.data)